@@ -0,0 +1,128 @@
+"""
+Compare the aggregation of concept pairs in `cmd_makecldf` with the
+dictionaries of lists formerly used.
+
+    $ python benchmarks/aggregate.py [LEXEMES [LANGUAGES]]
+
+LEXEMES defaults to `raw/lexemes.tsv`, LANGUAGES to `etc/languages.tsv`.
+Concepts are identified by their names in the source.
+"""
+import sys
+import time
+import pathlib
+import tracemalloc
+from collections import defaultdict
+
+from csvw.dsv import reader
+
+from datsemshift.aggregate import PairTable
+from datsemshift.lexemes import read_lexemes, FORWARD, BACKWARD, UNDIRECTED
+
+
+def aggregate_dicts(rows, lang2fam):
+    """
+    The original aggregation in `cmd_makecldf`.
+    """
+    def stats():
+        return {
+            "Polysemy_Lexemes": [],
+            "Derivation_Lexemes": [],
+            "Polysemy_Shifts": [],
+            "Derivation_Shifts": [],
+            "Polysemy_Families": [],
+            "Derivation_Families": [],
+            "Polysemy": 0,
+            "Derivation": 0}
+    targets, links = defaultdict(lambda: defaultdict(stats)), defaultdict(
+        lambda: defaultdict(stats))
+    for row in rows:
+        if row["Type"] not in ["Polysemy", "Derivation"]:
+            continue
+        source, target, type_ = row["Source_Concept"], row["Target_Concept"], row["Type"]
+        if row["Direction"] in ["→", "←"]:
+            if row["Direction"] == "←":
+                source, target = target, source
+            pairs, table = [(source, target)], targets
+        elif row["Direction"] in ["?", "-", "—"]:
+            pairs, table = [(target, source), (source, target)], links
+        else:
+            continue
+        for a, b in pairs:
+            table[a][b][type_ + "_Lexemes"] += [row["ID"]]
+            table[a][b][type_] += 1
+            table[a][b][type_ + "_Shifts"] += [row["Shift_ID"]]
+            table[a][b][type_ + "_Families"] += [lang2fam[row["Source_Language"]]]
+
+    def dump(table, concept):
+        return [{
+            "ID": target,
+            "NAME": target,
+            "Polysemy": values["Polysemy"],
+            "Derivation": values["Derivation"],
+            "PolysemyByFamily": len(set(values["Polysemy_Families"])),
+            "DerivationByFamily": len(set(values["Derivation_Families"])),
+            "Polysemy_Lexemes": values["Polysemy_Lexemes"],
+            "Derivation_Lexemes": values["Derivation_Lexemes"],
+            "Polysemy_Shifts": values["Polysemy_Shifts"],
+            "Derivation_Shifts": values["Derivation_Shifts"],
+            "Polysemy_Families": values["Polysemy_Families"],
+            "Derivation_Families": values["Derivation_Families"],
+            } for target, values in table.get(concept, {}).items()]
+    return targets, links, dump
+
+
+def aggregate_pairs(rows, lang2fam):
+    targets = PairTable()
+    links = PairTable(
+            concepts=targets.concepts, families=targets.families,
+            shifts=targets.shifts, lexemes=targets.lexemes)
+    families = {name: targets.families(family) for name, family in lang2fam.items()}
+    for row in rows:
+        source, target = row.source_concept, row.target_concept
+        args = (row.type, row.id, row.shift_id, families[row.source_language])
+        if row.direction == FORWARD:
+            targets.add(source, target, *args)
+        elif row.direction == BACKWARD:
+            targets.add(target, source, *args)
+        elif row.direction == UNDIRECTED:
+            links.add(target, source, *args)
+            links.add(source, target, *args)
+
+    def dump(table, concept):
+        return table.dump(concept, Names())
+    return targets, links, dump
+
+
+class Names(dict):
+    def __missing__(self, key):
+        return key
+
+
+def main(lexemes, languages):
+    rows = list(reader(lexemes, delimiter="\t", dicts=True))
+    lang2fam = {row["Name"]: row["Family"] for row in reader(
+        languages, delimiter="\t", dicts=True)}
+    concepts = sorted({row["Source_Concept"] for row in rows} | {
+        row["Target_Concept"] for row in rows})
+    results = {}
+    tuples = list(read_lexemes(lexemes))
+    for name, func, data in [
+            ("dicts", aggregate_dicts, rows), ("pairs", aggregate_pairs, tuples)]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        targets, links, dump = func(data, lang2fam)
+        build = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        results[name] = [(dump(targets, c), dump(links, c)) for c in concepts]
+        print("{0:6} build {1:7.3f}s, dump {2:7.3f}s, peak memory {3:7.1f} MB".format(
+            name, build, time.perf_counter() - start, peak / 1e6))
+    if results["dicts"] != results["pairs"]:
+        sys.exit("results differ")
+
+
+if __name__ == "__main__":
+    repos = pathlib.Path(__file__).parent.parent
+    main(sys.argv[1] if len(sys.argv) > 1 else repos / "raw" / "lexemes.tsv",
+         sys.argv[2] if len(sys.argv) > 2 else repos / "etc" / "languages.tsv")
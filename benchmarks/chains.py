@@ -0,0 +1,60 @@
+"""
+Compare the search for chains of shifts between concepts of
+`ChainIndex.chains`, pruned by a bidirectional breadth-first search, with the
+enumeration of all chains from the source concepts filtered by target.
+
+    $ python benchmarks/chains.py [METADATA] [--queries N] [--hops K]
+
+METADATA defaults to `cldf/cldf-metadata.json`. Each query asks for the
+chains from the forms of 50 random concepts to the forms of 50 others.
+"""
+import sys
+import time
+import random
+import pathlib
+import argparse
+
+from datsemshift.chains import ChainIndex
+
+
+def unpruned(index, sources, targets, hops):
+    ends = set(index.nodes(targets))
+    for nodes, types in index.chains(sources, hops=hops):
+        if nodes[-1] in ends:
+            yield nodes, types
+
+
+def main(metadata, queries, hops, seed=0):
+    start = time.perf_counter()
+    index = ChainIndex.from_cldf(metadata)
+    print("index of {0} forms and {1} shifts built in {2:.3f}s".format(
+        len(index), len(index.targets), time.perf_counter() - start))
+    rng = random.Random(seed)
+    concepts = sorted(set(index.concepts))
+    pairs = [(rng.sample(concepts, 50), rng.sample(concepts, 50)) for _ in range(queries)]
+    results = {}
+    for name, search in [
+            ("unpruned", lambda s, t: unpruned(index, s, t, hops)),
+            ("bidirectional", lambda s, t: index.chains(s, t, hops=hops))]:
+        start = time.perf_counter()
+        results[name] = [[nodes for nodes, _ in search(s, t)] for s, t in pairs]
+        secs = time.perf_counter() - start
+        print("{0:13} {1:7.3f}s, {2:.2f}ms per query, {3} chains".format(
+            name, secs, secs / queries * 1000, sum(len(r) for r in results[name])))
+    start = time.perf_counter()
+    count = sum(1 for _ in index.chains(hops=hops))
+    print("all chains of up to {0} shifts: {1} in {2:.3f}s".format(
+        hops, count, time.perf_counter() - start))
+    if results["unpruned"] != results["bidirectional"]:
+        sys.exit("results differ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "metadata", nargs="?",
+        default=pathlib.Path(__file__).parent.parent / "cldf" / "cldf-metadata.json")
+    parser.add_argument("--queries", default=100, type=int)
+    parser.add_argument("--hops", default=4, type=int)
+    args = parser.parse_args()
+    main(args.metadata, args.queries, args.hops)
@@ -0,0 +1,56 @@
+"""
+Compare the query of `example/query.sh`, which matches the `Source_Lexemes`
+of all pairs of forms with `LIKE`, with the query of
+`example/query_links.sh`, which joins the link table of the SQLite export.
+
+    $ python benchmarks/database.py [CLDF_METADATA [GLOTTOCODE]]
+
+CLDF_METADATA defaults to `cldf/cldf-metadata.json`, GLOTTOCODE to the one
+used in the queries (German). Both queries are run on the same database,
+exported to a temporary directory.
+"""
+import re
+import sys
+import time
+import pathlib
+import sqlite3
+import tempfile
+
+from datsemshift.database import export
+
+EXAMPLE = pathlib.Path(__file__).parent.parent / "example"
+
+
+def query(script, glottocode):
+    """
+    The SQL of a script running the sqlite3 shell, without the dot commands.
+    """
+    text = (EXAMPLE / script).read_text(encoding="utf-8")
+    sql = text.split("<<EOF", 1)[1].rsplit("EOF", 1)[0]
+    sql = "\n".join(line for line in sql.split("\n") if not line.startswith("."))
+    return re.sub("'stan1295'", "'{0}'".format(glottocode), sql)
+
+
+def main(metadata, glottocode):
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        counts = export(metadata, pathlib.Path(tmp) / "dss.sqlite")
+        print("export {0:9.3f}s, {1}".format(
+            time.perf_counter() - start,
+            ", ".join("{0} {1}".format(n, c) for n, c in counts.items())))
+        db = sqlite3.connect(str(pathlib.Path(tmp) / "dss.sqlite"))
+        results = {}
+        for name, script in [("like", "query.sh"), ("links", "query_links.sh")]:
+            start = time.perf_counter()
+            results[name] = db.execute(query(script, glottocode)).fetchall()
+            print("{0:6} {1:9.3f}s, {2} rows".format(
+                name, time.perf_counter() - start, len(results[name])))
+        db.close()
+    # the order of rows with the same word is not defined
+    if sorted(results["like"], key=repr) != sorted(results["links"], key=repr):
+        sys.exit("results differ")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else EXAMPLE.parent / "cldf" / "cldf-metadata.json",
+         sys.argv[2] if len(sys.argv) > 2 else "stan1295")
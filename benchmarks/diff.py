@@ -0,0 +1,84 @@
+"""
+Compare the diff of two builds of `datsemshift.diff` with a textual
+`git diff` of the same files.
+
+    $ python benchmarks/diff.py [BUILD] [--changes N]
+
+BUILD is a directory with the raw, etc and cldf directories of the dataset
+(e.g. a synthetic corpus of `benchmarks/suite.py`), defaulting to the
+dataset. A copy of the build is modified by inserting, removing and changing
+N realizations each in `raw/lexemes.tsv`, renumbering the IDs of the rows as
+`cmd_download` does, and both builds are compared.
+"""
+import sys
+import csv
+import time
+import random
+import shutil
+import pathlib
+import argparse
+import tempfile
+import subprocess
+
+from datsemshift.diff import Build, diff
+
+
+def modify(path, changes, seed=0):
+    with path.open(encoding="utf-8", newline="") as f:
+        header, *rows = list(csv.reader(f, delimiter="\t"))
+    rng = random.Random(seed)
+    word = header.index("Target_Word")
+    changed = rng.sample(range(len(rows)), changes)
+    for i in changed:
+        rows[i][word] += "x"
+    removed = set(rng.sample([i for i in range(len(rows)) if i not in changed], changes))
+    rows = [row for i, row in enumerate(rows) if i not in removed]
+    for i in sorted(rng.sample(range(len(rows)), changes), reverse=True):
+        # a new realization with a title of its own
+        row = list(rows[i])
+        row[header.index("Realization")] = "Realization {0}".format(1000 + i)
+        rows.insert(i + 1, row)
+    for i, row in enumerate(rows, 1):
+        row[0] = str(i)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        csv.writer(f, delimiter="\t", lineterminator="\n").writerows([header] + rows)
+
+
+def main(build, changes):
+    with tempfile.TemporaryDirectory() as tmp:
+        old, new = pathlib.Path(tmp) / "old", pathlib.Path(tmp) / "new"
+        for directory in (old, new):
+            for name in ("raw", "etc", "cldf"):
+                if (build / name).exists():
+                    shutil.copytree(
+                        build / name, directory / name,
+                        ignore=shutil.ignore_patterns("raw-data", "*.sqlite", "*.pickle"))
+        modify(new / "raw" / "lexemes.tsv", changes)
+
+        start = time.perf_counter()
+        proc = subprocess.run(
+            ["git", "diff", "--no-index", "--numstat", str(old), str(new)],
+            capture_output=True, text=True)
+        secs = time.perf_counter() - start
+        print("git diff  {0:7.3f}s, {1} lines changed in raw/lexemes.tsv".format(secs, sum(
+            int(n) for line in proc.stdout.splitlines() if "lexemes.tsv" in line
+            for n in line.split()[:2])))
+
+        start = time.perf_counter()
+        changelog = diff(Build(old), Build(new))
+        secs = time.perf_counter() - start
+        table = changelog["tables"]["raw/lexemes.tsv"]
+        counts = [len(table[kind]) for kind in ("added", "removed", "changed")]
+        print("diff      {0:7.3f}s, {1} added, {2} removed, {3} changed realizations, "
+              "{4} concepts".format(secs, *counts, len(changelog["concepts"])))
+        if counts != [changes] * 3:
+            sys.exit("unexpected differences")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "build", nargs="?", type=pathlib.Path, default=pathlib.Path(__file__).parent.parent)
+    parser.add_argument("--changes", default=10, type=int)
+    args = parser.parse_args()
+    main(args.build, args.changes)
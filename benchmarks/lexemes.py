@@ -0,0 +1,69 @@
+"""
+Compare reading `raw/lexemes.tsv` as dictionaries, as formerly done in
+`cmd_makecldf`, with streaming the projected columns as tuples.
+
+    $ python benchmarks/lexemes.py [LEXEMES [LANGUAGES]]
+
+LEXEMES defaults to `raw/lexemes.tsv`, LANGUAGES to `etc/languages.tsv`.
+Both readers are followed by the dispatch on type and direction and the
+lookup of the family of the source language.
+"""
+import sys
+import time
+import pathlib
+import tracemalloc
+
+from csvw.dsv import reader
+
+from datsemshift.aggregate import Interner
+from datsemshift.lexemes import read_lexemes, FORWARD, BACKWARD, UNDIRECTED
+
+
+def ingest_dicts(lexemes, lang2fam):
+    counts = [0, 0, 0]
+    for row in list(reader(lexemes, delimiter="\t", dicts=True)):
+        if row["Type"] in ["Polysemy", "Derivation"]:
+            if row["Direction"] == "→":
+                counts[0] += len(lang2fam[row["Source_Language"]])
+            elif row["Direction"] == "←":
+                counts[1] += len(lang2fam[row["Source_Language"]])
+            elif row["Direction"] in ["?", "-", "—"]:
+                counts[2] += len(lang2fam[row["Source_Language"]])
+    return counts
+
+
+def ingest_tuples(lexemes, lang2fam):
+    families = Interner()
+    codes = {name: families(family) for name, family in lang2fam.items()}
+    counts = [0, 0, 0]
+    for row in read_lexemes(lexemes):
+        if row.direction == FORWARD:
+            counts[0] += len(families.values[codes[row.source_language]])
+        elif row.direction == BACKWARD:
+            counts[1] += len(families.values[codes[row.source_language]])
+        elif row.direction == UNDIRECTED:
+            counts[2] += len(families.values[codes[row.source_language]])
+    return counts
+
+
+def main(lexemes, languages):
+    lang2fam = {row["Name"]: row["Family"] for row in reader(
+        languages, delimiter="\t", dicts=True)}
+    results = {}
+    for name, func in [("dicts", ingest_dicts), ("tuples", ingest_tuples)]:
+        start = time.perf_counter()
+        results[name] = func(lexemes, lang2fam)
+        seconds = time.perf_counter() - start
+        tracemalloc.start()
+        func(lexemes, lang2fam)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("{0:6} {1:7.3f}s, peak memory {2:7.1f} MB".format(name, seconds, peak / 1e6))
+    if results["dicts"] != results["tuples"]:
+        sys.exit("results differ")
+
+
+if __name__ == "__main__":
+    repos = pathlib.Path(__file__).parent.parent
+    main(sys.argv[1] if len(sys.argv) > 1 else repos / "raw" / "lexemes.tsv",
+         sys.argv[2] if len(sys.argv) > 2 else repos / "etc" / "languages.tsv")
@@ -0,0 +1,73 @@
+"""
+Compare the memoized normalization of `datsemshift.normalize` with the chain
+of replacements and `html.unescape` formerly used in both commands.
+
+    $ python benchmarks/normalize.py [LEXEMES]
+
+LEXEMES defaults to `raw/lexemes.tsv`. Each cell of the concept, language,
+meaning and word columns is refined and unescaped, as the cells of the TSV
+files in `cmd_download`, and the results are kept, as the forms in
+`cmd_makecldf`. Memory is the size of the values read and kept in the
+results (including the cache) as traced by `tracemalloc`.
+"""
+import sys
+import html
+import time
+import pathlib
+import tracemalloc
+
+from csvw.dsv import reader
+
+from datsemshift.normalize import refine_gloss, unescape
+
+COLUMNS = [
+    "Source_Concept", "Target_Concept", "Source_Language", "Target_Language",
+    "Source_Meaning", "Target_Meaning", "Source_Word", "Target_Word"]
+
+
+def refine_gloss_chain(gloss):
+    """
+    The original `refine_gloss` of `lexibank_datsemshift`.
+    """
+    for s, t in [
+            ("&lt;", ""),
+            ("&gt;", ""),
+            ("&#39;", "'"),
+            ("ZQ", "")
+            ]:
+        gloss = gloss.replace(s, t)
+    return gloss
+
+
+def read(lexemes):
+    # new copies of the values, as read from the pages again and again
+    return [
+        "".join(list(row[column])) for row in reader(lexemes, delimiter="\t", dicts=True)
+        for column in COLUMNS]
+
+
+def main(lexemes):
+    results = {}
+    for name, refine, unescape_ in [
+            ("chain", refine_gloss_chain, html.unescape), ("memoized", refine_gloss, unescape)]:
+        values = read(lexemes)
+        start = time.perf_counter()
+        results[name] = [unescape_(refine(value)) for value in values]
+        secs = time.perf_counter() - start
+        # the values read are kept as far as they are returned as results
+        tracemalloc.start()
+        values = read(lexemes)
+        kept = [unescape_(refine(value)) for value in values]
+        del values
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print("{0:9} {1:7.3f}s, {2:7.1f} MB kept, {3} distinct objects".format(
+            name, secs, size / 1e6, len({id(value) for value in kept})))
+    print("{0} values, {1} distinct".format(len(kept), len(set(kept))))
+    if results["chain"] != results["memoized"]:
+        sys.exit("results differ")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else
+         pathlib.Path(__file__).parent.parent / "raw" / "lexemes.tsv")
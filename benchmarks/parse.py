@@ -0,0 +1,96 @@
+"""
+Compare the single-pass shift-page parser with the regular expressions
+formerly used in `cmd_download`.
+
+    $ python benchmarks/parse.py [DIRECTORY]
+
+DIRECTORY defaults to `raw/raw-data/datsemshift-data`.
+"""
+import re
+import sys
+import time
+import pathlib
+
+from datsemshift.parse import parse_shift_page
+
+
+def parse_shift_page_regex(data, shift_id):
+    """
+    The original parsing code of `cmd_download`, returning a `ShiftPage`-like tuple.
+    """
+    shifts = re.findall(
+            '<table class="realization__table"[^>]*>(.*?)</table>', data, re.DOTALL)
+    shift_header = re.findall('<div class="shift__header">(.*?)</div>', data, re.DOTALL)
+    if not shift_header:
+        return None
+    shift_header = shift_header[0]
+    source, direction, target = re.findall(
+            '<span class="shift__header_item"[^>]*>(.*?)</span>', shift_header, re.DOTALL)
+    realizations = re.findall(
+            '<span class="realization_number">(.*?)</span>', shift_header, re.DOTALL
+            )[0].replace(" realizations", "").replace(" realization", "").strip()
+    out = []
+    for shift in shifts:
+        title_ = re.findall('<th[^>]*>(.*?)</th>', shift, re.DOTALL)[0].strip()
+        if "<span" in title_:
+            status, title = re.findall(
+                    '<span[^>]*>(.*?)</span>.*?Realization (.*?)$', title_, re.DOTALL)[0]
+        else:
+            status, title = "", title_.strip()
+        shift_type = re.findall(
+                '<tr>.*?<td colspan="2">Type</td>.*?<td[^>]*>(.*?)</td>.*?</tr>',
+                shift, re.DOTALL)[0].strip()
+        languages = re.findall(
+                '<tr>.*?<td colspan="2">(Language *[12]*)</td>.*?<td[^>]*>(.*?)</td>.*?</tr>',
+                shift, re.DOTALL)
+        lexemes = re.findall(
+                '<tr>.*?<td colspan="2">(Lexeme *[12]*)</td>.*?<td[^>]*>(.*?)</td>.*?</tr>',
+                shift, re.DOTALL)
+        meanings = re.findall(
+                '<tr>.*?<td[^>]*>(Meaning *[12]*)</td>.*?<td[^>]*>(.*?)</td>.*?<td[^>]*>.*?'
+                '</td>.*?</tr>',
+                shift, re.DOTALL)
+        direction_ = re.findall(
+                '<tr>.*?<td[^>]*>Direction</td>.*?<td[^>]*>(.*?)</td>.*?<td[^>]*>.*?</td>.*?'
+                '</tr>',
+                shift, re.DOTALL)
+        out.append((
+            title.strip(), status.strip(), shift_type,
+            direction_[0] if direction_ else "?", languages, lexemes, meanings))
+    return (shift_id, source.strip(), direction.strip(), target.strip(), realizations, out)
+
+
+def as_tuple(shift):
+    if shift is None:
+        return None
+    return (shift.id, shift.source, shift.direction, shift.target, shift.realizations_count, [
+        (r.title, r.status, r.type, r.direction, r.languages, r.lexemes, r.meanings)
+        for r in shift.realizations])
+
+
+def main(directory):
+    pages = [(p.stem, p.read_text(encoding="utf-8"))
+             for p in sorted(pathlib.Path(directory).glob("shift*.html"))]
+    if not pages:
+        sys.exit("no shift pages in {0}".format(directory))
+    timings = {}
+    results = {}
+    for name, func in [("regex", parse_shift_page_regex), ("single-pass", parse_shift_page)]:
+        start = time.perf_counter()
+        results[name] = [func(data, shift_id) for shift_id, data in pages]
+        timings[name] = time.perf_counter() - start
+    mismatches = [
+            shift_id for (shift_id, _), a, b in zip(
+                pages, results["regex"], results["single-pass"]) if a != as_tuple(b)]
+    print("{0} pages, {1} MB".format(
+        len(pages), round(sum(len(data) for _, data in pages) / 1e6, 1)))
+    for name, secs in timings.items():
+        print("{0:12} {1:8.3f}s {2:8.1f}µs/page".format(name, secs, 1e6 * secs / len(pages)))
+    print("speedup      {0:8.1f}x".format(timings["regex"] / timings["single-pass"]))
+    if mismatches:
+        sys.exit("results differ for {0}".format(", ".join(mismatches[:10])))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else
+         pathlib.Path(__file__).parent.parent / "raw" / "raw-data" / "datsemshift-data")
@@ -0,0 +1,117 @@
+"""
+Load test of the query service of `datsemshift.service`.
+
+    $ python benchmarks/service.py [METADATA] [--requests N] [--clients N]
+
+METADATA defaults to `cldf/cldf-metadata.json`. The service is started in
+this process on a free port and queried by concurrent clients over kept-alive
+connections. The queries are drawn from the concepts, languages, families and
+forms of the data, the frequent ones (the first of the data, as in the
+synthetic corpora) more often, with Zipf-like weights. The same queries are
+sent twice, with an empty cache and again with the cache filled, and the
+throughput, latency percentiles and hits of the cache are reported. All
+responses must be successful, and the same in both rounds.
+"""
+import sys
+import time
+import random
+import asyncio
+import pathlib
+import argparse
+import urllib.parse
+
+from datsemshift.service import Index, Service
+
+
+def queries(index, n, seed=0):
+    rng = random.Random(seed)
+
+    def zipf(items):
+        items = list(items)
+        return items, [1 / rank for rank in range(1, len(items) + 1)]
+
+    concepts = zipf(index.concepts)
+    languages = zipf(index.languages)
+    families = zipf(index.families)
+    forms = zipf(form for form in index.forms if index.sources[form] or index.derived[form])
+    kinds = [
+        (concepts, "/concepts/{0}/shifts?k=10"),
+        (concepts, "/concepts/{0}/shifts?kind=directed&weight=Polysemy"),
+        (languages, "/languages/{0}/shifts"),
+        (families, "/families/{0}/shifts"),
+        (forms, "/forms/{0}/chain?depth=3"),
+        (forms, "/forms/{0}/chain?direction=derived&depth=2"),
+    ]
+    out = []
+    for _ in range(n):
+        (items, weights), template = rng.choice(kinds)
+        out.append(template.format(urllib.parse.quote(rng.choices(items, weights)[0])))
+    return out
+
+
+async def client(port, targets, latencies, responses):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for target in targets:
+        start = time.perf_counter()
+        writer.write("GET {0} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n".format(target).encode("utf-8"))
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            header = await reader.readline()
+            if header == b"\r\n":
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        body = await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+        responses[target] = (status, body)
+    writer.close()
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def main(metadata, requests, clients, cache_size):
+    start = time.perf_counter()
+    service = Service(Index(metadata), cache_size=cache_size)
+    print("index of {0} forms built in {1:.3f}s".format(
+        len(service.index.forms), time.perf_counter() - start))
+    server = await service.start(port=0)
+    port = server.sockets[0].getsockname()[1]
+    targets = queries(service.index, requests)
+    results = []
+    for name in ["cold", "warm"]:
+        latencies, responses = [], {}
+        hits = service.cache.hits
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            client(port, targets[i::clients], latencies, responses) for i in range(clients)])
+        secs = time.perf_counter() - start
+        latencies.sort()
+        print("{0}: {1} requests in {2:.3f}s, {3:.0f} requests/s, "
+              "p50 {4:.2f}ms, p95 {5:.2f}ms, p99 {6:.2f}ms, {7} cache hits".format(
+                  name, len(latencies), secs, len(latencies) / secs,
+                  *[percentile(latencies, p) * 1000 for p in (50, 95, 99)],
+                  service.cache.hits - hits))
+        results.append(responses)
+    server.close()
+    await server.wait_closed()
+    if any(status != 200 for status, _ in results[0].values()):
+        sys.exit("failed requests")
+    if results[0] != results[1]:
+        sys.exit("results differ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "metadata", nargs="?",
+        default=pathlib.Path(__file__).parent.parent / "cldf" / "cldf-metadata.json")
+    parser.add_argument("--requests", default=10000, type=int)
+    parser.add_argument("--clients", default=16, type=int)
+    parser.add_argument("--cache-size", default=4096, type=int)
+    args = parser.parse_args()
+    asyncio.run(main(args.metadata, args.requests, args.clients, args.cache_size))
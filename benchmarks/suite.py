@@ -0,0 +1,221 @@
+"""
+Time the phases of `cmd_download` and `cmd_makecldf` on synthetic corpora of
+the size of the real database multiplied by the given scales.
+
+    $ python benchmarks/suite.py [--scale 1 10 100] [--dir DIRECTORY] [--repeat N]
+                                 [--memory] [--output FILE] [--baseline FILE]
+
+Corpora are generated with `datsemshift.synthetic` into DIRECTORY/scale-N
+(default `benchmarks/corpora`) and kept for later runs. Each phase is run
+`--repeat` times and the fastest run is reported, with the peak of memory
+allocated by Python if `--memory` is given (which slows everything down).
+The timings can be written to a JSON file with `--output`, and compared to
+those of an earlier run with `--baseline`: phases which are slower by more
+than `--tolerance` are reported as regressions and the script fails.
+"""
+import sys
+import json
+import time
+import shutil
+import logging
+import pathlib
+import argparse
+import contextlib
+import tracemalloc
+import types
+
+from csvw.dsv import reader
+
+from datsemshift.archive import ARCHIVE, ArchiveStore
+from datsemshift.parse import parse_files, parse_language_file, parse_concept_file
+from datsemshift.parse import parse_shift_files
+from datsemshift.aggregate import PairTable
+from datsemshift.lexemes import LexemeGraph, read_lexemes, FORWARD, BACKWARD, UNDIRECTED
+from datsemshift.synthetic import generate
+
+import lexibank_datsemshift
+from lexibank_datsemshift import Dataset, shift_rows
+
+
+class Timings:
+    """
+    Fastest time and peak memory of each phase.
+    """
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.results = {}
+
+    @contextlib.contextmanager
+    def __call__(self, phase):
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        yield
+        secs = time.perf_counter() - start
+        peak = None
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+        if phase not in self.results or secs < self.results[phase][0]:
+            self.results[phase] = (secs, peak)
+
+
+class ConceptList:
+    """
+    Stand-in for the Concepticon list of the dataset, created from the
+    concepts written by `cmd_download`.
+    """
+    def __init__(self, path):
+        self.concepts = {row["NUMBER"]: types.SimpleNamespace(
+            english=row["ENGLISH"], number=row["NUMBER"], concepticon_id="",
+            concepticon_gloss="", attributes={
+                "gloss_in_source": row["GLOSS_IN_SOURCE"], "alias": row["ALIAS"],
+                "domain": row["DOMAIN"], "definition": row["DEFINITION"]})
+            for row in reader(path, delimiter="\t", dicts=True)}
+
+
+def corpus(directory, scale, log):
+    """
+    Return the dataset directory of the corpus of a scale, generating it if needed.
+    """
+    path = directory / "scale-{0}".format(scale)
+    if not path.joinpath("raw", "raw-data", ARCHIVE).exists():
+        path.joinpath("raw", "raw-data").mkdir(parents=True, exist_ok=True)
+        path.joinpath("etc").mkdir(exist_ok=True)
+        path.joinpath("etc", "unify_concepts.tsv").write_text("NUMBER\tLEXEME\n", encoding="utf-8")
+        start = time.perf_counter()
+        counts = generate(ArchiveStore(path / "raw" / "raw-data" / ARCHIVE), scale=scale)
+        log.info("generated {0} in {1:.1f}s".format(
+            ", ".join("{0} {1}".format(v, k) for k, v in counts.items()),
+            time.perf_counter() - start))
+    return path
+
+
+def run(path, timings, log):
+    ds = type("SyntheticDataset", (Dataset,), {"dir": path})()
+    args = types.SimpleNamespace(log=log)
+    store = ArchiveStore(ds.raw_dir / "raw-data" / ARCHIVE)
+    names = store.names("datsemshift-data/shift*.html")
+
+    # cmd_download
+    with timings("parse-overview"):
+        languages = list(parse_language_file(store, "languages.html"))
+        concepts = [row for rows in parse_files(
+            parse_concept_file, store, store.names("datsemshift-concepts/*.html"))
+            for row in rows]
+    with timings("parse-shifts"):
+        shifts = list(parse_shift_files(store, names))
+    with timings("parse-shifts-parallel"):
+        list(parse_shift_files(store, names, workers=lexibank_datsemshift.PARSE_WORKERS))
+    with timings("assemble"):
+        for _ in shift_rows(
+                shifts,
+                {gloss.strip(): i for i, (gloss, _, _, _) in enumerate(concepts, start=1)},
+                {language[1]: language[0] for language in languages},
+                len(concepts) + 1,
+                len(languages) + 1):
+            pass
+    del shifts
+    ds.raw_dir.joinpath("raw-data", "parsed.sqlite").unlink(missing_ok=True)
+    with timings("download"):
+        ds.cmd_download(args)
+    with timings("download-cached"):
+        ds.cmd_download(args)
+
+    # cmd_makecldf
+    with timings("read-lexemes"):
+        rows = list(read_lexemes(ds.raw_dir / "lexemes.tsv"))
+    with timings("aggregate"):
+        targets = PairTable()
+        links = PairTable(
+                concepts=targets.concepts, families=targets.families,
+                shifts=targets.shifts, lexemes=targets.lexemes)
+        families = {
+            row["Name"]: targets.families(row["Family"]) for row in reader(
+                ds.etc_dir / "languages.tsv", delimiter="\t", dicts=True)}
+        for row in rows:
+            source, target = row.source_concept, row.target_concept
+            data = (row.type, row.id, row.shift_id, families[row.source_language])
+            if row.direction == FORWARD:
+                targets.add(source, target, *data)
+            elif row.direction == BACKWARD:
+                targets.add(target, source, *data)
+            elif row.direction == UNDIRECTED:
+                links.add(target, source, *data)
+                links.add(source, target, *data)
+        for concept in {row.source_concept for row in rows}:
+            list(targets.rows(concept))
+            list(links.rows(concept, directed=False))
+    with timings("lexeme-graph"):
+        lexemes = LexemeGraph()
+        for row in rows:
+            lexemes.add_row(row, row.source_concept, row.target_concept)
+        lexemes.freeze()
+        list(lexemes.forms())
+    del rows, targets, links, lexemes
+
+    ds.conceptlists = [ConceptList(ds.etc_dir / "concepts.tsv")]
+    ds.concepticon = types.SimpleNamespace(cached_glosses={})
+    shutil.rmtree(ds.cldf_dir, ignore_errors=True)
+    writer = ds.cldf_specs().get_writer(args=args, dataset=ds)
+    args.writer = writer.__enter__()
+    with timings("makecldf"):
+        ds.cmd_makecldf(args)
+    # the tables are written when the writer is closed
+    with timings("write-cldf"):
+        writer.__exit__(None, None, None)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return the phases which are slower than in the baseline.
+    """
+    regressions = []
+    for scale, phases in results.items():
+        for phase, (secs, _) in phases.items():
+            before = baseline.get(scale, {}).get(phase)
+            if before and secs > before[0] * (1 + tolerance):
+                regressions.append((scale, phase, before[0], secs))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--scale", nargs="+", type=float, default=[1])
+    parser.add_argument(
+        "--dir", type=pathlib.Path, default=pathlib.Path(__file__).parent / "corpora")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--memory", action="store_true")
+    parser.add_argument("--output", type=pathlib.Path)
+    parser.add_argument("--baseline", type=pathlib.Path)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    log = logging.getLogger("suite")
+
+    results = {}
+    for scale in args.scale:
+        scale = int(scale) if scale == int(scale) else scale
+        path = corpus(args.dir, scale, log)
+        timings = Timings(memory=args.memory)
+        for _ in range(args.repeat):
+            run(path, timings, log)
+        results["scale-{0}".format(scale)] = timings.results
+        print("scale {0}".format(scale))
+        for phase, (secs, peak) in timings.results.items():
+            print("  {0:22} {1:9.3f}s{2}".format(
+                phase, secs, "" if peak is None else " {0:9.1f} MB".format(peak)))
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.baseline:
+        regressions = compare(
+            results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        for scale, phase, before, after in regressions:
+            print("{0} {1}: {2:.3f}s -> {3:.3f}s".format(scale, phase, before, after))
+        if regressions:
+            sys.exit("{0} phases slower than the baseline".format(len(regressions)))
+
+
+if __name__ == "__main__":
+    main()
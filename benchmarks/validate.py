@@ -0,0 +1,84 @@
+"""
+Compare the validation of the CLDF data of `datsemshift.validate`, with the
+tables checked in parallel, with `pycldf.Dataset.validate`.
+
+    $ python benchmarks/validate.py [METADATA] [--workers N] [--errors N]
+
+METADATA defaults to `cldf/cldf-metadata.json`. The data is copied and N
+errors of each kind are put into the copy (invalid values, dangling foreign
+keys and duplicate IDs of forms), and the messages of both validations are
+compared. Dangling foreign keys are reported by `datsemshift.validate` with
+the column, and are compared by file, line and key.
+"""
+import os
+import re
+import sys
+import time
+import random
+import shutil
+import logging
+import pathlib
+import argparse
+import tempfile
+
+from csvw.dsv import UnicodeReader, UnicodeWriter
+from pycldf import Dataset
+
+from datsemshift.validate import validate
+
+
+class Messages(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.messages = set()
+
+    def emit(self, record):
+        self.messages.add(re.sub(
+            r"^(.*/)?([^/]+:\d+)(:\w+)? (Key .*)$", r"\2 \4", record.getMessage()))
+
+
+def corrupt(path, errors, seed=0):
+    with UnicodeReader(path) as reader:
+        header, *rows = list(reader)
+    rng = random.Random(seed)
+    sample = iter(rng.sample(range(len(rows)), 3 * errors))
+    for column, value in [("Loan", "maybe"), ("Language_ID", "nolanguage"), ("ID", None)]:
+        for _ in range(errors):
+            i = next(sample)
+            rows[i][header.index(column)] = value or rows[i - 1][header.index(column)]
+    with UnicodeWriter(path) as writer:
+        writer.writerows([header] + rows)
+
+
+def main(metadata, workers, errors):
+    metadata = pathlib.Path(metadata)
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(str(metadata.parent), tmp, dirs_exist_ok=True)
+        metadata = pathlib.Path(tmp) / metadata.name
+        corrupt(pathlib.Path(tmp) / "forms.csv", errors)
+        results = {}
+        for name, func in [
+                ("pycldf", lambda log: Dataset.from_metadata(metadata).validate(log=log)),
+                ("parallel", lambda log: validate(metadata, log=log, workers=workers))]:
+            log, handler = logging.getLogger(name), Messages()
+            log.propagate = False
+            log.addHandler(handler)
+            start = time.perf_counter()
+            func(log)
+            print("{0:8} {1:7.3f}s, {2} errors".format(
+                name, time.perf_counter() - start, len(handler.messages)))
+            # pycldf>=2 adds a summary of the failed check of the foreign keys
+            results[name] = handler.messages - {"Referential integrity check failed"}
+    if results["pycldf"] != results["parallel"]:
+        sys.exit("results differ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "metadata", nargs="?",
+        default=pathlib.Path(__file__).parent.parent / "cldf" / "cldf-metadata.json")
+    parser.add_argument("--workers", default=os.cpu_count() or 1, type=int)
+    parser.add_argument("--errors", default=10, type=int)
+    args = parser.parse_args()
+    main(args.metadata, args.workers, args.errors)
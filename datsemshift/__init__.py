@@ -0,0 +1,3 @@
+"""
+Helpers for building and querying the CLDF version of the Database of Semantic Shifts.
+"""
@@ -0,0 +1,240 @@
+"""
+Aggregation of semantic shifts by concept pair.
+
+`cmd_makecldf` counts for each pair of concepts how often a shift of type
+Polysemy or Derivation was realized, in how many language families, and by
+which lexemes and shifts. Instead of one dictionary of lists per pair, the
+`PairTable` codes concepts, families, shifts and lexemes as integers, keeps
+the counters in arrays, the families of a pair as a bitset, and all
+realizations in one event log in which the events of a pair are chained.
+Pairs are only created when they occur in the data.
+
+The statistics are written to the table `concept_pairs.csv` of the CLDF
+dataset, with one row per directed or undirected pair, and optionally as
+JSON to the `Target_Concepts` and `Linked_Concepts` columns of the concepts.
+`read_pairs` reads them back from either.
+"""
+import csv
+import json
+from array import array
+
+TYPES = ("Polysemy", "Derivation")
+WEIGHTS = ("Polysemy", "Derivation", "PolysemyByFamily", "DerivationByFamily")
+# the JSON columns of the concepts with the directed and undirected pairs
+KINDS = {"directed": "Target_Concepts", "undirected": "Linked_Concepts"}
+
+# the table of concept pairs written by `cmd_makecldf`
+PAIR_TABLE = "concept_pairs.csv"
+PAIR_COLUMNS = [
+    {"name": "ID", "propertyUrl": "http://cldf.clld.org/v1.0/terms.rdf#id"},
+    {"name": "Source_ID", "dc:description": "The source concept of the pair."},
+    {"name": "Target_ID", "dc:description": "The target concept of the pair."},
+    {"name": "Directed", "datatype": "boolean",
+     "dc:description": "Whether the pair is counted from directed or undirected shifts."},
+    {"name": "Polysemy", "datatype": "integer"},
+    {"name": "Derivation", "datatype": "integer"},
+    {"name": "PolysemyByFamily", "datatype": "integer"},
+    {"name": "DerivationByFamily", "datatype": "integer"},
+    {"name": "Polysemy_Lexemes", "separator": " ",
+     "dc:description": "The IDs of the lexemes in raw/lexemes.tsv."},
+    {"name": "Derivation_Lexemes", "separator": " "},
+    {"name": "Polysemy_Shifts", "separator": " "},
+    {"name": "Derivation_Shifts", "separator": " "},
+    {"name": "Polysemy_Families", "separator": "; "},
+    {"name": "Derivation_Families", "separator": "; "},
+]
+
+
+def read_pairs(concepts, path=None):
+    """
+    Iterate over the concept pairs of a CLDF dataset, as dictionaries like the
+    rows of the table of concept pairs, with `Directed` as boolean, the
+    `WEIGHTS` as integers and lists for the columns with separator.
+
+    :param concepts: Rows of the ParameterTable as dictionaries, whose JSON \
+    columns (`KINDS`) are read for older versions of the dataset without \
+    table of concept pairs.
+    :param path: Path of the table of concept pairs, or `None`.
+    """
+    if path is None:
+        for row in concepts:
+            for kind, column in KINDS.items():
+                for link in json.loads(row.get(column) or "[]"):
+                    yield dict(
+                        link, Source_ID=row["ID"], Target_ID=link["ID"],
+                        Directed=kind == "directed")
+        return
+    separators = {col["name"]: col["separator"] for col in PAIR_COLUMNS if "separator" in col}
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            row["Directed"] = row["Directed"] == "true"
+            for weight in WEIGHTS:
+                row[weight] = int(row[weight])
+            for name, separator in separators.items():
+                if name in row:
+                    row[name] = row[name].split(separator) if row[name] else []
+            yield row
+
+
+class Interner:
+    """
+    Map hashable values to consecutive integer codes.
+    """
+    __slots__ = ("codes", "values")
+
+    def __init__(self):
+        self.codes, self.values = {}, []
+
+    def __call__(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class PairTable:
+    """
+    Statistics of directed concept pairs.
+
+    Interners can be shared between tables, e.g. for the directed and the
+    undirected links of a dataset.
+    """
+    def __init__(self, concepts=None, families=None, shifts=None, lexemes=None):
+        self.concepts = Interner() if concepts is None else concepts
+        self.families = Interner() if families is None else families
+        self.shifts = Interner() if shifts is None else shifts
+        self.lexemes = Interner() if lexemes is None else lexemes
+        # source code -> {target code: pair}, in the order of first occurrence
+        self.pairs = {}
+        # per pair and type
+        self.counts = array("I")
+        self.family_sets = []
+        # per pair, the first and the last event
+        self.first, self.last = array("l"), array("l")
+        # the event log
+        self.event_type = array("B")
+        self.event_lexeme = array("I")
+        self.event_shift = array("I")
+        self.event_family = array("I")
+        self.event_next = array("l")
+
+    def __len__(self):
+        return len(self.first)
+
+    def pair(self, source, target):
+        """
+        Return the index of the pair of two concept IDs, creating it if needed.
+        """
+        source, target = self.concepts(source), self.concepts(target)
+        targets = self.pairs.get(source)
+        if targets is None:
+            targets = self.pairs[source] = {}
+        idx = targets.get(target)
+        if idx is None:
+            idx = targets[target] = len(self.first)
+            self.counts.extend((0, 0))
+            self.family_sets.extend((0, 0))
+            self.first.append(-1)
+            self.last.append(-1)
+        return idx
+
+    def add(self, source, target, type_, lexeme, shift, family):
+        """
+        Add one realization of a shift between two concept IDs, `type_` being
+        the index in `TYPES` and `family` a code of the `families` interner.
+        """
+        idx, t = self.pair(source, target), type_
+        self.counts[2 * idx + t] += 1
+        self.family_sets[2 * idx + t] |= 1 << family
+
+        event = len(self.event_type)
+        self.event_type.append(t)
+        self.event_lexeme.append(self.lexemes(lexeme))
+        self.event_shift.append(self.shifts(shift))
+        self.event_family.append(family)
+        self.event_next.append(-1)
+        if self.first[idx] == -1:
+            self.first[idx] = event
+        else:
+            self.event_next[self.last[idx]] = event
+        self.last[idx] = event
+
+    def targets(self, source):
+        """
+        Iterate over the concept IDs linked to `source` and the pair indices.
+        """
+        code = self.concepts.codes.get(source)
+        for target, idx in self.pairs.get(code, {}).items():
+            yield self.concepts.values[target], idx
+
+    def events(self, idx):
+        """
+        Return the lexemes, shifts and families of the realizations of a pair,
+        as one list per type in `TYPES` each.
+        """
+        lexemes, shifts, families = ([], []), ([], []), ([], [])
+        types, nxt = self.event_type, self.event_next
+        lexeme_values, shift_values, family_values = (
+                self.lexemes.values, self.shifts.values, self.families.values)
+        event = self.first[idx]
+        while event != -1:
+            t = types[event]
+            lexemes[t].append(lexeme_values[self.event_lexeme[event]])
+            shifts[t].append(shift_values[self.event_shift[event]])
+            families[t].append(family_values[self.event_family[event]])
+            event = nxt[event]
+        return lexemes, shifts, families
+
+    def weights(self, idx):
+        """
+        Return the counts of a pair by type and by family and type.
+        """
+        return {
+            "Polysemy": self.counts[2 * idx],
+            "Derivation": self.counts[2 * idx + 1],
+            "PolysemyByFamily": self.family_sets[2 * idx].bit_count(),
+            "DerivationByFamily": self.family_sets[2 * idx + 1].bit_count(),
+        }
+
+    def statistics(self, idx):
+        """
+        Return the statistics of a pair as dictionary, with the keys used in
+        the `Target_Concepts` and `Linked_Concepts` columns and the
+        `PAIR_COLUMNS`.
+        """
+        lexemes, shifts, families = self.events(idx)
+        return dict(self.weights(idx), **{
+            "Polysemy_Lexemes": lexemes[0],
+            "Derivation_Lexemes": lexemes[1],
+            "Polysemy_Shifts": shifts[0],
+            "Derivation_Shifts": shifts[1],
+            "Polysemy_Families": families[0],
+            "Derivation_Families": families[1],
+        })
+
+    def dump(self, source, names):
+        """
+        Return the statistics of all pairs of a concept as list of dictionaries,
+        as stored in the `Target_Concepts` and `Linked_Concepts` columns.
+        """
+        return [dict({"ID": target, "NAME": names[target]}, **self.statistics(idx))
+                for target, idx in self.targets(source)]
+
+    def rows(self, source, directed=True, events=True):
+        """
+        Yield the rows of the table of concept pairs for all pairs of a concept,
+        only with the counts (see `weights`) unless `events` is set.
+        """
+        kind = "directed" if directed else "undirected"
+        statistics = self.statistics if events else self.weights
+        for target, idx in self.targets(source):
+            yield dict({
+                "ID": "{0}-{1}-{2}".format(source, target, kind),
+                "Source_ID": source,
+                "Target_ID": target,
+                "Directed": directed,
+            }, **statistics(idx))
@@ -0,0 +1,169 @@
+"""
+Storage backends for the raw pages.
+
+Pages are addressed by their name relative to `raw/raw-data`, e.g.
+`datsemshift-data/shift0001.html`. The `DirectoryStore` keeps each page in a
+file of its own, the `ArchiveStore` keeps all pages as compressed blobs in one
+SQLite file `raw/raw-data/pages.sqlite`, which allows random access by name and
+streaming iteration without creating thousands of small files.
+"""
+import zlib
+import fnmatch
+import pathlib
+import sqlite3
+import threading
+
+from datsemshift.fetch import write_atomic
+
+ARCHIVE = "pages.sqlite"
+
+# the pages downloaded from the DatSemShift website
+PAGES = ["*.html", "datsemshift-concepts/*.html", "datsemshift-data/*.html"]
+
+
+class DirectoryStore:
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+
+    def __repr__(self):
+        return "<DirectoryStore {0}>".format(self.root)
+
+    def read(self, name):
+        return self.root.joinpath(name).read_bytes()
+
+    def write(self, name, content, commit=True):
+        write_atomic(self.root / name, content)
+
+    def commit(self):
+        pass
+
+    def exists(self, name):
+        return self.root.joinpath(name).exists()
+
+    def names(self, pattern):
+        return sorted(p.relative_to(self.root).as_posix() for p in self.root.glob(pattern)
+                      if p.is_file())
+
+    def items(self, pattern):
+        for name in self.names(pattern):
+            yield name, self.read(name)
+
+    def remove(self, name):
+        self.root.joinpath(name).unlink()
+
+
+class ArchiveStore:
+    """
+    Pages stored as zlib-compressed blobs in a SQLite table.
+
+    The store can be shared between threads and pickled, workers in other
+    processes open their own connection.
+    """
+    def __init__(self, path, level=6):
+        self.path = pathlib.Path(path)
+        self.level = level
+        self._db = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<ArchiveStore {0}>".format(self.path)
+
+    def __getstate__(self):
+        return {"path": self.path, "level": self.level}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], level=state["level"])
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS pages ("
+                    "name TEXT PRIMARY KEY, size INTEGER, content BLOB)")
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def read(self, name):
+        with self._lock:
+            row = self.db.execute(
+                    "SELECT content FROM pages WHERE name = ?", (name,)).fetchone()
+        if not row:
+            raise FileNotFoundError(name)
+        return zlib.decompress(row[0])
+
+    def write(self, name, content, commit=True):
+        with self._lock:
+            self.db.execute(
+                    "INSERT OR REPLACE INTO pages VALUES (?, ?, ?)",
+                    (name, len(content), zlib.compress(content, self.level)))
+            if commit:
+                self.db.commit()
+
+    def commit(self):
+        with self._lock:
+            self.db.commit()
+
+    def exists(self, name):
+        with self._lock:
+            return self.db.execute(
+                    "SELECT 1 FROM pages WHERE name = ?", (name,)).fetchone() is not None
+
+    def names(self, pattern):
+        with self._lock:
+            names = [row[0] for row in self.db.execute(
+                "SELECT name FROM pages ORDER BY name")]
+        return [name for name in names if _match(name, pattern)]
+
+    def items(self, pattern):
+        # stream the pages through a connection of their own
+        with self._lock:
+            self.db
+        db = sqlite3.connect(str(self.path))
+        try:
+            for name, content in db.execute("SELECT name, content FROM pages ORDER BY name"):
+                if _match(name, pattern):
+                    yield name, zlib.decompress(content)
+        finally:
+            db.close()
+
+    def remove(self, name):
+        with self._lock:
+            self.db.execute("DELETE FROM pages WHERE name = ?", (name,))
+            self.db.commit()
+
+
+def _match(name, pattern):
+    # like pathlib's glob, "*" does not match across directories
+    return name.count("/") == pattern.count("/") and fnmatch.fnmatchcase(name, pattern)
+
+
+def open_store(path):
+    """
+    Return the archive in `path` if there is one, otherwise the directory itself.
+    """
+    path = pathlib.Path(path)
+    if path.joinpath(ARCHIVE).exists():
+        return ArchiveStore(path / ARCHIVE)
+    return DirectoryStore(path)
+
+
+def convert(source, target, patterns=PAGES, remove=False):
+    """
+    Copy all pages matching `patterns` from one store to another.
+    """
+    names = []
+    for pattern in patterns:
+        for name, content in source.items(pattern):
+            target.write(name, content, commit=False)
+            names.append(name)
+    target.commit()
+    if remove:
+        for name in names:
+            source.remove(name)
+    return len(names)
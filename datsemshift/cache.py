@@ -0,0 +1,77 @@
+"""
+Persistent cache of parsed pages.
+
+The records returned by the page parsers are stored in a SQLite database,
+together with the SHA256 hash of the page and the version of the parser. When
+the raw data are assembled again, only pages which are new, were modified or
+were parsed by an older parser are parsed, all other records are read from the
+cache. Records are pickled, so the cache is meant to be local to one machine.
+"""
+import pickle
+import pathlib
+import hashlib
+import sqlite3
+
+from datsemshift.parse import PARSER_VERSION, parse_files
+
+
+class ParseCache:
+    def __init__(self, path, version=PARSER_VERSION):
+        self.path = pathlib.Path(path)
+        self.version = version
+        self.hits, self.misses = 0, 0
+        self.db = sqlite3.connect(str(self.path))
+        self.db.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "kind TEXT, name TEXT, sha256 TEXT, version INTEGER, record BLOB, "
+                "PRIMARY KEY (kind, name))")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def get(self, kind, name, digest):
+        row = self.db.execute(
+                "SELECT record FROM pages WHERE kind = ? AND name = ? AND sha256 = ? "
+                "AND version = ?", (kind, name, digest, self.version)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def put(self, kind, name, digest, record):
+        self.db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                (kind, name, digest, self.version,
+                 pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def parse(self, func, store, names, workers=1):
+        """
+        Yield the records of `func` for the pages `names` of `store` in order,
+        parsing only the pages which are not in the cache.
+        """
+        kind, names = func.__name__, list(names)
+        keys, todo = [], []
+        for name in names:
+            digest = hashlib.sha256(store.read(name)).hexdigest()
+            hit = self.db.execute(
+                    "SELECT 1 FROM pages WHERE kind = ? AND name = ? AND sha256 = ? "
+                    "AND version = ?", (kind, name, digest, self.version)).fetchone()
+            keys.append((digest, bool(hit)))
+            if not hit:
+                todo.append(name)
+        self.hits += len(names) - len(todo)
+        self.misses += len(todo)
+        fresh = parse_files(func, store, todo, workers=workers)
+        for name, (digest, hit) in zip(names, keys):
+            if hit:
+                yield self.get(kind, name, digest)
+            else:
+                record = next(fresh)
+                self.put(kind, name, digest, record)
+                yield record
+        fresh.close()
+        self.db.commit()
@@ -0,0 +1,238 @@
+"""
+Chains of semantic shifts between the forms of the CLDF data.
+
+The `Source_Lexemes` of a form in `FormTable` are the forms with shifts to
+it, so that the forms are the nodes of a directed graph, and chains like
+A → B → C are paths in this graph. The `ChainIndex` reads the forms once and
+keeps the edges in compressed sparse row (CSR) arrays as the `LexemeGraph`,
+with the languages and families of the forms coded as integers.
+
+`ChainIndex.chains` enumerates the paths of up to `hops` shifts without
+repeated forms, from forms of the source concepts, to forms of the target
+concepts, or both, with shifts of some types only and forms of some languages
+or families only, or with all forms in the language (or family) of the first.
+With both source and target concepts given, the forms from which a target can
+be reached in few enough shifts are found first with a bidirectional
+breadth-first search, which also stops early if there is no chain at all,
+and the paths are only followed through these forms.
+"""
+import csv
+import collections
+from array import array
+
+from datsemshift.aggregate import TYPES, Interner
+from datsemshift.database import tables
+from datsemshift.lexemes import _group
+
+CHAIN_COLUMNS = [
+    "Hops", "Form_IDs", "Parameter_IDs", "Language_IDs", "Forms", "Relations"]
+
+
+def _read(path):
+    with path.open(encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+class ChainIndex:
+    def __init__(self, ids, concepts, languages, forms, families, edges):
+        """
+        :param edges: Iterable of the `(source, target, type)` of the edges, \
+        with the nodes given by position in `ids` and the index of the type \
+        in `TYPES`. Repeated edges (e.g. of two realizations linking the same \
+        lexemes) are kept once.
+        """
+        self.ids, self.concepts, self.forms = ids, concepts, forms
+        self.by_concept = collections.defaultdict(list)
+        for node, concept in enumerate(concepts):
+            self.by_concept[concept].append(node)
+        self.language_codes, self.family_codes = Interner(), Interner()
+        self.languages = array("l", (self.language_codes(language) for language in languages))
+        self.families = array("l", (
+            self.family_codes(families.get(language, "")) for language in languages))
+        source, target, types = array("l"), array("l"), array("B")
+        seen = set()
+        for edge in edges:
+            if edge in seen:
+                continue
+            seen.add(edge)
+            s, t, type_ = edge
+            source.append(s)
+            target.append(t)
+            types.append(type_)
+        n = len(ids)
+        self.indptr, out = _group(source, n)
+        self.targets = array("l", (target[e] for e in out))
+        self.relations = array("B", (types[e] for e in out))
+        self.in_indptr, in_ = _group(target, n)
+        self.sources = array("l", (source[e] for e in in_))
+        self.in_relations = array("B", (types[e] for e in in_))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_cldf(cls, metadata):
+        paths = {name: path for name, path, _ in tables(metadata)}
+        families = {row["ID"]: row.get("Family") or "" for row in _read(paths["LanguageTable"])}
+        ids, concepts, languages, forms, links, local_ids = [], [], [], [], [], {}
+        for row in _read(paths["FormTable"]):
+            local_ids[row["Local_ID"]] = len(ids)
+            ids.append(row["ID"])
+            concepts.append(row["Parameter_ID"])
+            languages.append(row["Language_ID"])
+            forms.append(row["Form"])
+            links.append((row["Source_Lexemes"], row["Source_Relations"]))
+        return cls(ids, concepts, languages, forms, families, (
+            (local_ids[source], node, TYPES.index(relation))
+            for node, (sources, relations) in enumerate(links)
+            for source, relation in zip(sources.split(), relations.split())
+            if source in local_ids))
+
+    def nodes(self, concepts):
+        return sorted(set().union(*(self.by_concept.get(concept, []) for concept in concepts)))
+
+    def _allowed(self, languages=None, families=None):
+        allowed = bytearray(b"\x01") * len(self)
+        for codes, interner, values in [
+                (self.languages, self.language_codes, languages),
+                (self.families, self.family_codes, families)]:
+            if values is not None:
+                wanted = {interner.codes[value] for value in values if value in interner.codes}
+                for node, code in enumerate(codes):
+                    if code not in wanted:
+                        allowed[node] = 0
+        return allowed
+
+    def _distances(self, starts, ends, hops, allowed, codes):
+        """
+        Bidirectional breadth-first search for shifts from `starts` to `ends`,
+        expanding the smaller frontier first.
+
+        :return: `(depth, distances)`, the number of shifts searched backwards \
+        and the dictionary of the nodes reaching an end in `depth` shifts or \
+        less with their distance, or `None` if no end can be reached in `hops` \
+        shifts.
+        """
+        forward, distances = set(starts), {node: 0 for node in ends}
+        frontiers = [list(forward), list(distances)]
+        depth = [0, 0]
+        while depth[0] + depth[1] < hops and (frontiers[0] or frontiers[1]):
+            side = 0 if frontiers[0] and (
+                not frontiers[1] or len(frontiers[0]) <= len(frontiers[1])) else 1
+            indptr, neighbours, relations = (
+                (self.indptr, self.targets, self.relations) if side == 0 else
+                (self.in_indptr, self.sources, self.in_relations))
+            reached = forward if side == 0 else distances
+            depth[side] += 1
+            following = []
+            for node in frontiers[side]:
+                for e in range(indptr[node], indptr[node + 1]):
+                    other = neighbours[e]
+                    if other in reached or not allowed[other] or (
+                            codes is not None and relations[e] not in codes):
+                        continue
+                    if side == 0:
+                        forward.add(other)
+                    else:
+                        distances[other] = depth[1]
+                    following.append(other)
+            frontiers[side] = following
+        if forward.isdisjoint(distances):
+            return None
+        return depth[1], distances
+
+    def _walk(self, starts, hops, backward, allowed, codes, group, ends=None, remaining=None):
+        """
+        Depth-first enumeration of the paths from `starts`, pruned with the
+        distances `remaining` to `ends` if given.
+        """
+        indptr, neighbours, relations = (
+            (self.in_indptr, self.sources, self.in_relations) if backward else
+            (self.indptr, self.targets, self.relations))
+        depth, distances = remaining or (0, None)
+        path, types, on_path = [], [], set()
+
+        def extend(node, hops_left):
+            for e in range(indptr[node], indptr[node + 1]):
+                other, type_ = neighbours[e], relations[e]
+                if other in on_path or not allowed[other] or (
+                        codes is not None and type_ not in codes) or (
+                        group is not None and group[other] != group[path[0]]):
+                    continue
+                if distances is not None and hops_left - 1 <= depth and \
+                        distances.get(other, hops) > hops_left - 1:
+                    continue
+                path.append(other)
+                types.append(type_)
+                on_path.add(other)
+                if ends is None or other in ends:
+                    yield path, types
+                if hops_left > 1:
+                    yield from extend(other, hops_left - 1)
+                path.pop()
+                types.pop()
+                on_path.discard(other)
+
+        for start in starts:
+            if not allowed[start]:
+                continue
+            path.append(start)
+            on_path.add(start)
+            yield from extend(start, hops)
+            path.pop()
+            on_path.discard(start)
+
+    def chains(self, sources=None, targets=None, hops=3, relations=None,
+               languages=None, families=None, within=None):
+        """
+        Yield the chains of shifts as `(nodes, types)`, the lists of the nodes
+        and of the types of the shifts between them.
+
+        :param sources: Concepts of the first forms, all forms if `None`.
+        :param targets: Concepts of the last forms, all forms if `None`.
+        :param relations: Types of the shifts, all if `None`.
+        :param languages: IDs of the languages of the forms, all if `None`.
+        :param families: Families of the languages of the forms, all if `None`.
+        :param within: "language" or "family", to follow only shifts between \
+        forms in the same language or family.
+        """
+        if within not in (None, "language", "family"):
+            raise ValueError("unknown grouping {0}".format(within))
+        if relations is not None:
+            unknown = set(relations) - set(TYPES)
+            if unknown:
+                raise ValueError("unknown types {0}".format(", ".join(sorted(unknown))))
+            codes = {TYPES.index(relation) for relation in relations}
+        else:
+            codes = None
+        allowed = self._allowed(languages, families)
+        group = {None: None, "language": self.languages, "family": self.families}[within]
+        starts = self.nodes(sources) if sources is not None else None
+        ends = self.nodes(targets) if targets is not None else None
+        if starts is None and ends is not None:
+            # search backwards from the targets
+            for path, types in self._walk(ends, hops, True, allowed, codes, group):
+                yield path[::-1], [TYPES[t] for t in reversed(types)]
+            return
+        remaining = None
+        if ends is not None:
+            remaining = self._distances(starts, ends, hops, allowed, codes)
+            if remaining is None:
+                return
+            ends = set(ends)
+        for path, types in self._walk(
+                range(len(self)) if starts is None else starts, hops, False, allowed, codes,
+                group, ends=ends, remaining=remaining):
+            yield list(path), [TYPES[t] for t in types]
+
+    def row(self, nodes, types):
+        """
+        Return the values of the `CHAIN_COLUMNS` of a chain.
+        """
+        return [
+            len(types),
+            " ".join(self.ids[node] for node in nodes),
+            " ".join(self.concepts[node] for node in nodes),
+            " ".join(self.language_codes.values[self.languages[node]] for node in nodes),
+            " // ".join(self.forms[node] for node in nodes),
+            " ".join(types)]
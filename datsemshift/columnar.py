@@ -0,0 +1,171 @@
+"""
+Export of the CLDF data to columnar Parquet or Arrow IPC files.
+
+Each table of the CLDF dataset is written to one file with typed columns:
+integers and booleans as such, list-valued columns (`Source_Lexemes`,
+`Shifts`, `Shift_Types`, ...) as lists, and the IDs of languages, concepts
+and families, which repeat many times, dictionary encoded. The forms also
+get the `Family` of their language. The table of concept pairs is written
+to `concept_pairs`, for older versions of the dataset it is created from the
+JSON columns `Target_Concepts` and `Linked_Concepts` of the ParameterTable,
+which are not written to `parameters`.
+
+Parquet files can be read with column projection and filters, Arrow files
+can be memory-mapped:
+
+    >>> import pyarrow.parquet as pq
+    >>> pq.read_table("forms.parquet", columns=["Form"], filters=[("Family", "=", "Uralic")])
+
+Requires pyarrow, install with `pip install -e .[columnar]`.
+"""
+import csv
+import pathlib
+
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from datsemshift.aggregate import PAIR_TABLE, KINDS, WEIGHTS, read_pairs
+from datsemshift.database import tables
+
+FORMATS = ("parquet", "arrow")
+# columns with values from a small set of IDs or names
+DICTIONARY = {
+    "Language_ID", "Parameter_ID", "Family", "SubGroup", "Macroarea", "Domain",
+    "Shift_Types", "Source_Relations", "Source_ID", "Target_ID",
+    "Polysemy_Families", "Derivation_Families"}
+# list-valued columns of integers
+INTEGER_LISTS = {"Source_Lexemes"}
+TYPES = {"integer": pa.int32(), "decimal": pa.float64(), "float": pa.float64(),
+         "boolean": pa.bool_()}
+PAIR_LISTS = [
+    "Polysemy_Lexemes", "Derivation_Lexemes", "Polysemy_Shifts", "Derivation_Shifts",
+    "Polysemy_Families", "Derivation_Families"]
+
+FILES = {
+    "FormTable": "forms", "LanguageTable": "languages", "ParameterTable": "parameters",
+    PAIR_TABLE: "concept_pairs"}
+
+
+def _scalar(value, datatype):
+    if value == "":
+        return None
+    if datatype == pa.bool_():
+        return value in ("True", "true", "1")
+    if pa.types.is_integer(datatype):
+        return int(value)
+    if pa.types.is_floating(datatype):
+        return float(value)
+    return value
+
+
+def column(name, values, datatype=pa.string(), listed=False):
+    """
+    Return an Arrow array of `values`, a list of lists if `listed`,
+    dictionary encoded for the names in `DICTIONARY`.
+    """
+    if not listed:
+        array = pa.array(values, type=datatype)
+        return array.dictionary_encode() if name in DICTIONARY else array
+    offsets, flat = [0], []
+    for items in values:
+        flat.extend(items)
+        offsets.append(len(flat))
+    items = column(name, flat, datatype)
+    return pa.ListArray.from_arrays(pa.array(offsets, type=pa.int32()), items)
+
+
+def table(columns, rows, extra=None):
+    """
+    Return an Arrow table of the CSV `rows` (as dictionaries) of a CLDF table,
+    given the column descriptions of the metadata, without the JSON columns.
+    """
+    arrays = {}
+    for spec in columns:
+        name = spec["name"]
+        if name in KINDS.values():
+            continue
+        datatype = spec.get("datatype", "string")
+        if isinstance(datatype, dict):
+            datatype = datatype.get("base", "string")
+        datatype = TYPES.get(datatype, pa.string())
+        separator = spec.get("separator")
+        if name == "Local_ID":
+            datatype = pa.int32()
+        if separator:
+            datatype = pa.int32() if name in INTEGER_LISTS else datatype
+            values = [
+                [_scalar(v, datatype) for v in row[name].split(separator)] if row[name] else []
+                for row in rows]
+        else:
+            values = [_scalar(row[name], datatype) for row in rows]
+        arrays[name] = column(name, values, datatype, listed=bool(separator))
+    for name, values in (extra or {}).items():
+        arrays[name] = column(name, values)
+    return pa.table(arrays)
+
+
+def concept_pairs(rows):
+    """
+    Return an Arrow table of the directed and undirected concept pairs of the
+    ParameterTable `rows`.
+    """
+    names = ["Source_ID", "Target_ID", "Directed"] + list(WEIGHTS) + PAIR_LISTS
+    data = {name: [] for name in names}
+    for pair in read_pairs(rows):
+        for name in names:
+            data[name].append(pair[name])
+    return pa.table({
+        name: column(
+            name, values,
+            pa.bool_() if name == "Directed" else
+            pa.int32() if name in WEIGHTS else pa.string(),
+            listed=name in PAIR_LISTS)
+        for name, values in data.items()})
+
+
+def write(table_, path, format_):
+    if format_ == "parquet":
+        pq.write_table(table_, str(path), compression="zstd")
+    else:
+        # uncompressed, so that the file can be memory-mapped
+        feather.write_feather(table_, str(path), compression="uncompressed")
+
+
+def export(metadata, directory, format_="parquet"):
+    """
+    Write the tables of the CLDF dataset described by `metadata` and the
+    concept pairs to `directory`.
+
+    :return: Dictionary with the number of rows per file.
+    """
+    if format_ not in FORMATS:
+        raise ValueError("unknown format {0}".format(format_))
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    # the JSON of concepts with many links exceeds the default limit
+    csv.field_size_limit(2 ** 31 - 1)
+    data = {}
+    for name, path, columns in tables(metadata):
+        if name in FILES:
+            with path.open(encoding="utf-8", newline="") as f:
+                data[name] = (columns, list(csv.DictReader(f)))
+    out = {}
+    if "LanguageTable" in data:
+        out["languages"] = table(*data["LanguageTable"])
+    if "ParameterTable" in data:
+        out["parameters"] = table(*data["ParameterTable"])
+        # older versions of the dataset have the pairs only as JSON
+        out["concept_pairs"] = table(*data[PAIR_TABLE]) if PAIR_TABLE in data else \
+            concept_pairs(data["ParameterTable"][1])
+    if "FormTable" in data:
+        families = {
+            row["ID"]: row.get("Family") or None for row in data.get("LanguageTable", [[], []])[1]}
+        columns, rows = data["FormTable"]
+        out["forms"] = table(columns, rows, extra={
+            "Family": [families.get(row["Language_ID"]) for row in rows]})
+    counts = {}
+    for name, table_ in out.items():
+        write(table_, directory / "{0}.{1}".format(name, format_), format_)
+        counts[name] = table_.num_rows
+    return counts
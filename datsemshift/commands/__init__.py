@@ -0,0 +1,3 @@
+"""
+Commands for the DatSemShift dataset, run as `cldfbench datsemshift.<command>`.
+"""
@@ -0,0 +1,42 @@
+"""
+Move the raw pages in raw/raw-data into the single-file archive raw/raw-data/pages.sqlite.
+
+Once the archive exists, cmd_download reads and writes pages from and to it.
+"""
+from datsemshift.archive import ARCHIVE, ArchiveStore, DirectoryStore, convert
+
+
+def register(parser):
+    parser.add_argument(
+        "--unpack",
+        action="store_true",
+        default=False,
+        help="Write the pages of the archive back to loose files.",
+    )
+    parser.add_argument(
+        "--keep",
+        action="store_true",
+        default=False,
+        help="Keep the source files (or the archive) after the conversion.",
+    )
+
+
+def run(args):
+    from lexibank_datsemshift import Dataset
+
+    raw = Dataset().raw_dir / "raw-data"
+    archive, directory = ArchiveStore(raw / ARCHIVE), DirectoryStore(raw)
+    if args.unpack:
+        if not archive.path.exists():
+            args.log.error("no archive found at {0}".format(archive.path))
+            return
+        count = convert(archive, directory)
+        archive.close()
+        if not args.keep:
+            for suffix in ["", "-wal", "-shm"]:
+                raw.joinpath(ARCHIVE + suffix).unlink(missing_ok=True)
+        args.log.info("unpacked {0} pages from {1}".format(count, archive.path))
+    else:
+        count = convert(directory, archive, remove=not args.keep)
+        archive.close()
+        args.log.info("packed {0} pages into {1}".format(count, archive.path))
@@ -0,0 +1,68 @@
+"""
+List the chains of semantic shifts between forms, like A → B → C, following
+the Source_Lexemes of the forms, as TSV.
+
+See `datsemshift.chains` for the search.
+"""
+import sys
+import csv
+
+from datsemshift.aggregate import TYPES
+
+
+def register(parser):
+    parser.add_argument(
+        "--source",
+        nargs="+",
+        default=None,
+        help="IDs of the concepts of the first forms (default: all).",
+    )
+    parser.add_argument(
+        "--target",
+        nargs="+",
+        default=None,
+        help="IDs of the concepts of the last forms (default: all).",
+    )
+    parser.add_argument(
+        "--hops",
+        default=3,
+        type=int,
+        help="Maximal number of shifts of a chain.",
+    )
+    parser.add_argument(
+        "--relation",
+        nargs="+",
+        default=None,
+        choices=TYPES,
+        help="Types of the shifts (default: all).",
+    )
+    parser.add_argument("--language", nargs="+", default=None, help="IDs of the languages.")
+    parser.add_argument("--family", nargs="+", default=None, help="Names of the families.")
+    parser.add_argument(
+        "--within",
+        default=None,
+        choices=["language", "family"],
+        help="Only chains of forms in the same language or family.",
+    )
+    parser.add_argument("--output", default=None, help="TSV file (default: stdout).")
+
+
+def run(args):
+    from lexibank_datsemshift import Dataset
+    from datsemshift.chains import ChainIndex, CHAIN_COLUMNS
+
+    index = ChainIndex.from_cldf(Dataset().cldf_dir / "cldf-metadata.json")
+    f = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerow(CHAIN_COLUMNS)
+        count = 0
+        for nodes, types in index.chains(
+                args.source, args.target, hops=args.hops, relations=args.relation,
+                languages=args.language, families=args.family, within=args.within):
+            writer.writerow(index.row(nodes, types))
+            count += 1
+    finally:
+        if args.output:
+            f.close()
+    args.log.info("{0} chains".format(count))
@@ -0,0 +1,32 @@
+"""
+Export the CLDF data to typed, columnar Parquet or Arrow files, with the
+concept pairs in a table of their own.
+
+Requires pyarrow, install with `pip install -e .[columnar]`.
+"""
+import pathlib
+
+
+def register(parser):
+    parser.add_argument(
+        "--dir",
+        default=pathlib.Path("columnar"),
+        type=pathlib.Path,
+        help="Directory of the output files.",
+    )
+    parser.add_argument(
+        "--format",
+        default="parquet",
+        choices=["parquet", "arrow"],
+        help="Parquet files (compressed) or Arrow IPC files (memory-mappable).",
+    )
+
+
+def run(args):
+    from lexibank_datsemshift import Dataset
+    # pyarrow is optional
+    from datsemshift.columnar import export
+
+    counts = export(Dataset().cldf_dir / "cldf-metadata.json", args.dir, args.format)
+    for name, count in counts.items():
+        args.log.info("{0}.{1}: {2} rows".format(name, args.format, count))
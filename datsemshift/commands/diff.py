@@ -0,0 +1,53 @@
+"""
+List the shifts, realizations, concepts, languages and rows of the CLDF data
+added, removed or changed between two builds of the dataset.
+
+Builds are given as directories with the raw, etc and cldf directories of the
+dataset or as git revisions of the dataset, e.g. `HEAD~1`. With --rebuild, the
+concepts of all differences are written to raw/changed-concepts.txt, to be
+rebuilt by the next run of cmd_makecldf in incremental mode.
+"""
+import json
+
+from datsemshift.diff import Build, diff
+from datsemshift.incremental import CHANGED_CONCEPTS
+
+
+def register(parser):
+    parser.add_argument("old", help="Directory or git revision of the old build.")
+    parser.add_argument(
+        "new",
+        nargs="?",
+        default=None,
+        help="Directory or git revision of the new build (default: the dataset).",
+    )
+    parser.add_argument("--output", default=None, help="JSON file for the changelog.")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        default=False,
+        help="Write the concepts of the differences to raw/{0}.".format(CHANGED_CONCEPTS),
+    )
+
+
+def run(args):
+    from lexibank_datsemshift import Dataset
+
+    ds = Dataset()
+    changelog = diff(
+        Build(args.old, repository=ds.dir), Build(args.new or ds.dir, repository=ds.dir))
+    print("{0:25} {1:>8} {2:>8} {3:>8} {4:>8} {5:>8}".format(
+        "table", "old", "new", "added", "removed", "changed"))
+    for path, table in changelog["tables"].items():
+        print("{0:25} {1:>8} {2:>8} {3:>8} {4:>8} {5:>8}".format(
+            path, *table["rows"], len(table["added"]), len(table["removed"]),
+            len(table["changed"])))
+    args.log.info("{0} concepts in the differences".format(len(changelog["concepts"])))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(changelog, f, indent=2, ensure_ascii=False)
+        args.log.info("wrote changelog to {0}".format(args.output))
+    if args.rebuild:
+        ds.raw_dir.joinpath(CHANGED_CONCEPTS).write_text(
+            "".join(concept + "\n" for concept in changelog["concepts"]), encoding="utf-8")
+        args.log.info("wrote concepts to rebuild to raw/{0}".format(CHANGED_CONCEPTS))
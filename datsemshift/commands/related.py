@@ -0,0 +1,42 @@
+"""
+List the concepts most related to a concept, from the matrices written by
+cmd_makecldf with MATRICES set.
+
+Requires numpy and scipy, install with `pip install -e .[graph]`.
+"""
+
+
+def register(parser):
+    parser.add_argument("concept", nargs="+", help="IDs of the concepts.")
+    parser.add_argument(
+        "-k",
+        default=10,
+        type=int,
+        help="Number of related concepts.",
+    )
+    parser.add_argument(
+        "--kind",
+        default="undirected",
+        choices=["directed", "undirected"],
+        help="Count directed (in both directions) or undirected shifts.",
+    )
+    parser.add_argument(
+        "--weight",
+        default="PolysemyByFamily",
+        choices=["Polysemy", "Derivation", "PolysemyByFamily", "DerivationByFamily"],
+    )
+
+
+def run(args):
+    from lexibank_datsemshift import Dataset
+    # numpy and scipy are optional
+    from datsemshift.graph import ShiftGraph
+
+    graph = ShiftGraph.load(Dataset().dir / "matrices")
+    for concept in args.concept:
+        if concept not in graph.index:
+            args.log.warning("unknown concept {0}".format(concept))
+            continue
+        for target, weight in graph.related(concept, args.k, args.kind, args.weight):
+            print("{0}\t{1}\t{2}\t{3}".format(
+                concept, target, graph.names[graph.index[target]], weight))
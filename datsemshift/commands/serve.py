@@ -0,0 +1,31 @@
+"""
+Answer queries on the CLDF data over HTTP with JSON, from a local asyncio server.
+
+See `datsemshift.service` for the queries.
+"""
+import asyncio
+
+
+def register(parser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=8765, type=int)
+    parser.add_argument(
+        "--cache-size",
+        default=4096,
+        type=int,
+        help="Number of responses kept in the cache.",
+    )
+
+
+def run(args):
+    from lexibank_datsemshift import Dataset
+    from datsemshift.service import Index, Service
+
+    service = Service(
+        Index(Dataset().cldf_dir / "cldf-metadata.json"), cache_size=args.cache_size)
+    args.log.info("serving {0} forms on http://{1}:{2}".format(
+        len(service.index.forms), args.host, args.port))
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
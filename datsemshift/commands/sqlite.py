@@ -0,0 +1,25 @@
+"""
+Export the CLDF data to a SQLite database with link tables for the
+Source_Lexemes and Shifts of the forms (see example/query_links.sh).
+"""
+import pathlib
+
+from datsemshift.database import export
+
+
+def register(parser):
+    parser.add_argument(
+        "--db",
+        default=pathlib.Path("dss.sqlite"),
+        type=pathlib.Path,
+        help="Path of the database, replaced if it exists.",
+    )
+
+
+def run(args):
+    from lexibank_datsemshift import Dataset
+
+    counts = export(Dataset().cldf_dir / "cldf-metadata.json", args.db)
+    for table, count in counts.items():
+        args.log.info("{0}: {1} rows".format(table, count))
+    args.log.info("database written to {0}".format(args.db))
@@ -0,0 +1,28 @@
+"""
+Validate the CLDF data with pycldf, with the tables checked in parallel.
+
+See `datsemshift.validate` for the checks.
+"""
+import os
+import time
+
+
+def register(parser):
+    parser.add_argument(
+        "--workers",
+        default=os.cpu_count() or 1,
+        type=int,
+        help="Number of worker processes.",
+    )
+
+
+def run(args):
+    from lexibank_datsemshift import Dataset
+    from datsemshift.validate import validate
+
+    start = time.perf_counter()
+    valid = validate(Dataset().cldf_dir / "cldf-metadata.json", log=args.log, workers=args.workers)
+    args.log.info("{0} in {1:.1f}s".format(
+        "valid" if valid else "invalid", time.perf_counter() - start))
+    if not valid:
+        raise SystemExit(1)
@@ -0,0 +1,152 @@
+"""
+Consistency checks of the concept pairs and forms built by `cmd_makecldf`.
+
+The checks run on the data as built, before it is written, with hash indexes
+over the `PairTable`s of the directed and undirected pairs and the forms of
+the `LexemeGraph`, each in time linear in the size of the data:
+
+- `symmetry`: each undirected pair has a reverse pair with the same counts
+  and families.
+- `realizations`: the realizations of the pairs are the lexemes of the
+  forms of their concepts, with the same types, and each lexeme is realized
+  by one pair (or by the undirected pairs in both directions).
+- `self-loops`: pairs of a concept with itself (e.g. after two concepts were
+  unified) and shifts of a lexeme to itself.
+- `dangling-references`: the `Source_Lexemes` of the forms are `Local_ID`s of
+  forms which are written.
+
+Self-loops are warnings, the other issues are errors.
+"""
+import collections
+
+from datsemshift.aggregate import TYPES
+
+ERROR, WARNING = "error", "warning"
+
+Issue = collections.namedtuple("Issue", ["check", "level", "subject", "message"])
+
+
+def _pairs(table):
+    """
+    Iterate over the `(source, target, index)` of the pairs of a `PairTable`,
+    with the concepts as codes.
+    """
+    for source, targets in table.pairs.items():
+        for target, idx in targets.items():
+            yield source, target, idx
+
+
+def _name(table, source, target):
+    return "{0} / {1}".format(table.concepts.values[source], table.concepts.values[target])
+
+
+def check_symmetry(links):
+    """
+    Check that the undirected pairs of a `PairTable` come in both directions,
+    with the same counts and families.
+    """
+    for source, target, idx in _pairs(links):
+        reverse = links.pairs.get(target, {}).get(source)
+        if reverse is None:
+            yield Issue("symmetry", ERROR, _name(links, source, target), "no reverse pair")
+            continue
+        if reverse < idx:
+            # each pair of pairs is compared once
+            continue
+        for t, type_ in enumerate(TYPES):
+            ab, ba = links.counts[2 * idx + t], links.counts[2 * reverse + t]
+            if ab != ba:
+                yield Issue("symmetry", ERROR, _name(links, source, target), (
+                    "{0} not symmetric: {1} / {2}".format(type_, ab, ba)))
+            elif links.family_sets[2 * idx + t] != links.family_sets[2 * reverse + t]:
+                yield Issue("symmetry", ERROR, _name(links, source, target), (
+                    "families of {0} not symmetric".format(type_)))
+
+
+def _realizations(table):
+    """
+    Iterate over the `(source, target, lexeme, type)` of the realizations of
+    the pairs of a `PairTable`, with the concepts as codes.
+    """
+    for source, target, idx in _pairs(table):
+        event = table.first[idx]
+        while event != -1:
+            yield (source, target, table.lexemes.values[table.event_lexeme[event]],
+                   TYPES[table.event_type[event]])
+            event = table.event_next[event]
+
+
+def check_realizations(targets, links, forms):
+    """
+    Check the realizations of the directed (`targets`) and undirected
+    (`links`) pairs against the forms (dictionaries as in `FormTable`): a
+    lexeme (row of `raw/lexemes.tsv`) in the `IDS_in_Source` of the forms of
+    two concepts is realized once by a directed pair or by the undirected
+    pairs in both directions of these concepts, with the type given in the
+    `Shift_Types` of the forms.
+    """
+    found = collections.defaultdict(list)
+    for form in forms:
+        for lexeme, type_ in zip(form.get("IDS_in_Source") or [], form.get("Shift_Types") or []):
+            found[str(lexeme)].append((form["Parameter_ID"], type_))
+    realized = {table: collections.Counter() for table in (targets, links)}
+    for table in (targets, links):
+        for source, target, lexeme, type_ in _realizations(table):
+            realized[table][lexeme] += 1
+            concepts = sorted([table.concepts.values[source], table.concepts.values[target]])
+            if sorted(found.get(lexeme, [])) != [(concept, type_) for concept in concepts]:
+                yield Issue("realizations", ERROR, _name(table, source, target), (
+                    "{0} {1} is not a {0} of forms of the concepts".format(type_, lexeme)))
+    for lexeme in found:
+        directed, undirected = realized[targets][lexeme], realized[links][lexeme]
+        if (directed, undirected) not in ((1, 0), (0, 2)):
+            yield Issue("realizations", ERROR, "lexeme {0}".format(lexeme), (
+                "realized by {0} directed and {1} undirected pairs".format(
+                    directed, undirected)))
+
+
+def check_self_loops(table, lexemes=None):
+    """
+    Check for pairs of a concept with itself in a `PairTable` and shifts of a
+    lexeme to itself in a frozen `LexemeGraph`.
+    """
+    for source, target, idx in _pairs(table):
+        if source == target:
+            weights = table.weights(idx)
+            yield Issue("self-loops", WARNING, _name(table, source, target), ", ".join(
+                "{0} {1}".format(type_, weights[type_]) for type_ in TYPES if weights[type_]))
+    if lexemes is not None:
+        for node in range(len(lexemes)):
+            for e in range(lexemes.indptr[node], lexemes.indptr[node + 1]):
+                if lexemes.targets[e] == node:
+                    yield Issue("self-loops", WARNING, "form {0}".format(node + 1), (
+                        "{0} of the lexeme {1} to itself".format(
+                            TYPES[lexemes.relations[e]], lexemes.words[node])))
+
+
+def check_references(forms):
+    """
+    Check that the `Source_Lexemes` of the forms (dictionaries as in
+    `FormTable`) are `Local_ID`s of the forms.
+    """
+    index = {str(form["Local_ID"]) for form in forms}
+    for form in forms:
+        for source in form.get("Source_Lexemes") or []:
+            if str(source) not in index:
+                yield Issue("dangling-references", ERROR, "form {0}".format(form["ID"]), (
+                    "Source_Lexemes {0} is not the Local_ID of a form".format(source)))
+
+
+def check(targets, links, lexemes, forms):
+    """
+    Run all checks on the directed (`targets`) and undirected (`links`)
+    pairs, the `LexemeGraph` and the forms.
+
+    :return: List of `Issue`s.
+    """
+    issues = list(check_symmetry(links))
+    issues.extend(check_realizations(targets, links, forms))
+    issues.extend(check_self_loops(targets, lexemes))
+    issues.extend(check_self_loops(links))
+    issues.extend(check_references(forms))
+    return issues
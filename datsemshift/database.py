@@ -0,0 +1,169 @@
+"""
+Export of the CLDF data to SQLite.
+
+The tables and columns are named as in the database created by `cldf
+createdb`, so that queries written for it (like `example/query.sh`) run on
+the export. In addition, the list-valued columns of the FormTable which link
+forms to each other and to the shifts are unnested into link tables:
+
+- `FormTable_Source_Lexemes` has one row per entry of `Source_Lexemes` with the
+  IDs of the form and the source form and the type in `Source_Relations`,
+- `FormTable_Shifts` has one row per occurrence of a form in a shift, from the
+  parallel lists `Shifts`, `Shift_Types`, `Concepts_in_Source` and
+  `IDS_in_Source`,
+
+and the columns used for lookups and joins, including the concepts of the
+table of concept pairs, are indexed. Forms derived from a
+given form can then be found with an indexed join instead of matching the
+`Source_Lexemes` string of every form with `LIKE`.
+"""
+import csv
+import json
+import pathlib
+import sqlite3
+
+TERMS = "http://cldf.clld.org/v1.0/terms.rdf#"
+TYPES = {"integer": "INTEGER", "decimal": "REAL", "float": "REAL", "boolean": "INTEGER"}
+
+LINK_TABLES = {
+    "FormTable_Source_Lexemes": [
+        ("Form_ID", "TEXT"), ("Position", "INTEGER"), ("Source_Form_ID", "TEXT"),
+        ("Relation", "TEXT")],
+    "FormTable_Shifts": [
+        ("Form_ID", "TEXT"), ("Position", "INTEGER"), ("Shift_ID", "TEXT"),
+        ("Shift_Type", "TEXT"), ("Concept_in_Source", "TEXT"), ("IDS_in_Source", "TEXT")],
+}
+
+INDEXES = [
+    ("FormTable", "cldf_languageReference"),
+    ("FormTable", "cldf_parameterReference"),
+    ("FormTable", "Local_ID"),
+    ("LanguageTable", "cldf_glottocode"),
+    ("ParameterTable", "cldf_concepticonReference"),
+    ("FormTable_Source_Lexemes", "Source_Form_ID"),
+    ("FormTable_Shifts", "Shift_ID"),
+    ("concept_pairs.csv", "Source_ID"),
+    ("concept_pairs.csv", "Target_ID"),
+]
+
+
+def column_name(column):
+    """
+    The name of a column in the database, `cldf_<term>` for CLDF properties.
+    """
+    url = column.get("propertyUrl", "")
+    return "cldf_" + url[len(TERMS):] if url.startswith(TERMS) else column["name"]
+
+
+def sql_type(column):
+    datatype = column.get("datatype", "string")
+    if isinstance(datatype, dict):
+        datatype = datatype.get("base", "string")
+    return TYPES.get(datatype, "TEXT")
+
+
+def _value(value, type_):
+    if value == "":
+        return None
+    if type_ == "INTEGER":
+        if value in ("True", "true"):
+            return 1
+        if value in ("False", "false"):
+            return 0
+        return int(value)
+    if type_ == "REAL":
+        return float(value)
+    return value
+
+
+def _split(value, separator):
+    return value.split(separator) if value else []
+
+
+def tables(metadata):
+    """
+    Yield `(name, path, columns)` of the tables of a CLDF dataset, `name`
+    being the CLDF component or the URL of other tables (like
+    `concept_pairs.csv`) and `columns` the list of column descriptions.
+    """
+    metadata = pathlib.Path(metadata)
+    data = json.loads(metadata.read_text(encoding="utf-8"))
+    for table in data.get("tables", []):
+        component = table.get("dc:conformsTo") or ""
+        yield (
+            component[len(TERMS):] if component.startswith(TERMS) else table["url"],
+            metadata.parent / table["url"],
+            table["tableSchema"]["columns"])
+
+
+def links(rows):
+    """
+    Return the rows of the link tables, given the FormTable rows as
+    dictionaries as read from the CSV file.
+    """
+    ids = {row["Local_ID"]: row["ID"] for row in rows}
+    out = {name: [] for name in LINK_TABLES}
+    sources, shifts = out["FormTable_Source_Lexemes"], out["FormTable_Shifts"]
+    for row in rows:
+        form = row["ID"]
+        for pos, (source, relation) in enumerate(zip(
+                _split(row["Source_Lexemes"], " "), _split(row["Source_Relations"], " "))):
+            sources.append((form, pos, ids.get(source), relation))
+        for pos, shift in enumerate(zip(
+                _split(row["Shifts"], " "),
+                _split(row["Shift_Types"], " "),
+                _split(row["Concepts_in_Source"], " // "),
+                _split(row["IDS_in_Source"], " "))):
+            shifts.append((form, pos) + shift)
+    return out
+
+
+def export(metadata, path):
+    """
+    Write the CLDF dataset described by `metadata` to the SQLite database
+    `path`, replacing an existing database.
+
+    :return: Dictionary with the number of rows per table.
+    """
+    path = pathlib.Path(path)
+    path.unlink(missing_ok=True)
+    # the JSON of concepts with many links exceeds the default limit
+    csv.field_size_limit(2 ** 31 - 1)
+    counts = {}
+    db = sqlite3.connect(str(path))
+    try:
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        with db:
+            forms = []
+            for name, table, columns in tables(metadata):
+                names = [column_name(c) for c in columns]
+                types = [sql_type(c) for c in columns]
+                db.execute("CREATE TABLE `{0}` ({1}{2})".format(
+                    name,
+                    ", ".join("`{0}` {1}".format(n, t) for n, t in zip(names, types)),
+                    ", PRIMARY KEY(`cldf_id`)" if "cldf_id" in names else ""))
+                insert = "INSERT INTO `{0}` VALUES ({1})".format(
+                        name, ", ".join("?" * len(names)))
+                with table.open(encoding="utf-8", newline="") as f:
+                    rows = list(csv.DictReader(f))
+                db.executemany(insert, (
+                    [_value(row[c["name"]], t) for c, t in zip(columns, types)]
+                    for row in rows))
+                counts[name] = len(rows)
+                if name == "FormTable":
+                    forms = rows
+            for name, rows in links(forms).items():
+                columns = LINK_TABLES[name]
+                db.execute("CREATE TABLE `{0}` ({1}, PRIMARY KEY(`Form_ID`, `Position`))".format(
+                    name, ", ".join("`{0}` {1}".format(n, t) for n, t in columns)))
+                db.executemany("INSERT INTO `{0}` VALUES ({1})".format(
+                    name, ", ".join("?" * len(columns))), rows)
+                counts[name] = len(rows)
+            for table, column in INDEXES:
+                if table in counts:
+                    db.execute("CREATE INDEX `{0}_{1}` ON `{0}`(`{1}`)".format(table, column))
+            db.execute("ANALYZE")
+    finally:
+        db.close()
+    return counts
@@ -0,0 +1,179 @@
+"""
+Differences between two builds of the dataset.
+
+The rows of the tables written by `cmd_download` and `cmd_makecldf` are
+identified by stable keys: shifts by ID, realizations by shift ID and number
+of the realization in the shift (as in its title), concepts by number, and
+languages and the rows of the CLDF tables by ID. Columns holding running
+numbers of the realizations or forms, which change for all rows after an
+inserted row, are ignored. `diff` reads each table of both builds once,
+keeping only a digest of the content of each row, and returns the keys of the
+rows added, removed and changed; the old rows removed or changed are read in a
+second pass over the old build, if there are any. The concepts of all rows
+which differ can be passed on to the next incremental rebuild (see
+`datsemshift.incremental`).
+
+A build is a directory with the `raw`, `etc` and `cldf` directories of the
+dataset, or a git revision of the repository of the dataset.
+"""
+import io
+import csv
+import operator
+import pathlib
+import subprocess
+
+from datsemshift.incremental import digest
+
+# path, delimiter, key columns (or None for the number in the shift), ignored
+# columns and columns with concepts
+TABLES = [
+    ("etc/concepts.tsv", "\t", ["NUMBER"], [], ["NUMBER"]),
+    ("etc/languages.tsv", "\t", ["ID"], [], []),
+    ("raw/shifts.tsv", "\t", ["ID"], [], ["Source_Number", "Target_Number"]),
+    ("raw/lexemes.tsv", "\t", None, ["ID"], ["Source_Concept_ID", "Target_Concept_ID"]),
+    ("cldf/parameters.csv", ",", ["ID"], [], ["ID"]),
+    ("cldf/languages.csv", ",", ["ID"], [], []),
+    ("cldf/forms.csv", ",", ["ID"], ["Local_ID", "Source_Lexemes", "IDS_in_Source"],
+     ["Parameter_ID"]),
+    ("cldf/concept_pairs.csv", ",", ["ID"], ["Polysemy_Lexemes", "Derivation_Lexemes"],
+     ["Source_ID", "Target_ID"]),
+]
+
+
+class Build:
+    """
+    The files of a build, in a directory or a git revision of `repository`.
+    """
+    def __init__(self, location, repository="."):
+        self.location = str(location)
+        self.repository = pathlib.Path(repository)
+        self.directory = pathlib.Path(location) if pathlib.Path(location).is_dir() else None
+
+    def __str__(self):
+        return self.location
+
+    def open(self, path):
+        """
+        Return the file `path` opened as text, or `None` if it does not exist.
+        """
+        if self.directory is not None:
+            path = self.directory / path
+            if not path.exists():
+                return None
+            return path.open(encoding="utf-8", newline="")
+        proc = subprocess.run(
+            ["git", "show", "{0}:{1}".format(self.location, path)],
+            cwd=str(self.repository), capture_output=True)
+        if proc.returncode != 0:
+            return None
+        return io.StringIO(proc.stdout.decode("utf-8"), newline="")
+
+
+def _rows(f, delimiter, keys, ignore):
+    """
+    Yield `(key, header, row)` of the rows of a table, the values of the row
+    being those of the header without the ignored columns.
+    """
+    reader = csv.reader(f, delimiter=delimiter)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = sorted(i for i, name in enumerate(header) if name not in ignore)
+    names = tuple(header[i] for i in columns)
+    project = operator.itemgetter(*columns) if len(columns) > 1 else (
+        lambda row: (row[columns[0]],))
+    if keys is None:
+        shift, title = header.index("Shift_ID"), header.index("Realization")
+        position, seen, last = 0, set(), None
+        for row in reader:
+            # realizations are numbered as in their titles ("Realization 2"),
+            # or else in the order of the rows of a shift
+            position = position + 1 if row[shift] == last else 1
+            last = row[shift]
+            number = row[title].rpartition(" ")[2]
+            key = "{0}:{1}".format(last, number if number.isdigit() else position)
+            if key in seen:
+                key = "{0}:{1}".format(key, position)
+            seen.add(key)
+            yield key, names, project(row)
+    elif len(keys) == 1:
+        key = header.index(keys[0])
+        for row in reader:
+            yield row[key], names, project(row)
+    else:
+        key = operator.itemgetter(*[header.index(key) for key in keys])
+        for row in reader:
+            yield ":".join(key(row)), names, project(row)
+
+
+def fingerprint(f, delimiter, keys, ignore=(), compare=None):
+    """
+    Return a dictionary with the digest of the content of the rows of a table
+    by key.
+
+    The digests do not change between runs of Python, so that the
+    fingerprints of a build can be kept and compared with later builds.
+
+    :param compare: Fingerprints of another build of the table. If given, \
+    the rows which are not in `compare` or differ are returned as well, as \
+    dictionary of dictionaries by key.
+    """
+    out, rows, header = {}, {}, None
+    for key, names, values in _rows(f, delimiter, keys, set(ignore)):
+        if header is None:
+            # the content depends on the names of the columns
+            header = digest(names)
+        out[key] = content = digest((header, values))
+        if compare is not None and compare.get(key) != content:
+            rows[key] = dict(zip(names, values))
+    return out if compare is None else (out, rows)
+
+
+def _select(f, delimiter, keys, ignore, selected):
+    return {key: dict(zip(names, values))
+            for key, names, values in _rows(f, delimiter, keys, set(ignore)) if key in selected}
+
+
+def diff(old, new, tables=TABLES):
+    """
+    Compare the tables of two builds.
+
+    :return: Changelog as dictionary, with the `added`, `removed` and \
+    `changed` rows of each table, the old and new values of the columns of \
+    the changed rows and the sorted IDs of the concepts of all these rows.
+    """
+    changelog = {"old": str(old), "new": str(new), "tables": {}, "concepts": set()}
+    for path, delimiter, keys, ignore, concepts in tables:
+        f, g = old.open(path), new.open(path)
+        if f is None or g is None:
+            for h in (f, g):
+                if h is not None:
+                    h.close()
+            continue
+        with f:
+            before = fingerprint(f, delimiter, keys, ignore)
+        # the new rows which differ are kept while reading the new build
+        with g:
+            after, new_rows = fingerprint(g, delimiter, keys, ignore, compare=before)
+        added = [key for key in new_rows if key not in before]
+        changed = [key for key in new_rows if key in before]
+        removed = [key for key in before if key not in after]
+        old_rows = {}
+        if changed or removed:
+            with old.open(path) as f:
+                old_rows = _select(f, delimiter, keys, ignore, set(changed + removed))
+        for row in list(old_rows.values()) + list(new_rows.values()):
+            changelog["concepts"].update(row.get(column, "") for column in concepts)
+        changelog["tables"][path] = {
+            "rows": [len(before), len(after)],
+            "added": added,
+            "removed": removed,
+            "changed": {key: {
+                name: [old_rows[key].get(name), new_rows[key].get(name)]
+                for name in sorted(set(old_rows[key]) | set(new_rows[key]))
+                if old_rows[key].get(name) != new_rows[key].get(name)} for key in changed}}
+    # numbers of the concepts in the raw data first, then the IDs of the CLDF data
+    changelog["concepts"] = sorted(
+        changelog["concepts"] - {""},
+        key=lambda c: (not c.isdigit(), int(c) if c.isdigit() else 0, c))
+    return changelog
@@ -0,0 +1,174 @@
+"""
+Concurrent download of the pages of the DatSemShift website.
+
+The website serves several thousand small pages, so most of the time of a
+sequential download is spent waiting for round-trips. The `Fetcher` runs the
+requests in a bounded thread pool, limits the number of concurrent requests per
+host, throttles the overall request rate with a token bucket and retries
+transient errors with exponential backoff.
+"""
+import os
+import time
+import random
+import socket
+import pathlib
+import threading
+import http.client
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pylexibank import progressbar as pb
+
+# HTTP status codes which are worth a second try
+TRANSIENT_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing `rate` requests per second on average
+    and bursts of up to `capacity` requests.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                        self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchError(Exception):
+    def __init__(self, url, status=None, reason=""):
+        self.url, self.status, self.reason = url, status, reason
+        Exception.__init__(self, "{0}: {1} {2}".format(url, status or "", reason).strip())
+
+
+class Fetcher:
+    """
+    Download pages with a bounded worker pool.
+
+    :param workers: Number of worker threads.
+    :param per_host: Maximal number of concurrent requests to one host.
+    :param rate: Maximal number of requests per second (0 disables throttling).
+    :param retries: Number of retries for transient errors.
+    :param backoff: Base delay in seconds for the exponential backoff.
+    """
+    def __init__(self, workers=8, per_host=4, rate=8.0, retries=5, backoff=1.0,
+                 timeout=60, log=None):
+        self.workers = max(1, workers)
+        self.per_host = max(1, per_host)
+        self.bucket = TokenBucket(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.log = log
+        self._hosts = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self._hosts_lock = threading.Lock()
+
+    def _host(self, url):
+        with self._hosts_lock:
+            return self._hosts[urllib.parse.urlsplit(url).netloc]
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff * 2 ** attempt * (0.5 + random.random() / 2)
+
+    def request(self, url, headers=None):
+        """
+        Fetch a URL and return a tuple `(status, headers, content)`.
+
+        Transient errors are retried, other HTTP errors raise a `FetchError`.
+        """
+        attempt = 0
+        while True:
+            retry_after = None
+            self.bucket.acquire()
+            try:
+                with self._host(url):
+                    req = urllib.request.Request(url, headers=headers or {})
+                    with urllib.request.urlopen(req, timeout=self.timeout) as fp:
+                        return fp.status, dict(fp.headers), fp.read()
+            except urllib.error.HTTPError as e:
+                if e.code == 304:
+                    return 304, dict(e.headers), b""
+                if e.code not in TRANSIENT_STATUS or attempt >= self.retries:
+                    raise FetchError(url, e.code, e.reason)
+                retry_after = e.headers.get("Retry-After")
+                reason = e.code
+            except (urllib.error.URLError, socket.timeout, ConnectionError,
+                    http.client.HTTPException) as e:
+                if attempt >= self.retries:
+                    raise FetchError(url, reason=str(e))
+                reason = e
+            delay = self._delay(attempt, retry_after)
+            if self.log:
+                self.log.debug("retrying {0} in {1:.1f}s ({2})".format(url, delay, reason))
+            time.sleep(delay)
+            attempt += 1
+
+    def fetch(self, url, path):
+        """
+        Download a URL to a file, writing the file atomically.
+        """
+        _, _, content = self.request(url)
+        write_atomic(path, content)
+        return path
+
+    def run(self, jobs, func, desc="downloading"):
+        """
+        Run `func(*job)` for all jobs in the pool and return the results in job
+        order, along with a list of `(job, FetchError)` tuples for failed jobs.
+        """
+        jobs = list(jobs)
+        results, errors = [None] * len(jobs), []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(func, *job): i for i, job in enumerate(jobs)}
+            for future in pb(as_completed(futures), total=len(futures), desc=desc):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except FetchError as e:
+                    errors.append((jobs[i], e))
+                    if self.log:
+                        self.log.warning("failed to download {0}".format(e))
+        return results, errors
+
+    def download(self, jobs, desc="downloading"):
+        """
+        Download `(url, path)` jobs and return the list of failed jobs.
+        """
+        jobs, start = list(jobs), time.monotonic()
+        _, errors = self.run(jobs, self.fetch, desc=desc)
+        if self.log:
+            self.log.info("downloaded {0} of {1} pages in {2:.1f}s".format(
+                len(jobs) - len(errors), len(jobs), time.monotonic() - start))
+        return errors
+
+
+def write_atomic(path, content):
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.parent / ".{0}.{1}.tmp".format(path.name, threading.get_ident())
+    tmp.write_bytes(content)
+    os.replace(tmp, path)
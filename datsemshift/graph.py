@@ -0,0 +1,255 @@
+"""
+Queries on the graph of concepts of the CLDF dataset.
+
+`ShiftGraph` reads `parameters.csv` and `concept_pairs.csv` once and keeps
+the statistics of the directed and undirected concept pairs (the
+`Target_Concepts` and `Linked_Concepts` of older versions of the dataset) as
+sparse matrices. Concepts are indexed by their position in the table, and
+there is one matrix per kind of edge and weight (`Polysemy`, `Derivation`,
+`PolysemyByFamily`, `DerivationByFamily`). Queries for neighbours, degrees,
+k-hop neighbourhoods and the heaviest pairs are answered with vectorized
+operations on these matrices instead of walking the pairs of each concept.
+
+Requires numpy and scipy, install with `pip install -e .[graph]`.
+"""
+import csv
+import pathlib
+
+import numpy as np
+from scipy import sparse
+
+from datsemshift.aggregate import PAIR_TABLE, KINDS, WEIGHTS, read_pairs
+from datsemshift.database import tables
+
+
+def cldf_tables(path):
+    """
+    Return the paths of the ParameterTable and of the table of concept pairs
+    (`None` for datasets without it) of a CLDF dataset, given the dataset
+    directory, the metadata file or the ParameterTable itself.
+    """
+    path = pathlib.Path(path)
+    if path.is_dir():
+        path = path / "cldf-metadata.json"
+    if path.suffix != ".json":
+        return path, None
+    paths = {name: table for name, table, _ in tables(path)}
+    if "ParameterTable" not in paths:
+        raise ValueError("no ParameterTable in {0}".format(path))
+    return paths["ParameterTable"], paths.get(PAIR_TABLE)
+
+
+class ShiftGraph:
+    """
+    Concepts and the shifts between them as sparse matrices.
+
+    :ivar ids: Array of the concept IDs, the index of a concept is its position.
+    :ivar edges: Dictionary with `(sources, targets, weights)` arrays per kind \
+    of edge, in the order of the pairs, `weights` having one column per \
+    weight in `WEIGHTS`.
+    """
+    def __init__(self, ids, names, concepticon_ids, concepticon_glosses, edges):
+        self.ids = np.asarray(ids, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        self.concepticon_ids = np.asarray(concepticon_ids, dtype=object)
+        self.concepticon_glosses = np.asarray(concepticon_glosses, dtype=object)
+        self.index = {cid: i for i, cid in enumerate(ids)}
+        self.edges = edges
+        n = len(self.ids)
+        self._matrices = {}
+        for kind, (sources, targets, weights) in edges.items():
+            self._matrices[kind, None] = sparse.csr_matrix(
+                    (np.ones(len(sources), dtype=np.int32), (sources, targets)), shape=(n, n))
+            for i, weight in enumerate(WEIGHTS):
+                matrix = sparse.csr_matrix((weights[:, i], (sources, targets)), shape=(n, n))
+                matrix.eliminate_zeros()
+                self._matrices[kind, weight] = matrix
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_pairs(cls, concepts, pairs):
+        """
+        Create the graph from the concepts, as dictionaries with `ID`, `Name`,
+        `Concepticon_ID` and `Concepticon_Gloss`, and the pairs, as
+        dictionaries with `Source_ID`, `Target_ID`, `Directed` and the
+        `WEIGHTS`, like the rows of the table of concept pairs.
+        """
+        concepts = list(concepts)
+        index = {concept["ID"]: i for i, concept in enumerate(concepts)}
+        links = {kind: [] for kind in KINDS}
+        for pair in pairs:
+            links["directed" if pair["Directed"] else "undirected"].append((
+                index[pair["Source_ID"]],
+                index[pair["Target_ID"]],
+                [pair[weight] for weight in WEIGHTS]))
+        edges = {}
+        for kind, items in links.items():
+            edges[kind] = (
+                np.fromiter((s for s, _, _ in items), dtype=np.int32, count=len(items)),
+                np.fromiter((t for _, t, _ in items), dtype=np.int32, count=len(items)),
+                np.array([w for _, _, w in items], dtype=np.int32).reshape(-1, len(WEIGHTS)))
+        return cls(
+            [c["ID"] for c in concepts],
+            [c.get("Name") or "" for c in concepts],
+            [c.get("Concepticon_ID") or "" for c in concepts],
+            [c.get("Concepticon_Gloss") or "" for c in concepts],
+            edges)
+
+    @classmethod
+    def from_cldf(cls, path):
+        """
+        Load the graph from the ParameterTable and the table of concept pairs
+        of a CLDF dataset, or from the JSON columns of the ParameterTable of
+        datasets without table of concept pairs.
+        """
+        # the JSON of concepts with many links exceeds the default limit
+        csv.field_size_limit(2 ** 31 - 1)
+        parameters, pair_table = cldf_tables(path)
+        with parameters.open(encoding="utf-8", newline="") as f:
+            concepts = list(csv.DictReader(f))
+        return cls.from_pairs(concepts, read_pairs(concepts, pair_table))
+
+    def save(self, directory):
+        """
+        Write the matrices to `directory`, one CSR matrix per kind of edge and
+        weight, in the `.npz` format of `scipy.sparse.save_npz`, and the index
+        of the concepts to `concepts.tsv`.
+        """
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / "concepts.tsv", "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+            writer.writerow(["Index", "ID", "Name", "Concepticon_ID", "Concepticon_Gloss"])
+            writer.writerows(zip(
+                range(len(self)), self.ids, self.names, self.concepticon_ids,
+                self.concepticon_glosses))
+        for kind in KINDS:
+            for weight in WEIGHTS:
+                sparse.save_npz(
+                    directory / "{0}-{1}.npz".format(kind, weight), self.matrix(kind, weight))
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Load the graph from the matrices written by `save`. Edges are in the
+        order of the sources and targets.
+        """
+        directory = pathlib.Path(directory)
+        with open(directory / "concepts.tsv", encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f, delimiter="\t"))
+        edges = {}
+        for kind in KINDS:
+            matrices = [
+                sparse.load_npz(directory / "{0}-{1}.npz".format(kind, weight)).tocsr()
+                for weight in WEIGHTS]
+            # each pair has a realization of at least one type
+            coo = (matrices[0] + matrices[1]).tocoo()
+            edges[kind] = (
+                coo.row.astype(np.int32),
+                coo.col.astype(np.int32),
+                np.column_stack([
+                    np.asarray(m[coo.row, coo.col]).ravel() for m in matrices
+                ]).astype(np.int32).reshape(-1, len(WEIGHTS)))
+        return cls(
+            [r["ID"] for r in rows], [r["Name"] for r in rows],
+            [r["Concepticon_ID"] for r in rows], [r["Concepticon_Gloss"] for r in rows],
+            edges)
+
+    def indices(self, concepts):
+        """
+        Return the index or an array of indices of one or more concept IDs.
+        """
+        if isinstance(concepts, str):
+            return self.index[concepts]
+        return np.array([self.index[c] for c in concepts], dtype=np.int32)
+
+    def matrix(self, kind="directed", weight=None):
+        """
+        Return the adjacency matrix of a kind of edge in CSR format, with the
+        counts of `weight` or 1 for each edge if no weight is given.
+        """
+        return self._matrices[kind, weight]
+
+    def weights(self, sources, targets, kind="directed", weight="Polysemy"):
+        """
+        Return the weights of the pairs of the index arrays `sources` and
+        `targets`, 0 for pairs without edge.
+        """
+        return np.asarray(self.matrix(kind, weight)[sources, targets]).ravel()
+
+    def out_degree(self, kind="directed", weight=None):
+        """
+        Return the number of outgoing edges (or the sum of their weights) per concept.
+        """
+        return np.asarray(self.matrix(kind, weight).sum(axis=1)).ravel()
+
+    def in_degree(self, kind="directed", weight=None):
+        """
+        Return the number of incoming edges (or the sum of their weights) per concept.
+        """
+        return np.asarray(self.matrix(kind, weight).sum(axis=0)).ravel()
+
+    def neighbours(self, concept, kind="directed", weight=None, incoming=False):
+        """
+        Return the indices and weights of the neighbours of a concept.
+        """
+        matrix = self.matrix(kind, weight)
+        if incoming:
+            matrix = matrix.T.tocsr()
+        i = self.indices(concept)
+        start, end = matrix.indptr[i], matrix.indptr[i + 1]
+        return matrix.indices[start:end], matrix.data[start:end]
+
+    def khop(self, concepts, k=2, kind="directed", incoming=False):
+        """
+        Return the distance in hops of all concepts from the given concepts,
+        -1 for concepts which can not be reached within `k` hops.
+        """
+        matrix = self.matrix(kind)
+        if not incoming:
+            matrix = matrix.T.tocsr()
+        distance = np.full(len(self), -1, dtype=np.int32)
+        frontier = np.zeros(len(self), dtype=bool)
+        frontier[self.indices([concepts] if isinstance(concepts, str) else concepts)] = True
+        distance[frontier] = 0
+        for hop in range(1, k + 1):
+            frontier = (matrix @ frontier.astype(np.int32) > 0) & (distance == -1)
+            if not frontier.any():
+                break
+            distance[frontier] = hop
+        return distance
+
+    def top_k(self, k=10, kind="directed", weight="Polysemy", concept=None):
+        """
+        Return the `k` heaviest edges, of all concepts or from one concept, as
+        `(source, target, weight)` index arrays sorted by weight.
+        """
+        matrix = self.matrix(kind, weight)
+        if concept is not None:
+            matrix = matrix[self.indices(concept)]
+        coo = matrix.tocoo()
+        if concept is not None:
+            coo.row[:] = self.indices(concept)
+        k = min(k, coo.nnz)
+        # stable order for equal weights
+        top = np.lexsort((coo.col, coo.row, -coo.data))[:k]
+        return coo.row[top], coo.col[top], coo.data[top]
+
+    def related(self, concept, k=10, kind="undirected", weight="PolysemyByFamily"):
+        """
+        Return the IDs and weights of the `k` concepts most related to a
+        concept, counting directed shifts in both directions.
+        """
+        key = ("related", kind, weight)
+        if key not in self._matrices:
+            matrix = self.matrix(kind, weight)
+            self._matrices[key] = (matrix + matrix.T).tocsr() if kind == "directed" else matrix
+        matrix = self._matrices[key]
+        i = self.indices(concept)
+        start, end = matrix.indptr[i], matrix.indptr[i + 1]
+        targets, weights = matrix.indices[start:end], matrix.data[start:end]
+        # stable order for equal weights
+        top = np.lexsort((targets, -weights))[:k]
+        return list(zip(self.ids[targets[top]].tolist(), weights[top].tolist()))
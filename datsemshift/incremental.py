@@ -0,0 +1,144 @@
+"""
+Incremental rebuild of the CLDF data.
+
+A full run of `cmd_makecldf` aggregates the statistics of all concept pairs
+and creates all concepts and forms with the CLDF writer. In incremental mode,
+the state of the last run is kept in a snapshot: the rows of
+`raw/lexemes.tsv` with their unified concepts and the family of the source
+language, the data and rows of `ParameterTable` and `FormTable` as created by
+the writer, and the rows of the concept pairs.
+
+On the next run, the rows are compared with the snapshot. The statistics are
+only aggregated and dumped for the concepts linked by a changed row, for
+concepts whose data changed and for concepts linked to a renamed concept; all
+other rows of `ParameterTable` and of the concept pairs are taken from the
+snapshot. The lexeme graph is rebuilt from all rows, since a single row can
+change the numbering of the forms, but a form is only passed to the writer
+again if its data differ from the snapshot. If rows were reordered, everything is rebuilt.
+Concepts listed in `raw/changed-concepts.txt` are rebuilt as well, and the
+file is removed once the snapshot is saved.
+
+The snapshot is tied to the code of the dataset, the modules of `datsemshift`
+which create or compare the rows it keeps (`MODULES`), the files in `etc/`
+from which pylexibank creates the forms (`ETC`: replacements of lexemes and
+segments and orthography profiles) and the version of pylexibank; delete it
+after updating the reference catalogs.
+"""
+import gc
+import pickle
+import pathlib
+import hashlib
+
+import attr
+import pylexibank
+
+from datsemshift.fetch import write_atomic
+
+SNAPSHOT = "makecldf-snapshot.pickle"
+# concepts to rebuild in any case, by number or ID, one per line, as written
+# by the command `datsemshift.diff`
+CHANGED_CONCEPTS = "changed-concepts.txt"
+# the modules of datsemshift whose code the rows of the snapshot depend on
+MODULES = ["aggregate", "lexemes", "incremental", "normalize"]
+# the files in etc/ read by pylexibank when adding forms
+ETC = ["lexemes.[ct]sv", "segments.[ct]sv", "orthography.tsv", "orthography/*.tsv"]
+
+
+def snapshot_key(*paths, etc_dir=None):
+    """
+    Return a key for the snapshot, derived from the given source files, the
+    sources of `MODULES` and the files of `ETC` in `etc_dir`.
+    """
+    digest = hashlib.sha256(pylexibank.__version__.encode("utf-8"))
+    here = pathlib.Path(__file__).parent
+    for path in [here / "{0}.py".format(name) for name in MODULES] + list(paths):
+        digest.update(pathlib.Path(path).read_bytes())
+    if etc_dir:
+        etc_dir = pathlib.Path(etc_dir)
+        # files which are added or removed change the key as well
+        for path in sorted(p for pattern in ETC for p in etc_dir.glob(pattern)):
+            digest.update(path.relative_to(etc_dir).as_posix().encode("utf-8"))
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def digest(data):
+    """
+    Return a short digest of the `repr` of some data.
+    """
+    return hashlib.blake2b(repr(data).encode("utf-8"), digest_size=16).digest()
+
+
+@attr.s
+class Snapshot:
+    key = attr.ib()
+    # row ID -> (source concept ID, target concept ID, digest of the record)
+    records = attr.ib(default=attr.Factory(dict))
+    # concept ID -> (name, digest of the data without statistics, ParameterTable row,
+    # rows of the concept pairs)
+    concepts = attr.ib(default=attr.Factory(dict))
+    # Local_ID -> (digest of the data, FormTable row or None)
+    forms = attr.ib(default=attr.Factory(dict))
+
+    @staticmethod
+    def record(record):
+        """
+        The entry of a record `(LexemeRow, source concept, target concept, family)`.
+        """
+        return record[1], record[2], digest(record)
+
+    @classmethod
+    def load(cls, path, key):
+        """
+        Return the snapshot in `path`, or `None` if there is none for `key`.
+        """
+        path = pathlib.Path(path)
+        if not path.exists():
+            return None
+        # the garbage collector only slows down unpickling many small objects
+        gc.disable()
+        try:
+            with path.open("rb") as f:
+                snapshot = pickle.load(f)
+        finally:
+            gc.enable()
+        return snapshot if snapshot.key == key else None
+
+    def save(self, path):
+        gc.disable()
+        try:
+            write_atomic(
+                    pathlib.Path(path), pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
+        finally:
+            gc.enable()
+
+    def affected_concepts(self, records, concepts):
+        """
+        Return the IDs of the concepts whose rows must be rebuilt, given the
+        `records` and the data of the `concepts` of the current run, or `None`
+        if the rows were reordered.
+        """
+        old, new = self.records, {record[0].id: self.record(record) for record in records}
+        if [i for i in old if i in new] != [i for i in new if i in old]:
+            return None
+        affected = set()
+        for id_ in set(old) | set(new):
+            if old.get(id_) != new.get(id_):
+                for record in (old.get(id_), new.get(id_)):
+                    if record:
+                        affected.update(record[:2])
+        changed, renamed = set(), set()
+        for cid in set(concepts) | set(self.concepts):
+            if cid not in concepts or cid not in self.concepts:
+                changed.add(cid)
+                renamed.add(cid)
+            elif digest(concepts[cid]) != self.concepts[cid][1]:
+                changed.add(cid)
+                if concepts[cid]["Name"] != self.concepts[cid][0]:
+                    renamed.add(cid)
+        if renamed:
+            # the JSON of the pairs in ParameterTable has the names of the targets
+            for cid, (_, _, _, pairs) in self.concepts.items():
+                if any(pair["Target_ID"] in renamed for pair in pairs):
+                    affected.add(cid)
+        return affected | changed
@@ -0,0 +1,192 @@
+"""
+Instrumentation of the phases of `cmd_download` and `cmd_makecldf`.
+
+A `Report` records for each phase of a command the wall and CPU time in
+seconds, the peak of memory allocated by Python in bytes (if memory tracing is
+enabled, which slows the command down) and counters of pages, rows and other
+items:
+
+    >>> report = Report("download")
+    >>> with report.phase("languages") as phase:
+    ...     phase.count("rows", 10)
+
+Work which is interleaved with other work, like parsing pages while rows are
+written, is timed with `timed` (for calls of a function) and `iterate` (for
+the items of an iterator), which sum up the time of all calls as a phase of
+its own, e.g. `parse-shifts` for the parsing of the shift pages during the
+phase `shifts`.
+
+The report is written as JSON, with one section per command. Phases can be
+profiled with cProfile or pyinstrument, one file per phase in
+`profiles/<command>-<phase>.prof` (to be read with `pstats` or `snakeviz`)
+or `.html`. Only the main process is profiled and traced, not the workers
+parsing pages in parallel.
+"""
+import json
+import time
+import pathlib
+import datetime
+import contextlib
+import tracemalloc
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+class Phase:
+    def __init__(self, name):
+        self.name = name
+        self.wall, self.cpu, self.peak_memory = 0.0, 0.0, None
+        self.counters = {}
+
+    def count(self, key, n=1):
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def as_dict(self):
+        return {
+            "wall": round(self.wall, 6),
+            "cpu": round(self.cpu, 6),
+            "peak_memory": self.peak_memory,
+            "counters": self.counters}
+
+
+class Report:
+    """
+    Timings, memory and counters of the phases of one run of a command.
+
+    :param memory: Trace the memory allocated by Python with `tracemalloc`.
+    :param profile: Profile each phase with one of `PROFILERS` and write the \
+    profiles to `directory`.
+    """
+    def __init__(self, command, memory=False, profile=None, directory="profiles"):
+        if profile is not None and profile not in PROFILERS:
+            raise ValueError("unknown profiler {0}".format(profile))
+        self.command = command
+        self.memory = memory
+        self.profile = profile
+        self.directory = pathlib.Path(directory)
+        self.phases = {}
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self._wall, self._cpu = time.perf_counter(), time.process_time()
+        self.peak_memory = None
+        # memory may already be traced by the caller
+        self._tracing = memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+
+    def __getitem__(self, name):
+        if name not in self.phases:
+            self.phases[name] = Phase(name)
+        return self.phases[name]
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Context manager recording a phase, yielding the `Phase` for counters.
+        """
+        phase = self[name]
+        if self.memory:
+            tracemalloc.reset_peak()
+        with self._profiler(name):
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                yield phase
+            finally:
+                self.add(name, wall, cpu)
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            phase.peak_memory = max(phase.peak_memory or 0, peak)
+            self.peak_memory = max(self.peak_memory or 0, peak)
+
+    @contextlib.contextmanager
+    def _profiler(self, name):
+        if self.profile is None:
+            yield
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / "{0}-{1}".format(self.command, name)
+        if self.profile == "cprofile":
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(str(path.with_suffix(".prof")))
+        else:
+            # pyinstrument is optional
+            from pyinstrument import Profiler
+
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                path.with_suffix(".html").write_text(profiler.output_html(), encoding="utf-8")
+
+    def add(self, name, wall, cpu):
+        """
+        Add the time since `wall` and `cpu` (values of `time.perf_counter` and
+        `time.process_time`) to the phase `name`, e.g. for a phase which does
+        not end in the same function as it starts.
+        """
+        phase = self[name]
+        phase.wall += time.perf_counter() - wall
+        phase.cpu += time.process_time() - cpu
+        return phase
+
+    def timed(self, name, func):
+        """
+        Wrap `func` so that the time of all calls is added to the phase `name`.
+        """
+        def wrapper(*args, **kw):
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                return func(*args, **kw)
+            finally:
+                # the phase is created with the first call
+                self.add(name, wall, cpu).count("calls")
+        return wrapper
+
+    def iterate(self, name, iterable):
+        """
+        Yield the items of `iterable`, adding the time to get them to the phase `name`.
+        """
+        items = iter(iterable)
+        while True:
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                phase = self.add(name, wall, cpu)
+            phase.count("items")
+            yield item
+
+    def as_dict(self):
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "wall": round(time.perf_counter() - self._wall, 6),
+            "cpu": round(time.process_time() - self._cpu, 6),
+            "peak_memory": self.peak_memory,
+            "phases": {name: phase.as_dict() for name, phase in self.phases.items()}}
+
+    def close(self):
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = self.memory = False
+
+    def save(self, path):
+        """
+        Write the report to the section of the command in the JSON file `path`,
+        keeping the sections of other commands.
+        """
+        path = pathlib.Path(path)
+        data = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+        data[self.command] = self.as_dict()
+        self.close()
+        path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+        return data[self.command]
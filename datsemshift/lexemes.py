@@ -0,0 +1,266 @@
+"""
+Lexemes of `raw/lexemes.tsv` and the graph of the lexemes linked by semantic
+shifts.
+
+`read_lexemes` streams the rows of `raw/lexemes.tsv` as tuples of the columns
+used by `cmd_makecldf`, with type and direction of the shift coded as small
+integers, instead of one dictionary of all columns per row.
+
+A lexeme is identified by concept, language and word. Each realization of a
+shift of type Polysemy or Derivation adds a directed edge from the lexeme
+with the source meaning to the lexeme with the target meaning (or the other
+way round for the direction "←") and an occurrence of both lexemes. Nodes are
+interned to integers, node attributes are kept in parallel lists and edges
+and occurrences in compressed sparse row (CSR) arrays: the outgoing edges of
+node `i` are `targets[indptr[i]:indptr[i + 1]]`, the incoming edges
+`sources[in_indptr[i]:in_indptr[i + 1]]`, both with the types of the shifts
+in `relations` and `in_relations`.
+
+Once frozen, the nodes are numbered in the order in which `cmd_makecldf`
+writes the forms, node `i` being the form with `Local_ID` `i + 1`.
+"""
+import csv
+import operator
+import collections
+from array import array
+
+from datsemshift.aggregate import TYPES, Interner
+
+# codes of the directions of a shift
+FORWARD, BACKWARD, UNDIRECTED, OTHER = range(4)
+DIRECTIONS = {"→": FORWARD, "←": BACKWARD, "?": UNDIRECTED, "-": UNDIRECTED, "—": UNDIRECTED}
+
+# columns of raw/lexemes.tsv read by `read_lexemes`, besides Type and Direction
+COLUMNS = [
+    "ID", "Shift_ID", "Source_Concept", "Target_Concept", "Source_Language",
+    "Source_Language_ID", "Target_Language_ID", "Source_Word", "Target_Word",
+    "Source_Meaning", "Target_Meaning"]
+
+LexemeRow = collections.namedtuple(
+        "LexemeRow", [c.lower() for c in COLUMNS] + ["type", "direction"])
+
+
+def read_lexemes(path, types=TYPES):
+    """
+    Stream the rows of `raw/lexemes.tsv` with shifts of the given types.
+
+    :return: Generator of `LexemeRow` tuples, `type` is the index of the type \
+    in `datsemshift.aggregate.TYPES`, `direction` one of `FORWARD`, \
+    `BACKWARD`, `UNDIRECTED` or `OTHER`.
+    """
+    codes = {type_: TYPES.index(type_) for type_ in types}
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = csv.reader(f, delimiter="\t")
+        header = next(rows)
+        project = operator.itemgetter(*[header.index(c) for c in COLUMNS])
+        type_, direction = header.index("Type"), header.index("Direction")
+        make = LexemeRow._make
+        for row in rows:
+            code = codes.get(row[type_])
+            if code is not None:
+                yield make(project(row) + (code, DIRECTIONS.get(row[direction], OTHER)))
+
+
+def _group(keys, n):
+    """
+    Stable counting sort of the positions of `keys` (integers below `n`).
+
+    :return: `(indptr, order)`, the positions with key `k` are \
+    `order[indptr[k]:indptr[k + 1]]`.
+    """
+    indptr = array("l", [0]) * (n + 1)
+    for key in keys:
+        indptr[key + 1] += 1
+    for i in range(n):
+        indptr[i + 1] += indptr[i]
+    fill, order = array("l", indptr), array("l", [0]) * len(keys)
+    for pos, key in enumerate(keys):
+        order[fill[key]] = pos
+        fill[key] += 1
+    return indptr, order
+
+
+class LexemeGraph:
+    def __init__(self):
+        self.nodes = Interner()
+        self.frozen = False
+        # node attributes
+        self.concepts, self.languages, self.words = [], [], []
+        # edges in the order in which they were added
+        self.edge_source, self.edge_target = array("l"), array("l")
+        self.edge_type = array("B")
+        # rank of a node among the sources, in the order of first appearance
+        self.source_rank = array("l")
+        self._sources = 0
+        # occurrences of the lexemes
+        self.occ_node = array("l")
+        self.occ_type = array("B")
+        self.occ_lexeme, self.occ_meaning, self.occ_shift = [], [], []
+
+    def __len__(self):
+        return len(self.concepts)
+
+    def node(self, concept, language, word):
+        """
+        Return the code of a lexeme, creating it if needed.
+        """
+        code = self.nodes((concept, language, word))
+        if code == len(self.concepts):
+            self.concepts.append(concept)
+            self.languages.append(language)
+            self.words.append(word)
+            self.source_rank.append(-1)
+        return code
+
+    def _occurrence(self, node, type_, lexeme, meaning, shift):
+        self.occ_node.append(node)
+        self.occ_type.append(type_)
+        self.occ_lexeme.append(lexeme)
+        self.occ_meaning.append(meaning)
+        self.occ_shift.append(shift)
+
+    def add(self, source, target, type_, lexeme, shift, source_meaning, target_meaning):
+        """
+        Add the realization `lexeme` of shift `shift` between two lexemes given
+        as `(concept, language, word)`, `type_` being the index in `TYPES`.
+        """
+        if self.frozen:
+            raise ValueError("graph is frozen")
+        source, target, t = self.node(*source), self.node(*target), type_
+        if self.source_rank[source] == -1:
+            self.source_rank[source] = self._sources
+            self._sources += 1
+        self.edge_source.append(source)
+        self.edge_target.append(target)
+        self.edge_type.append(t)
+        self._occurrence(source, t, lexeme, source_meaning, shift)
+        self._occurrence(target, t, lexeme, target_meaning, shift)
+
+    def add_row(self, row, source_concept=None, target_concept=None):
+        """
+        Add a `LexemeRow`. The concept IDs default to the concepts of the row.
+        """
+        source = (
+                source_concept or row.source_concept,
+                row.source_language_id,
+                row.source_word)
+        target = (
+                target_concept or row.target_concept,
+                row.target_language_id,
+                row.target_word)
+        source_meaning, target_meaning = row.source_meaning, row.target_meaning
+        if row.direction == BACKWARD:
+            source, target = target, source
+            source_meaning, target_meaning = target_meaning, source_meaning
+        self.add(source, target, row.type, row.id, row.shift_id,
+                 source_meaning, target_meaning)
+
+    @classmethod
+    def from_rows(cls, rows, concept=None):
+        """
+        Build and freeze the graph of the rows of `raw/lexemes.tsv` (see
+        `read_lexemes`), mapping the concepts with the function `concept` if given.
+        """
+        graph = cls()
+        for row in rows:
+            if concept:
+                graph.add_row(row, concept(row.source_concept), concept(row.target_concept))
+            else:
+                graph.add_row(row)
+        return graph.freeze()
+
+    def freeze(self):
+        """
+        Number the nodes in the order of the forms and build the CSR arrays.
+
+        Forms are numbered by walking the sources in the order of their first
+        appearance, each followed by its targets, so that the IDs do not
+        change with respect to the dictionaries formerly used.
+        """
+        if self.frozen:
+            return self
+        n = len(self)
+        # edges grouped by source, in the order of first appearance of the source
+        _, edges = _group(
+                array("l", (self.source_rank[s] for s in self.edge_source)), self._sources)
+        number, count = array("l", [-1]) * n, 0
+        for edge in edges:
+            for node in (self.edge_source[edge], self.edge_target[edge]):
+                if number[node] == -1:
+                    number[node], count = count, count + 1
+        # nodes with codes in the new order
+        order = array("l", [0]) * n
+        for node in range(n):
+            order[number[node]] = node
+        self.concepts = [self.concepts[node] for node in order]
+        self.languages = [self.languages[node] for node in order]
+        self.words = [self.words[node] for node in order]
+        self.nodes.values = [self.nodes.values[node] for node in order]
+        self.nodes.codes = {value: code for code, value in enumerate(self.nodes.values)}
+        self.source_rank = array("l", (self.source_rank[node] for node in order))
+
+        source = array("l", (number[self.edge_source[e]] for e in edges))
+        target = array("l", (number[self.edge_target[e]] for e in edges))
+        types = array("B", (self.edge_type[e] for e in edges))
+        self.edge_source, self.edge_target, self.edge_type = source, target, types
+        self.indptr, out = _group(source, n)
+        self.targets = array("l", (target[e] for e in out))
+        self.relations = array("B", (types[e] for e in out))
+        self.in_indptr, in_ = _group(target, n)
+        self.sources = array("l", (source[e] for e in in_))
+        self.in_relations = array("B", (types[e] for e in in_))
+
+        self.occ_node = array("l", (number[node] for node in self.occ_node))
+        self.occ_indptr, occ = _group(self.occ_node, n)
+        self.occ_node = array("l", (self.occ_node[o] for o in occ))
+        self.occ_type = array("B", (self.occ_type[o] for o in occ))
+        self.occ_lexeme = [self.occ_lexeme[o] for o in occ]
+        self.occ_meaning = [self.occ_meaning[o] for o in occ]
+        self.occ_shift = [self.occ_shift[o] for o in occ]
+        self.frozen = True
+        return self
+
+    def out_edges(self, node):
+        """
+        Iterate over the `(target, type)` of the shifts from a lexeme.
+        """
+        for e in range(self.indptr[node], self.indptr[node + 1]):
+            yield self.targets[e], TYPES[self.relations[e]]
+
+    def in_edges(self, node):
+        """
+        Iterate over the `(source, type)` of the shifts to a lexeme.
+        """
+        for e in range(self.in_indptr[node], self.in_indptr[node + 1]):
+            yield self.sources[e], TYPES[self.in_relations[e]]
+
+    def occurrences(self, node):
+        """
+        Return the `(lexeme, meaning, shift, type)` of all occurrences of a lexeme.
+        """
+        return [
+            (self.occ_lexeme[o], self.occ_meaning[o], self.occ_shift[o],
+             TYPES[self.occ_type[o]])
+            for o in range(self.occ_indptr[node], self.occ_indptr[node + 1])]
+
+    def forms(self):
+        """
+        Yield the data of the forms, in the order of their `Local_ID`.
+
+        Words are returned as given, `Source_Lexemes` are the `Local_ID`s of
+        the lexemes with shifts to a form.
+        """
+        for node in range(len(self)):
+            lo, hi = self.occ_indptr[node], self.occ_indptr[node + 1]
+            in_lo, in_hi = self.in_indptr[node], self.in_indptr[node + 1]
+            yield dict(
+                    Language_ID=self.languages[node],
+                    Parameter_ID=self.concepts[node],
+                    Local_ID=node + 1,
+                    Form=self.words[node],
+                    Concepts_in_Source=self.occ_meaning[lo:hi],
+                    IDS_in_Source=self.occ_lexeme[lo:hi],
+                    Shifts=self.occ_shift[lo:hi],
+                    Shift_Types=[TYPES[t] for t in self.occ_type[lo:hi]],
+                    Source_Lexemes=[s + 1 for s in self.sources[in_lo:in_hi]],
+                    Source_Relations=[TYPES[t] for t in self.in_relations[in_lo:in_hi]])
@@ -0,0 +1,173 @@
+"""
+Resumable, incremental refresh of the raw pages.
+
+The manifest `raw/raw-data/manifest.tsv` records for each downloaded page the
+URL, the time of the last fetch, the validators sent by the server (ETag and
+Last-Modified) and the SHA256 hash of the content. A refresh sends conditional
+requests for unchanged files and appends each completed page to the journal
+`raw/raw-data/manifest-partial.tsv`, so that an interrupted refresh can be
+resumed. When all pages were fetched, the journal replaces the manifest and
+the pages which are new, changed or gone are written to
+`raw/raw-data/changes.tsv`. Pages which are gone are removed from the store
+and kept in the manifest with the status `gone`.
+"""
+import csv
+import pathlib
+import hashlib
+import datetime
+import threading
+
+from csvw.dsv import UnicodeWriter, reader
+
+from datsemshift.fetch import FetchError
+from datsemshift.archive import DirectoryStore
+
+COLUMNS = ["Page", "URL", "Fetched", "ETag", "Last_Modified", "SHA256", "Status"]
+
+
+def sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def page_id(page):
+    """
+    The ID of a page is the file name without suffix, e.g. `shift0001`.
+    """
+    return page.split("/")[-1].rsplit(".", 1)[0]
+
+
+class Manifest:
+    """
+    Manifest of the pages in `path`, which are read from and written to `store`
+    (see `datsemshift.archive`), the directory itself by default.
+    """
+    def __init__(self, path, store=None):
+        self.dir = pathlib.Path(path)
+        self.store = store or DirectoryStore(self.dir)
+        self.path = self.dir / "manifest.tsv"
+        self.journal = self.dir / "manifest-partial.tsv"
+        self.changes = self.dir / "changes.tsv"
+        self.entries = self.read(self.path)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def read(path):
+        if not path.exists():
+            return {}
+        # rows of a journal cut off by a crash lack the final columns
+        return {row["Page"]: row for row in reader(path, delimiter="\t", dicts=True)
+                if row.get("Status")}
+
+    def _record(self, row):
+        with self._lock:
+            new = not self.journal.exists()
+            with open(self.journal, "a", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+                if new:
+                    writer.writerow(COLUMNS)
+                writer.writerow([row[c] for c in COLUMNS])
+                f.flush()
+
+    def fetch(self, fetcher, url, name):
+        """
+        Fetch one page, sending a conditional request if the stored page is
+        the one recorded in the manifest.
+        """
+        old = self.entries.get(name)
+        current = sha256(self.store.read(name)) if self.store.exists(name) else None
+        headers = {}
+        if old and old["Status"] == "ok" and current == old["SHA256"]:
+            if old["ETag"]:
+                headers["If-None-Match"] = old["ETag"]
+            if old["Last_Modified"]:
+                headers["If-Modified-Since"] = old["Last_Modified"]
+        row = dict(
+                Page=name,
+                URL=url,
+                Fetched=datetime.datetime.now(datetime.timezone.utc).isoformat(
+                    timespec="seconds"),
+                ETag="",
+                Last_Modified="",
+                SHA256="",
+                Status="ok")
+        try:
+            status, response, content = fetcher.request(url, headers=headers)
+        except FetchError as e:
+            if e.status != 404:
+                raise
+            row["Status"] = "gone"
+            # the page is not parsed again by cmd_download
+            if self.store.exists(name):
+                self.store.remove(name)
+            self._record(row)
+            return row
+        if status == 304:
+            row["SHA256"] = current
+        else:
+            row["SHA256"] = sha256(content)
+            if row["SHA256"] != current:
+                self.store.write(name, content)
+        row["ETag"] = response.get("ETag", "") or (old or {}).get("ETag", "")
+        row["Last_Modified"] = response.get("Last-Modified", "") or (
+                old or {}).get("Last_Modified", "")
+        self._record(row)
+        return row
+
+    def refresh(self, fetcher, jobs, desc="downloading"):
+        """
+        Fetch all `(url, name)` jobs which were not completed by an interrupted
+        earlier refresh.
+
+        :return: A dictionary with the page IDs which are `new`, `changed` or \
+        `gone`, or `None` if some pages could not be fetched. In that case the \
+        journal is kept and the next refresh resumes from it.
+        """
+        jobs = list(jobs)
+        done = self.read(self.journal)
+        todo = [(url, name) for url, name in jobs if name not in done]
+        if fetcher.log and done:
+            fetcher.log.info("resuming refresh, skipping {0} completed pages".format(
+                len(done)))
+        _, errors = fetcher.run(
+                [(fetcher, url, name) for url, name in todo], self.fetch, desc=desc)
+        if errors:
+            if fetcher.log:
+                fetcher.log.warning(
+                        "refresh incomplete, {0} pages failed, run again to resume".format(
+                            len(errors)))
+            return None
+        return self.finish({name for _, name in jobs})
+
+    def finish(self, pages):
+        """
+        Replace the manifest by the journal and write the change report.
+        """
+        entries = self.read(self.journal)
+        changes = {"new": [], "changed": [], "gone": []}
+        for page in sorted(set(entries) | set(self.entries)):
+            old, new = self.entries.get(page), entries.get(page)
+            if not new:
+                if page in pages or old["Status"] != "ok":
+                    continue
+                changes["gone"].append(page)
+                continue
+            if new["Status"] == "ok":
+                if not old or old["Status"] != "ok":
+                    changes["new"].append(page)
+                elif old["SHA256"] != new["SHA256"]:
+                    changes["changed"].append(page)
+            elif old and old["Status"] == "ok":
+                changes["gone"].append(page)
+        with UnicodeWriter(self.path, delimiter="\t") as writer:
+            writer.writerow(COLUMNS)
+            for page in sorted(entries):
+                writer.writerow([entries[page][c] for c in COLUMNS])
+        with UnicodeWriter(self.changes, delimiter="\t") as writer:
+            writer.writerow(["ID", "Page", "Status"])
+            for status, pages_ in changes.items():
+                for page in pages_:
+                    writer.writerow([page_id(page), page, status])
+        if self.journal.exists():
+            self.journal.unlink()
+        self.entries = entries
+        return {status: [page_id(p) for p in pages_] for status, pages_ in changes.items()}
@@ -0,0 +1,100 @@
+"""
+Mapping of glosses to Concepticon with pysem, as done by `raw/map.py`.
+
+`map_glosses` maps all glosses in one call of `pysem.to_concepticon`, which
+sets up the matcher only once, or in chunks in a pool of worker processes.
+The matches are kept in a `MappingCache`, a SQLite database keyed by gloss
+and version of pysem (which comes with the Concepticon data it maps to), so
+that only new glosses are mapped when the concepts are mapped again, and all
+glosses are mapped again with a new version of pysem. A cache should only be
+used with one value of `max_matches`, as set in its version.
+
+Requires pysem, install with `pip install -e .[mapping]`.
+"""
+import json
+import pathlib
+import sqlite3
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import pysem
+from pysem import to_concepticon
+
+
+def mapping_version(max_matches=1):
+    return "pysem-{0}:{1}".format(pysem.__version__, max_matches)
+
+
+class MappingCache:
+    def __init__(self, path, version=None):
+        self.path = pathlib.Path(path)
+        self.version = version or mapping_version()
+        self.hits, self.misses = 0, 0
+        self.db = sqlite3.connect(str(self.path))
+        self.db.execute(
+                "CREATE TABLE IF NOT EXISTS mappings ("
+                "gloss TEXT, version TEXT, matches TEXT, PRIMARY KEY (gloss, version))")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def get(self, glosses):
+        """
+        Return the cached matches of those of the `glosses` which are in the cache.
+        """
+        out = {}
+        for gloss in glosses:
+            row = self.db.execute(
+                    "SELECT matches FROM mappings WHERE gloss = ? AND version = ?",
+                    (gloss, self.version)).fetchone()
+            if row:
+                out[gloss] = [tuple(match) for match in json.loads(row[0])]
+        return out
+
+    def put(self, matches):
+        self.db.executemany(
+                "INSERT OR REPLACE INTO mappings VALUES (?, ?, ?)",
+                ((gloss, self.version, json.dumps(items)) for gloss, items in matches.items()))
+        self.db.commit()
+
+
+def _map(glosses, max_matches=1):
+    return to_concepticon([{"gloss": gloss} for gloss in glosses], max_matches=max_matches)
+
+
+def map_glosses(glosses, cache=None, workers=1, chunksize=500, max_matches=1):
+    """
+    Map glosses to Concepticon, in one batch or in chunks of `chunksize`
+    glosses with a pool of worker processes if `workers` > 1.
+
+    :return: Dictionary with the list of matches of each gloss as returned by \
+    `pysem.to_concepticon`, tuples `(ID, gloss, part of speech, similarity)`.
+    """
+    glosses = list(dict.fromkeys(gloss for gloss in glosses if gloss))
+    matches = cache.get(glosses) if cache else {}
+    todo = [gloss for gloss in glosses if gloss not in matches]
+    if todo:
+        if workers > 1:
+            chunks = [todo[i:i + chunksize] for i in range(0, len(todo), chunksize)]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                fresh = {}
+                for result in executor.map(
+                        _map, chunks, itertools.repeat(max_matches, len(chunks))):
+                    fresh.update(result)
+        else:
+            fresh = _map(todo, max_matches=max_matches)
+        fresh = {gloss: [tuple(match) for match in fresh[gloss]] for gloss in todo}
+        if cache:
+            cache.put(fresh)
+        matches.update(fresh)
+    if cache:
+        cache.hits += len(glosses) - len(todo)
+        cache.misses += len(todo)
+    return matches
@@ -0,0 +1,44 @@
+"""
+Normalization of the glosses, language names and forms of the raw data.
+
+The same few values (language names, types, meanings, concepts) are cleaned
+up again for every realization and every cell of the TSV files. The functions
+of this module do the clean-up of the entities and markers in one pass of a
+regular expression compiled from the table `REPLACEMENTS`, remember the
+results of the most recent `CACHE_SIZE` values and intern them, so that
+repeated values are cleaned up once and share one string object.
+
+`refine_gloss` removes the angle brackets of concepts like `&lt;animal&gt;` and
+the marker `ZQ` and replaces the apostrophe entity, `unescape` replaces all
+HTML entities. The former chain of replacements gave different results only
+for strings in which removing one entity or marker creates another, like
+`Z&lt;Q`, which do not occur in the data.
+"""
+import re
+import sys
+import html
+import functools
+
+REPLACEMENTS = {"&lt;": "", "&gt;": "", "&#39;": "'", "ZQ": ""}
+PATTERN = re.compile("|".join(re.escape(key) for key in REPLACEMENTS))
+CACHE_SIZE = 1 << 16
+
+
+def _replace(match):
+    return REPLACEMENTS[match.group(0)]
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def refine_gloss(gloss):
+    if "&" in gloss or "ZQ" in gloss:
+        gloss = PATTERN.sub(_replace, gloss)
+    return sys.intern(gloss)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def unescape(text):
+    return sys.intern(html.unescape(text))
+
+
+def unescape_row(row):
+    return [unescape(e) if isinstance(e, str) else e for e in row]
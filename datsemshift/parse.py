@@ -0,0 +1,244 @@
+"""
+Single-pass parser for the shift pages of the DatSemShift website.
+
+A shift page consists of a header with source concept, direction and target
+concept and a number of realization tables, each with one row per property
+(Type, Language, Lexeme, Meaning, Direction). Instead of matching a number of
+DOTALL regular expressions against the full page and again against each
+table, the parser walks once over the relevant tags of the page and collects
+the cells of the realization tables with a small state machine. The results
+are identical to those of the regular expressions formerly used in
+`cmd_download`: cell contents are returned as raw HTML and a property row only
+counts if a new `<tr>` was opened after the last row of the same kind.
+"""
+import re
+import pathlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import attr
+
+# bump the version whenever the records returned by the parsers change
+PARSER_VERSION = 2
+
+TOKEN = re.compile(r"</?(?:div|span|table|th|tr|td)[^>]*>")
+TITLE = re.compile(r"<span[^>]*>(.*?)</span>.*?Realization (.*?)$", re.DOTALL)
+
+# properties are given as (kind, label pattern, td tag of the label, cells)
+PROPERTIES = [
+    ("type", re.compile("Type"), '<td colspan="2">', 1),
+    ("languages", re.compile("(Language *[12]*)"), '<td colspan="2">', 1),
+    ("lexemes", re.compile("(Lexeme *[12]*)"), '<td colspan="2">', 1),
+    ("meanings", re.compile("(Meaning *[12]*)"), None, 2),
+    ("direction", re.compile("Direction"), None, 2),
+]
+
+
+@attr.s(slots=True)
+class Realization:
+    title = attr.ib(default="")
+    status = attr.ib(default="")
+    type = attr.ib(default="")
+    direction = attr.ib(default="?")
+    languages = attr.ib(default=attr.Factory(list))
+    lexemes = attr.ib(default=attr.Factory(list))
+    meanings = attr.ib(default=attr.Factory(list))
+    # number of cells matched by the label patterns of PROPERTIES
+    matches = attr.ib(default=0)
+
+
+@attr.s(slots=True)
+class ShiftPage:
+    """
+    Parsed content of one shift page. Concepts are stripped as in the header,
+    the values of languages, lexemes and meanings are `(label, value)` tuples
+    with the raw content of the table cells.
+    """
+    id = attr.ib()
+    source = attr.ib()
+    direction = attr.ib()
+    target = attr.ib()
+    realizations_count = attr.ib()
+    realizations = attr.ib(default=attr.Factory(list))
+
+
+class _Matcher:
+    """
+    Follows one property through the rows of a realization table, mimicking
+    `re.findall('<tr>.*?<td>LABEL</td>.*?<td[^>]*>(.*?)</td>.*?</tr>', ...)`.
+    """
+    __slots__ = ("kind", "label", "tag", "cells", "ready", "state", "match", "values")
+
+    def __init__(self, kind, label, tag, cells):
+        self.kind, self.label, self.tag, self.cells = kind, label, tag, cells
+        self.ready, self.state, self.match, self.values = False, 0, None, []
+
+    def row(self):
+        if not self.state:
+            self.ready = True
+
+    def cell(self, tag, content):
+        if self.state == 0:
+            if self.ready and (self.tag is None or tag == self.tag):
+                label = self.label.fullmatch(content)
+                if label:
+                    self.match, self.state = label.group(0), 1
+        elif self.state == 1:
+            self.values.append((self.match, content))
+            self.state = 2 if self.cells == 2 else 3
+        elif self.state == 2:
+            self.state = 3
+
+    def end_row(self):
+        if self.state == 3:
+            self.ready, self.state = False, 0
+
+
+def parse_title(title):
+    title = title.strip()
+    if "<span" in title:
+        status, title = TITLE.findall(title)[0]
+    else:
+        status = ""
+    return status.strip(), title.strip()
+
+
+def parse_shift_page(data, shift_id):
+    """
+    Parse the HTML of a shift page.
+
+    :return: `ShiftPage` instance or `None` if the page has no shift header.
+    """
+    header, items, number = None, [], []
+    realizations = []
+    span = None
+    table = matchers = cell = title = None
+
+    for m in TOKEN.finditer(data):
+        tag = m.group(0)
+        if header is None:
+            if tag == '<div class="shift__header">':
+                header = False
+        elif header is False:
+            if tag == "</div>":
+                header, span = True, None
+            elif span is not None:
+                if tag == "</span>":
+                    span[0].append(data[span[1]:m.start()])
+                    span = None
+            elif tag.startswith('<span class="shift__header_item"'):
+                span = (items, m.end())
+            elif tag == '<span class="realization_number">':
+                span = (number, m.end())
+
+        if table is None:
+            if tag.startswith('<table class="realization__table"'):
+                table, title = Realization(), None
+                matchers = [_Matcher(*p) for p in PROPERTIES]
+            continue
+        if tag == "</table>":
+            for matcher in matchers:
+                table.matches += len(matcher.values)
+                if matcher.values:
+                    if matcher.kind in ("type", "direction"):
+                        setattr(table, matcher.kind, matcher.values[0][1])
+                    else:
+                        setattr(table, matcher.kind, matcher.values)
+            table.type = table.type.strip()
+            table.status, table.title = parse_title(title or "")
+            realizations.append(table)
+            table = cell = None
+        elif tag == "<tr>":
+            for matcher in matchers:
+                matcher.row()
+        elif tag == "</tr>":
+            for matcher in matchers:
+                matcher.end_row()
+        elif cell is not None:
+            # cell is a tuple (closing tag, opening tag, start of content)
+            if tag == cell[0]:
+                content = data[cell[2]:m.start()]
+                if tag == "</th>":
+                    title = content
+                else:
+                    for matcher in matchers:
+                        matcher.cell(cell[1], content)
+                cell = None
+        elif tag.startswith("<td"):
+            cell = ("</td>", tag, m.end())
+        elif title is None and tag.startswith("<th"):
+            title, cell = "", ("</th>", tag, m.end())
+
+    if not header:
+        return None
+    source, direction, target = items
+    return ShiftPage(
+            id=shift_id,
+            source=source.strip(),
+            direction=direction.strip(),
+            target=target.strip(),
+            realizations_count=number[0].replace(
+                " realizations", "").replace(" realization", "").strip(),
+            realizations=realizations)
+
+
+def parse_language_page(data):
+    """
+    Return the rows `(ID, Name, Glottocode, Family, SubGroup, Words)` of the
+    language overview.
+    """
+    rows = []
+    for lng in re.findall("<tr[^>]*>(.*?)</tr>", data, re.DOTALL):
+        tabs = re.findall("<td[^>]*>(.*?)</td>", lng)
+        if tabs:
+            rows.append((
+                tabs[1].strip(), tabs[2].strip(), tabs[3].strip(),
+                tabs[4].strip(), tabs[5].strip(), tabs[6].strip()))
+    return rows
+
+
+def parse_concept_page(data):
+    """
+    Return the raw cells `(gloss, definition, alias, domain)` of a meaning page.
+    """
+    rows = []
+    for row in re.findall("<tr[^>]*?>(.*?)</tr>", data, re.DOTALL):
+        if "<td" in row:
+            tabs = re.findall("<td[^>]*>(.*?)</td>", row, re.DOTALL)
+            if tabs:
+                rows.append((tabs[0], tabs[1], tabs[2], tabs[3]))
+    return rows
+
+
+def parse_shift_file(store, name):
+    return parse_shift_page(
+            store.read(name).decode("utf-8"), pathlib.PurePosixPath(name).stem)
+
+
+def parse_language_file(store, name):
+    return parse_language_page(store.read(name).decode("utf-8"))
+
+
+def parse_concept_file(store, name):
+    return parse_concept_page(store.read(name).decode("utf-8"))
+
+
+def parse_files(func, store, names, workers=1, chunksize=32):
+    """
+    Apply one of the `parse_*_file` functions to the pages `names` of a store
+    (see `datsemshift.archive`), using a pool of worker processes if `workers` > 1.
+
+    Records are yielded in the order of `names`, so that the result does not
+    depend on the number of workers.
+    """
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(
+                    func, itertools.repeat(store, len(names)), names, chunksize=chunksize)
+    else:
+        for name in names:
+            yield func(store, name)
+
+
+def parse_shift_files(store, names, workers=1, chunksize=32):
+    return parse_files(parse_shift_file, store, names, workers=workers, chunksize=chunksize)
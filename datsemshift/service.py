@@ -0,0 +1,340 @@
+"""
+Local HTTP service answering queries on the CLDF data with JSON.
+
+The `Index` reads the concepts, languages, forms and concept pairs of the
+CLDF dataset once and keeps them in dictionaries keyed by ID, with the
+shifts of each language and the forms derived from each form precomputed.
+The `Service` answers GET requests on an asyncio server:
+
+- `/concepts/<ID>/shifts?kind=all|directed|undirected&weight=<weight>&k=<n>`:
+  the concepts to which a concept shifts, with the counts of the pair, the
+  heaviest first,
+- `/languages/<ID>/shifts?concept=<ID>` and `/families/<name>/shifts`: the
+  shifts attested in a language or family, with their forms, optionally only
+  those with forms of a concept,
+- `/forms/<ID>/chain?direction=sources|derived&depth=<n>`: the source
+  lexemes of a form, their source lexemes and so on (or the forms derived
+  from it), up to `depth` links away,
+- `/stats`: the size of the index and the hits and misses of the cache.
+
+Unknown concepts, languages, families and forms are answered with 404,
+unknown or invalid query parameters (including negative `k` and `depth`)
+with 400 and errors of the service itself with 500.
+
+Responses of successful queries are kept in an LRU cache of `cache_size`
+entries. Connections are kept alive, so that clients can send many queries
+over one connection.
+
+    $ cldfbench datsemshift.serve --port 8765
+    $ curl http://127.0.0.1:8765/concepts/3607_bitter/shifts?k=5
+"""
+import re
+import csv
+import json
+import asyncio
+import collections
+import urllib.parse
+
+from datsemshift.aggregate import PAIR_TABLE, WEIGHTS, read_pairs
+from datsemshift.database import tables
+STATUS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    500: "Internal Server Error"}
+
+
+class QueryError(Exception):
+    """
+    Error of a query, answered with the HTTP status `status`.
+    """
+    status = 400
+
+
+class BadRequest(QueryError):
+    status = 400
+
+
+class NotFound(QueryError):
+    status = 404
+
+
+def _split(value, separator=" "):
+    return value.split(separator) if value else []
+
+
+def _read(path):
+    with path.open(encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+class Index:
+    """
+    The data of a CLDF dataset in memory.
+
+    :ivar pairs: Dictionary with the list of pairs of each concept, as \
+    dictionaries with `ID`, `Name`, `Directed`, the `WEIGHTS` and `Shifts`.
+    :ivar shifts: Dictionary with a dictionary of the forms of each shift per \
+    language, as `(form, shift type)` tuples.
+    """
+    def __init__(self, metadata):
+        # the JSON of concepts with many links exceeds the default limit
+        csv.field_size_limit(2 ** 31 - 1)
+        paths = {name: path for name, path, _ in tables(metadata)}
+        self.concepts, self.pairs = {}, collections.defaultdict(list)
+        rows = list(_read(paths["ParameterTable"]))
+        for row in rows:
+            self.concepts[row["ID"]] = {
+                key: row.get(key) or "" for key in
+                ["ID", "Name", "Concepticon_ID", "Concepticon_Gloss"]}
+        for pair in read_pairs(rows, paths.get(PAIR_TABLE)):
+            self.pairs[pair["Source_ID"]].append(self._pair(pair))
+        # the JSON of the pairs is not needed anymore
+        del rows
+
+        self.languages = {row["ID"]: {
+            key: row.get(key) or "" for key in ["ID", "Name", "Glottocode", "Family"]}
+            for row in _read(paths["LanguageTable"])}
+        self.families = collections.defaultdict(list)
+        for language in self.languages.values():
+            self.families[language["Family"]].append(language["ID"])
+
+        self.forms, self.sources = {}, {}
+        self.derived = collections.defaultdict(list)
+        self.shifts = collections.defaultdict(lambda: collections.defaultdict(list))
+        local_ids = {}
+        for row in _read(paths["FormTable"]):
+            form = {key: row[key] for key in ["ID", "Language_ID", "Parameter_ID", "Form"]}
+            self.forms[row["ID"]] = form
+            local_ids[row["Local_ID"]] = row["ID"]
+            self.sources[row["ID"]] = list(zip(
+                _split(row["Source_Lexemes"]), _split(row["Source_Relations"])))
+            for shift, type_ in zip(_split(row["Shifts"]), _split(row["Shift_Types"])):
+                self.shifts[row["Language_ID"]][shift].append((row["ID"], type_))
+        # the source lexemes are given by their local IDs
+        for form, sources in self.sources.items():
+            sources[:] = [(local_ids[source], relation) for source, relation in sources
+                          if source in local_ids]
+            for source, relation in sources:
+                self.derived[source].append((form, relation))
+
+    def _pair(self, pair):
+        return dict(
+            {weight: pair[weight] for weight in WEIGHTS},
+            ID=pair["Target_ID"],
+            Name=self.concepts.get(pair["Target_ID"], {}).get("Name", ""),
+            Directed=pair["Directed"],
+            Shifts=sorted(set(pair["Polysemy_Shifts"] + pair["Derivation_Shifts"])))
+
+    def concept_shifts(self, concept, kind="all", weight="PolysemyByFamily", k=None):
+        if concept not in self.concepts:
+            raise NotFound("unknown concept {0}".format(concept))
+        if kind not in ("all", "directed", "undirected") or weight not in WEIGHTS:
+            raise BadRequest("unknown kind or weight")
+        pairs = [
+            pair for pair in self.pairs.get(concept, [])
+            if kind == "all" or pair["Directed"] == (kind == "directed")]
+        pairs.sort(key=lambda pair: (-pair[weight], pair["ID"], not pair["Directed"]))
+        return {"concept": self.concepts[concept], "shifts": pairs[:k]}
+
+    def language_shifts(self, languages, concept=None):
+        out = collections.defaultdict(list)
+        for language in languages:
+            for shift, forms in self.shifts.get(language, {}).items():
+                for form, type_ in forms:
+                    form = self.forms[form]
+                    if concept is None or form["Parameter_ID"] == concept:
+                        out[shift].append(dict(form, Shift_Type=type_))
+        return [{"Shift_ID": shift, "Forms": forms} for shift, forms in sorted(out.items())]
+
+    def chain(self, form, direction="sources", depth=3):
+        """
+        Return the forms linked to a form by source lexemes, breadth first,
+        with the number of links from the form and the form they are linked to.
+        """
+        if form not in self.forms:
+            raise NotFound("unknown form {0}".format(form))
+        if direction not in ("sources", "derived"):
+            raise BadRequest("unknown direction {0}".format(direction))
+        links = self.sources if direction == "sources" else self.derived
+        seen, frontier, out = {form}, [form], []
+        for hop in range(1, depth + 1):
+            following = []
+            for current in frontier:
+                for other, relation in links.get(current, []):
+                    if other not in seen:
+                        seen.add(other)
+                        following.append(other)
+                        out.append(dict(
+                            self.forms[other], Depth=hop, Link=current, Relation=relation))
+            frontier = following
+            if not frontier:
+                break
+        return {"form": self.forms[form], "chain": out}
+
+
+class LRUCache:
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits, self.misses = 0, 0
+        self.data = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.data.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+
+class Service:
+    # pattern of the path, method and the query parameters it accepts
+    ROUTES = [
+        (re.compile("/concepts/([^/]+)/shifts"), "concept_shifts", {"kind", "weight", "k"}),
+        (re.compile("/languages/([^/]+)/shifts"), "language_shifts", {"concept"}),
+        (re.compile("/families/([^/]+)/shifts"), "family_shifts", {"concept"}),
+        (re.compile("/forms/([^/]+)/chain"), "chain", {"direction", "depth"}),
+        (re.compile("/stats"), "stats", set()),
+    ]
+
+    def __init__(self, index, cache_size=4096):
+        self.index = index
+        self.cache = LRUCache(cache_size)
+
+    def query(self, target):
+        """
+        Return status and JSON of the response to a request target like
+        `/concepts/3607_bitter/shifts?k=5`.
+        """
+        url = urllib.parse.urlsplit(target)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        key = (url.path, tuple(sorted(params.items())))
+        body = self.cache.get(key)
+        if body is not None:
+            return 200, body
+        for pattern, name, allowed in self.ROUTES:
+            match = pattern.fullmatch(url.path)
+            if match:
+                break
+        else:
+            return 404, self._error("unknown path {0}".format(url.path))
+        unknown = sorted(set(params) - allowed)
+        if unknown:
+            return 400, self._error("unknown parameters {0}".format(", ".join(unknown)))
+        args = [urllib.parse.unquote(arg) for arg in match.groups()]
+        try:
+            result = getattr(self, name)(*args, **params)
+        except QueryError as e:
+            # other errors are bugs of the service, answered with 500 by handle
+            return e.status, self._error(str(e))
+        body = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        if name != "stats":
+            self.cache.put(key, body)
+        return 200, body
+
+    @staticmethod
+    def _error(message):
+        return json.dumps({"error": message}).encode("utf-8")
+
+    @staticmethod
+    def _count(name, value):
+        try:
+            value = int(value)
+        except ValueError:
+            raise BadRequest("{0} must be an integer".format(name))
+        if value < 0:
+            raise BadRequest("{0} must not be negative".format(name))
+        return value
+
+    def concept_shifts(self, concept, kind="all", weight="PolysemyByFamily", k=None):
+        return self.index.concept_shifts(
+            concept, kind=kind, weight=weight, k=None if k is None else self._count("k", k))
+
+    def language_shifts(self, language, concept=None):
+        if language not in self.index.languages:
+            raise NotFound("unknown language {0}".format(language))
+        return {"language": self.index.languages[language],
+                "shifts": self.index.language_shifts([language], concept=concept)}
+
+    def family_shifts(self, family, concept=None):
+        if family not in self.index.families:
+            raise NotFound("unknown family {0}".format(family))
+        return {"family": family, "shifts": self.index.language_shifts(
+            self.index.families[family], concept=concept)}
+
+    def chain(self, form, direction="sources", depth=3):
+        return self.index.chain(form, direction=direction, depth=self._count("depth", depth))
+
+    def stats(self):
+        return {
+            "concepts": len(self.index.concepts),
+            "languages": len(self.index.languages),
+            "forms": len(self.index.forms),
+            "cache": {"size": len(self.cache), "maxsize": self.cache.maxsize,
+                      "hits": self.cache.hits, "misses": self.cache.misses}}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = line.decode("latin-1").split()
+                if len(request) != 3:
+                    body = self._error("malformed request line")
+                    writer.write(
+                        "HTTP/1.1 400 Bad Request\r\nContent-Type: application/json\r\n"
+                        "Content-Length: {0}\r\nConnection: close\r\n\r\n".format(
+                            len(body)).encode("latin-1") + body)
+                    await writer.drain()
+                    break
+                method, target, version = request
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip().lower()
+                if method == "GET":
+                    try:
+                        status, body = self.query(target)
+                    except Exception as e:
+                        # a bug answering one query must not take down the connection
+                        status, body = 500, self._error("{0}: {1}".format(
+                            e.__class__.__name__, e))
+                else:
+                    status, body = 405, self._error("only GET is supported")
+                keep_alive = version == "HTTP/1.1" and headers.get("connection") != "close"
+                writer.write(
+                    "HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\n"
+                    "Content-Length: {2}\r\nConnection: {3}\r\n\r\n".format(
+                        status, STATUS[status], len(body),
+                        "keep-alive" if keep_alive else "close").encode("latin-1") + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """
+        Start the server, return the `asyncio.Server`.
+        """
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
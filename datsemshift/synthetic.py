@@ -0,0 +1,255 @@
+"""
+Synthetic pages of the DatSemShift website, for benchmarks and tests.
+
+`generate` writes the meaning pages `datsemshift-concepts/{a-z}.html`, the
+language overview `languages.html` and the shift pages
+`datsemshift-data/shiftNNNN.html` to a store (see `datsemshift.archive`),
+with the markup of the real pages: a `shift__header` with source concept,
+direction and target concept and the number of realizations, followed by one
+`realization__table` per realization with the rows Type, Language, Lexeme,
+Meaning and Direction.
+
+The numbers of concepts, languages, families and shifts are those of the real
+database multiplied by `scale`. As in the real data, a few concepts and
+languages occur in many shifts, most shifts have one or two realizations and
+a few have hundreds, and the lexeme of a concept in a language is the same in
+all shifts. Words, names and glosses are random syllables, the same for the
+same `seed`.
+"""
+import random
+import itertools
+import collections
+
+# size of the real database
+SHIFTS = 8647
+CONCEPTS = 4583
+LANGUAGES = 1728
+FAMILIES = 203
+MAX_REALIZATIONS = 435
+
+# directions of the shifts with their frequency in the real data, and the
+# directions of their realizations
+DIRECTIONS = {
+    "→": (6199, {"→": 80, "←": 5, None: 15}),
+    "—": (2267, {"—": 70, None: 30}),
+    "↔": (181, {"→": 45, "←": 45, None: 10}),
+}
+TYPES = {
+    "Polysemy": 60, "Derivation": 25, "Morphological derivation": 8, "Cognates": 5,
+    "Borrowing": 2}
+# types of realizations with two languages
+CONTACT = {"Cognates", "Borrowing"}
+DOMAINS = [
+    "N/a", "Artifacts", "Abstract entities", "Natural objects", "Physical effect", "Animals",
+    "Human being", "Plants", "Non-physical", "Interpersonal relations", "Body parts",
+    "Motion", "Time", "Evaluation", "Space", "Emotions", "Speech", "Taste"]
+QUALIFIERS = ["(adj.)", "(v.)", "(n.)", "(of taste)", "(figurative)"]
+
+CONSONANTS = "bcdfghklmnprstvz"
+VOWELS = "aeiou"
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>{title} | DatSemShift</title></head>
+<body>
+<div class="header">
+<div class="header__menu">
+<span class="header__item"><a href="/browse">Browse</a></span>
+<span class="header__item"><a href="/meanings/a">Meanings</a></span>
+<span class="header__item"><a href="/languages">Languages</a></span>
+</div>
+</div>
+<div class="content">
+{content}
+</div>
+<div class="footer"><span>Institute of Linguistics, Russian Academy of Sciences</span></div>
+</body>
+</html>
+"""
+
+
+def _word(rng, low=1, high=3):
+    word = rng.choice(VOWELS) if rng.random() < 0.2 else ""
+    return word + "".join(
+            rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(low, high)))
+
+
+def _names(rng, n, low, high):
+    names, out = set(), []
+    while len(out) < n:
+        name = _word(rng, low, high)
+        if name not in names:
+            names.add(name)
+            out.append(name)
+    return out
+
+
+def _weights(n, exponent=1.0):
+    # cumulative weights of a Zipf distribution, for random.choices
+    return list(itertools.accumulate(1 / (i + 1) ** exponent for i in range(n)))
+
+
+def _choices(rng, mapping):
+    return rng.choices(list(mapping), weights=list(mapping.values()))[0]
+
+
+class Corpus:
+    """
+    Random concepts, languages and shifts.
+    """
+    def __init__(self, scale=1.0, seed=0):
+        self.seed = seed
+        rng = self.rng = random.Random(seed)
+        n = max(2, round(CONCEPTS * scale))
+        self.concepts = [
+            gloss + " " + rng.choice(QUALIFIERS) if rng.random() < 0.1 else gloss
+            for gloss in _names(rng, n, 1, 3)]
+        families = [name.capitalize() + "ic" for name in _names(
+            rng, max(1, round(FAMILIES * scale)), 2, 3)]
+        weights = _weights(len(families))
+        self.languages = [
+            (name.capitalize(), name[:4].ljust(4, "a") + str(1000 + i),
+             rng.choices(families, cum_weights=weights)[0])
+            for i, name in enumerate(_names(rng, max(2, round(LANGUAGES * scale)), 1, 4))]
+        self.shifts = max(1, round(SHIFTS * scale))
+        self.realizations = 0
+        self.words = collections.Counter()
+        self._languages = _weights(len(self.languages), 0.8)
+
+    def lexeme(self, language, concept):
+        """
+        The word for a concept in a language, the same in all shifts.
+        """
+        rng = random.Random("{0}:{1}:{2}".format(self.seed, language, concept))
+        word = _word(rng)
+        if rng.random() < 0.1:
+            return word + rng.choice([", ", " ~ "]) + _word(rng)
+        if rng.random() < 0.03:
+            return word + "&#39;" + _word(rng, 1, 1)
+        return word
+
+    def meaning(self, concept):
+        if self.rng.random() < 0.2:
+            return concept + " " + self.rng.choice(QUALIFIERS)
+        return concept
+
+    def realization(self, number, source, target, directions):
+        rng = self.rng
+        type_ = _choices(rng, TYPES)
+        language = rng.choices(range(len(self.languages)), cum_weights=self._languages)[0]
+        languages = [language]
+        word = self.lexeme(language, source)
+        if type_ in CONTACT:
+            languages.append(rng.randrange(len(self.languages)))
+            lexemes = [word, self.lexeme(languages[1], target)]
+        elif type_ == "Polysemy":
+            lexemes = [word]
+        else:
+            lexemes = [word, word.split(",")[0] + _word(rng, 1, 1)]
+        for language in languages:
+            self.words[language] += 1
+        status = '<span class="status">accepted</span> ' if rng.random() < 0.2 else ""
+        rows = ['<tr><th colspan="3">{0}Realization {1}</th></tr>'.format(status, number),
+                '<tr><td colspan="2">Type</td><td>{0}</td></tr>'.format(type_)]
+        for label, values in [
+                ("Language", [self.languages[i][0] for i in languages]), ("Lexeme", lexemes)]:
+            for i, value in enumerate(values, start=1):
+                rows.append('<tr><td colspan="2">{0}</td><td>{1}</td></tr>'.format(
+                    label + (" {0}".format(i) if len(values) > 1 else ""), value))
+        for i, concept in enumerate([source, target], start=1):
+            rows.append("<tr><td>Meaning {0}</td><td>{1}</td><td></td></tr>".format(
+                i, self.meaning(concept)))
+        direction = _choices(rng, directions)
+        if direction:
+            rows.append("<tr><td>Direction</td><td>{0}</td><td></td></tr>".format(direction))
+        return '<table class="realization__table" id="r{0}">\n{1}\n</table>'.format(
+                number, "\n".join(rows))
+
+    def shift_pages(self):
+        """
+        Yield the names and HTML of the shift pages.
+        """
+        rng = self.rng
+        concepts = _weights(len(self.concepts), 0.8)
+        directions = {key: value[0] for key, value in DIRECTIONS.items()}
+        pairs = set()
+        for i in range(1, self.shifts + 1):
+            while True:
+                source, target = rng.choices(self.concepts, cum_weights=concepts, k=2)
+                if source != target and (source, target) not in pairs:
+                    break
+            pairs.add((source, target))
+            direction = _choices(rng, directions)
+            # the numbers of realizations follow a power law
+            number = min(MAX_REALIZATIONS, int(rng.paretovariate(1.15)))
+            self.realizations += number
+            header = (
+                '<div class="shift__header">\n'
+                '<span class="shift__header_item">{0}</span>\n'
+                '<span class="shift__header_item">{1}</span>\n'
+                '<span class="shift__header_item">{2}</span>\n'
+                '<span class="realization_number">{3} realization{4}</span></div>').format(
+                    source, direction, target, number, "s" if number > 1 else "")
+            tables = [
+                self.realization(j, source, target, DIRECTIONS[direction][1])
+                for j in range(1, number + 1)]
+            name = "shift{0}".format(str(i).rjust(4, "0"))
+            yield "datsemshift-data/{0}.html".format(name), PAGE.format(
+                    title=name, content="\n".join([header] + tables))
+
+    def concept_pages(self):
+        """
+        Yield the names and HTML of the meaning pages, one per letter.
+        """
+        rng = random.Random("{0}:concepts".format(self.seed))
+        pages = collections.defaultdict(list)
+        for concept in self.concepts:
+            pages[concept[0]].append(
+                "<tr><td>{0}</td><td>{1}</td><td>{2}</td><td>{3}</td></tr>".format(
+                    concept,
+                    " ".join(_word(rng) for _ in range(rng.randint(3, 12))).capitalize() + ".",
+                    _word(rng) if rng.random() < 0.1 else "",
+                    rng.choice(DOMAINS)))
+        for letter in "abcdefghijklmnopqrstuvwxyz":
+            yield "datsemshift-concepts/{0}.html".format(letter), PAGE.format(
+                title=letter.upper(), content="<table>\n{0}\n{1}\n</table>".format(
+                    "<tr><th>Meaning</th><th>Definition</th><th>Alias</th><th>Domain</th></tr>",
+                    "\n".join(pages[letter])))
+
+    def language_page(self):
+        """
+        The language overview, with the number of realizations of each language.
+        """
+        rows = [
+            "<tr><th>#</th><th>ID</th><th>Language</th><th>Glottocode</th><th>Family</th>"
+            "<th>Subgroup</th><th>Words</th></tr>"]
+        for i, (name, glottocode, family) in enumerate(self.languages):
+            rows.append(
+                "<tr><td>{0}</td><td>{0}</td><td>{1}</td><td>{2}</td><td>{3}</td>"
+                "<td>{4}</td><td>{5}</td></tr>".format(
+                    i + 1, name, glottocode, family, family[:3] + "-" + name[:2].lower(),
+                    self.words[i]))
+        return "languages.html", PAGE.format(
+            title="Languages", content="<table>\n{0}\n</table>".format("\n".join(rows)))
+
+
+def generate(store, scale=1.0, seed=0):
+    """
+    Write a synthetic corpus of pages to `store`.
+
+    :return: Dictionary with the numbers of concepts, languages, shifts and \
+    realizations.
+    """
+    corpus = Corpus(scale=scale, seed=seed)
+    shifts = 0
+    for name, page in corpus.shift_pages():
+        store.write(name, page.encode("utf-8"), commit=False)
+        shifts += 1
+    for name, page in itertools.chain(corpus.concept_pages(), [corpus.language_page()]):
+        store.write(name, page.encode("utf-8"), commit=False)
+    store.commit()
+    return {
+        "concepts": len(corpus.concepts),
+        "languages": len(corpus.languages),
+        "shifts": shifts,
+        "realizations": corpus.realizations}
@@ -0,0 +1,246 @@
+"""
+Validation of the CLDF data by `pycldf.Dataset.validate`, one table per
+worker, with the tables checked in parallel.
+
+`pycldf.Dataset.validate` reads the rows of each table once to check their
+datatypes, once to check the primary keys and once more for each table
+referencing it or referenced by it to check the foreign keys. `validate`
+runs `pycldf.Dataset.validate` on each table (or each group of tables which
+reference each other) as a dataset of its own, in a pool of worker processes
+if `workers` > 1. The foreign keys to other tables are removed from these
+datasets and checked by row validators instead, against the sets of IDs of
+the tables referenced, which are collected by row validators while these
+tables are checked, before the tables referencing them. So each table is
+read twice, once for the rows and once for the primary key.
+
+The schema is checked by pycldf, on a copy of the metadata with tables which
+only have a header. Each message is logged once.
+"""
+import shutil
+import logging
+import pathlib
+import zipfile
+import operator
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from pycldf import Dataset, Generic
+
+
+def _path(table):
+    return pathlib.Path(table.url.resolve(table.base))
+
+
+def _header(fname):
+    """
+    Return the first line of a table, which may be zipped.
+    """
+    if not fname.exists():
+        zipped = fname.parent / "{0}.zip".format(fname.name)
+        if not zipped.exists():
+            return None
+        with zipfile.ZipFile(str(zipped)) as z:
+            data = z.read([n for n in z.namelist() if n.endswith(fname.name)][0])
+        return data[:data.find(b"\n") + 1] if b"\n" in data else data
+    with fname.open("rb") as f:
+        return f.readline()
+
+
+def _foreign_keys(ds):
+    """
+    Return the foreign keys between the tables, as tuples `(table index, \
+    columns, target index, target columns)`.
+    """
+    index = {table.url.string: i for i, table in enumerate(ds.tables)}
+    return [
+        (i, tuple(fk.columnReference), index[fk.reference.resource.string],
+         tuple(fk.reference.columnReference))
+        for i, table in enumerate(ds.tables) for fk in table.tableSchema.foreignKeys
+        if not fk.reference.schemaReference and fk.reference.resource.string in index]
+
+
+def _units(ds):
+    """
+    Group the tables which reference each other (directly or not), which are
+    checked together, in the order of the tables.
+    """
+    edges = {i: set() for i in range(len(ds.tables))}
+    for child, _, target, _ in _foreign_keys(ds):
+        edges[child].add(target)
+    reach = {}
+    for i in edges:
+        seen, todo = set(), [i]
+        while todo:
+            for j in edges[todo.pop()] - seen:
+                seen.add(j)
+                todo.append(j)
+        reach[i] = seen
+    units = []
+    for i in edges:
+        if not any(i in unit for unit in units):
+            units.append(tuple(j for j in edges if j == i or (j in reach[i] and i in reach[j])))
+    return units
+
+
+class _Messages(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.levelno, record.getMessage()))
+
+
+def _referenced(columns, ids, url):
+    keys, single_column = operator.itemgetter(*columns), len(columns) == 1
+
+    def validator(dataset, table, column, row):
+        colref = keys(row)
+        if colref is None:
+            return
+        for colref in colref if single_column and isinstance(colref, list) else [colref]:
+            if not single_column and None in colref:
+                continue
+            if colref not in ids:
+                raise ValueError("Key `{0}` not found in table {1}".format(colref, url))
+    return validator
+
+
+def _collect(columns, seen):
+    keys = operator.itemgetter(*columns)
+
+    def validator(dataset, table, column, row):
+        seen.add(keys(row))
+    return validator
+
+
+def _check(metadata, unit, ids, targets, log):
+    """
+    Validate the tables `unit` of the dataset with pycldf.
+
+    :param ids: Dictionary with the set of IDs of the target (as pair of table \
+    index and columns) of each foreign key from the tables of `unit` to other \
+    tables.
+    :param targets: Keys (pairs of table index and columns) of the tables of \
+    `unit` for which to collect the set of IDs.
+    :param log: Flag signaling whether messages are collected, otherwise a \
+    `ValueError` is raised at the first error.
+    :return: Tuple of the flag signaling whether the tables are valid, the \
+    messages as pairs `(level, message)` and the collected sets of IDs.
+    """
+    ds = Dataset.from_metadata(metadata)
+    fks = _foreign_keys(ds)
+    tables = [ds.tables[i] for i in unit]
+    validators, collected = [], {}
+    for child, columns, target, reference in fks:
+        if child in unit and target not in unit and (target, reference) in ids:
+            validators.append((ds.tables[child].url.string, columns[0], _referenced(
+                columns, ids[target, reference], ds.tables[target].url.string)))
+    for target, reference in targets:
+        collected[target, reference] = set()
+        validators.append((ds.tables[target].url.string, reference[0], _collect(
+            reference, collected[target, reference])))
+    urls = {table.url.string for table in tables}
+    for table in tables:
+        table.tableSchema.foreignKeys = [
+            fk for fk in table.tableSchema.foreignKeys
+            if fk.reference.schemaReference or fk.reference.resource.string in urls]
+    ds.tablegroup.tables = tables
+    # the tables of the module are checked with the schema
+    ds.tablegroup.common_props["dc:conformsTo"] = \
+        ds.properties["dc:conformsTo"].replace("#" + ds.module, "#Generic")
+
+    handler, logger = _Messages(), None
+    if log:
+        logger = logging.getLogger("{0}.{1}".format(__name__, "-".join(map(str, unit))))
+        logger.propagate = False
+        logger.addHandler(handler)
+    try:
+        valid = Generic(ds.tablegroup).validate(log=logger, validators=validators)
+    except ValueError as e:
+        if not log:
+            raise
+        # e.g. missing required columns, the check of the tables stops there
+        handler.records.append((logging.ERROR, str(e)))
+        valid = False
+    finally:
+        if logger:
+            logger.removeHandler(handler)
+    return valid, handler.records, collected
+
+
+def _validate_schema(ds, log):
+    """
+    Validate the schema with pycldf, on a copy of the metadata with tables
+    which only have a header.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+        shutil.copy(str(ds.directory / ds.filename), str(tmp / ds.filename))
+        for table in ds.tables:
+            target = pathlib.Path(table.url.resolve(tmp))
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(_header(_path(table)) or b"")
+        try:
+            return Dataset.from_metadata(tmp / ds.filename).validate(log=log)
+        except ValueError as e:
+            if not log:
+                raise
+            # e.g. missing required columns, reported for the tables of the dataset
+            log.error(str(e).replace(str(tmp), str(ds.directory)))
+            return False
+
+
+def validate(metadata, log=None, workers=1):
+    """
+    Validate the CLDF data described by `metadata`.
+
+    :param log: `logging.Logger` to write the errors to. If `None`, a \
+    `ValueError` is raised at the first error, as by pycldf.
+    :return: Flag signaling whether schema and data are valid.
+    """
+    metadata = str(metadata)
+    ds = Dataset.from_metadata(metadata)
+    fks = _foreign_keys(ds)
+    units = _units(ds)
+    schema = _Messages()
+    if log:
+        log.addHandler(schema)
+    try:
+        success = _validate_schema(ds, log)
+    finally:
+        if log:
+            log.removeHandler(schema)
+    logged = {message for _, message in schema.records}
+
+    # the tables referenced by foreign keys are checked first, to collect their IDs
+    ids, todo = {}, list(units)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while todo:
+            wave = [unit for unit in todo if all(
+                target in unit or any(target in u for u in units if u not in todo)
+                for child, _, target, _ in fks if child in unit)] or todo[:1]
+            todo = [unit for unit in todo if unit not in wave]
+            tasks = [(
+                metadata,
+                unit,
+                {(target, reference): ids[target, reference]
+                 for child, _, target, reference in fks
+                 if child in unit and (target, reference) in ids},
+                sorted({(target, reference) for child, _, target, reference in fks
+                        if target in unit and child not in unit}),
+                log is not None) for unit in wave]
+            checked = executor.map(_check, *zip(*tasks)) if executor else \
+                (_check(*task) for task in tasks)
+            for valid, records, collected in checked:
+                success = success and valid
+                ids.update(collected)
+                for level, message in records:
+                    if message not in logged:
+                        logged.add(message)
+                        log.log(level, message)
+    finally:
+        if executor:
+            executor.shutdown()
+    return success
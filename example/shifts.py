@@ -1,96 +1,99 @@
-from pycldf import Dataset
-from collections import defaultdict
-from pathlib import Path
-from csvw.dsv import UnicodeWriter
-from warnings import warn
-
-ds = Dataset.from_metadata(Path(__file__).parent.parent / "cldf/cldf-metadata.json")
-
+"""
+Write the directed and undirected shifts between concepts linked to
+Concepticon to scripts/dss.tsv.
 
-concepts = ds.objects("ParameterTable")
-pairs = defaultdict(lambda : {"directed": {}, "undirected": {}})
-visited = set()
-for concept in concepts:
-    if concept.data["Concepticon_ID"] and concept.data["Concepticon_ID"] not in visited:
-        visited.add(concept.data["Concepticon_ID"])
-        if concept.data["Target_Concepts"]:
-            print(concept.data["Concepticon_Gloss"])
-            for t in concept.data["Target_Concepts"]:
-                target = concepts[t["ID"]]
-                if target.data["Concepticon_Gloss"]:
-                    print("  →", target.data["Concepticon_Gloss"])
-                    pairs[concept.id, t["ID"]]["directed"] = t
-            for t in concept.data["Linked_Concepts"]:
-                target = concepts[t["ID"]]
-                if target.data["Concepticon_Gloss"]:
-                    pairs[concept.id, t["ID"]]["undirected"] = t
+    $ python shifts.py [CLDF_METADATA [OUTPUT]]
 
-# check if polysemy goes in both directions
+The symmetry of the undirected counts is checked when the data is built by
+`cmd_makecldf` (see `datsemshift.consistency`).
 
-table = [[
-    "Source_ID",
-    "Target_ID",
-    "Source_CID",
-    "Source_Gloss",
-    "Target_CID",
-    "Target_Gloss",
-    "Polysemy",
-    "Derivation",
-    "Undirected_Polysemy",
-    "Undirected_Derivation"
-    ]]
-
-
-for (cA, cB), d in pairs.items():
-    # get values
-    ab_polysemy, ab_derivation = (
-            d["directed"].get("Polysemy", 0),
-            d["directed"].get("Derivation", 0))
-    polysemy, derivation = (
-            d["undirected"].get("Polysemy", 0),
-            d["undirected"].get("Derivation", 0))
+Requires numpy and scipy, install with `pip install -e .[graph]`.
+"""
+import sys
+from pathlib import Path
 
-    if (cB, cA) in pairs:
-        ba_polysemy, ba_derivation = (
-                pairs[cB, cA]["directed"].get("Polysemy", 0),
-                pairs[cB, cA]["directed"].get("Derivation", 0))
-        polysemy_, derivation_ = (
-                pairs[cB, cA]["undirected"].get("Polysemy", 0),
-                pairs[cB, cA]["undirected"].get("Derivation", 0))
-        if polysemy_ != polysemy:
-            warn("Polysemy not symmetric in {0} / {1} / {2} / {3}".format(
-                cA, cB, polysemy, polysemy_))
-        if derivation_ != derivation:
-            warn("Derivation not symmetric in {0} / {1} / {2} / {3}".format(
-                cA, cB, polysemy, polysemy_))
+import numpy as np
+from csvw.dsv import UnicodeWriter
 
+from datsemshift.graph import ShiftGraph
 
-    else:
-        ba_polysemy, ba_derivation = 0, 0
-    rowA = [
-            cA, cB, 
-            concepts[cA].data["Concepticon_ID"],
-            concepts[cA].data["Concepticon_Gloss"],
-            concepts[cB].data["Concepticon_ID"],
-            concepts[cB].data["Concepticon_Gloss"],
-            ab_polysemy, ab_derivation, polysemy, derivation
-            ]
-    rowB = [
-            cB, cA, 
-            concepts[cB].data["Concepticon_ID"],
-            concepts[cB].data["Concepticon_Gloss"],
-            concepts[cA].data["Concepticon_ID"],
-            concepts[cA].data["Concepticon_Gloss"],
-            ba_polysemy, ba_derivation, polysemy, derivation
-            ]
-    table += [rowA, rowB]
-with UnicodeWriter(Path(__file__).parent / "dss.tsv", delimiter="\t") as writer:
-    for row in table:
-        writer.writerow(row)
-    
-    
+repos = Path(__file__).parent.parent
+graph = ShiftGraph.from_cldf(
+        sys.argv[1] if len(sys.argv) > 1 else repos / "cldf" / "cldf-metadata.json")
+n = len(graph)
 
+# the first concept of each Concepticon ID with directed shifts
+has_cid = graph.concepticon_ids != ""
+_, first = np.unique(graph.concepticon_ids[has_cid], return_index=True)
+selected = np.zeros(n, dtype=bool)
+selected[np.flatnonzero(has_cid)[first]] = True
+selected &= graph.out_degree("directed") > 0
+has_gloss = graph.concepticon_glosses != ""
 
+# pairs of selected concepts and targets with a gloss, in the order of the JSON
+# lists, directed shifts of a concept before undirected ones
+sources, targets, kinds, positions = [], [], [], []
+for k, kind in enumerate(["directed", "undirected"]):
+    source, target, _ = graph.edges[kind]
+    keep = selected[source] & has_gloss[target]
+    sources.append(source[keep])
+    targets.append(target[keep])
+    kinds.append(np.full(keep.sum(), k))
+    positions.append(np.flatnonzero(keep))
+sources, targets, kinds, positions = (
+        np.concatenate(a) for a in (sources, targets, kinds, positions))
+order = np.lexsort((positions, kinds, sources))
+keys = sources[order].astype(np.int64) * n + targets[order]
+_, first = np.unique(keys, return_index=True)
+first.sort()
+order = order[first]
+sources, targets, kinds = sources[order], targets[order], kinds[order]
+keys = keys[first]
 
+directed = kinds == 0
+bounds = np.searchsorted(sources[directed], np.arange(n + 1))
+for i in np.flatnonzero(selected):
+    print(graph.concepticon_glosses[i])
+    for j in targets[directed][bounds[i]:bounds[i + 1]]:
+        print("  →", graph.concepticon_glosses[j])
 
+# counts of both directions of a pair
+reverse = np.isin(targets.astype(np.int64) * n + sources, keys)
+values = {}
+for kind in ["directed", "undirected"]:
+    for weight in ["Polysemy", "Derivation"]:
+        values[kind, weight, "ab"] = graph.weights(sources, targets, kind, weight)
+        values[kind, weight, "ba"] = np.where(
+                reverse, graph.weights(targets, sources, kind, weight), 0)
 
+output = sys.argv[2] if len(sys.argv) > 2 else repos / "scripts" / "dss.tsv"
+with UnicodeWriter(output, delimiter="\t") as writer:
+    writer.writerow([
+        "Source_ID",
+        "Target_ID",
+        "Source_CID",
+        "Source_Gloss",
+        "Target_CID",
+        "Target_Gloss",
+        "Polysemy",
+        "Derivation",
+        "Undirected_Polysemy",
+        "Undirected_Derivation"])
+    for idx, (a, b) in enumerate(zip(sources, targets)):
+        polysemy, derivation = (
+                values["undirected", "Polysemy", "ab"][idx],
+                values["undirected", "Derivation", "ab"][idx])
+        writer.writerow([
+            graph.ids[a], graph.ids[b],
+            graph.concepticon_ids[a], graph.concepticon_glosses[a],
+            graph.concepticon_ids[b], graph.concepticon_glosses[b],
+            values["directed", "Polysemy", "ab"][idx],
+            values["directed", "Derivation", "ab"][idx],
+            polysemy, derivation])
+        writer.writerow([
+            graph.ids[b], graph.ids[a],
+            graph.concepticon_ids[b], graph.concepticon_glosses[b],
+            graph.concepticon_ids[a], graph.concepticon_glosses[a],
+            values["directed", "Polysemy", "ba"][idx],
+            values["directed", "Derivation", "ba"][idx],
+            polysemy, derivation])
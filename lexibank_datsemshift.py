@@ -1,4 +1,7 @@
+import os
 import pathlib
+import itertools
+import time
 import attr
 from clldutils.misc import slug
 from pylexibank import Dataset as BaseDataset
@@ -6,22 +9,123 @@ from pylexibank import progressbar as pb
 from pylexibank import Language, Lexeme, Concept
 from pylexibank import FormSpec
 from csvw.dsv import UnicodeWriter
-import re
-from collections import defaultdict
 
-from html import unescape
+from datsemshift.fetch import Fetcher
+from datsemshift.manifest import Manifest
+from datsemshift.archive import open_store
+from datsemshift.parse import parse_shift_file, parse_language_file, parse_concept_file
+from datsemshift.cache import ParseCache
+from datsemshift.aggregate import PairTable, PAIR_TABLE, PAIR_COLUMNS
+from datsemshift.lexemes import LexemeGraph, read_lexemes, FORWARD, BACKWARD, UNDIRECTED
+from datsemshift.incremental import SNAPSHOT, CHANGED_CONCEPTS, Snapshot, snapshot_key, digest
+from datsemshift.instrument import Report
+from datsemshift.normalize import refine_gloss, unescape, unescape_row
+from datsemshift.consistency import ERROR, check as check_consistency
 
 DOWNLOAD = False
-
-def refine_gloss(gloss):
-    for s, t in [
-            ("&lt;", ""),
-            ("&gt;", ""),
-            ("&#39;", "'"),
-            ("ZQ", "")
-            ]:
-        gloss = gloss.replace(s, t)
-    return gloss
+# settings of the concurrent page fetcher used when DOWNLOAD is set
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_PER_HOST = 4
+DOWNLOAD_RATE = 8.0
+DOWNLOAD_RETRIES = 5
+# number of processes for parsing the shift pages
+PARSE_WORKERS = os.cpu_count() or 1
+# keep a snapshot of cmd_makecldf in raw/ and only rebuild what changed
+INCREMENTAL = False
+# also write the statistics of the concept pairs as JSON to the Target_Concepts
+# and Linked_Concepts columns of ParameterTable, as done before concept_pairs.csv
+PAIR_JSON = False
+# write the concept pairs as sparse matrices to matrices/ (requires numpy and scipy)
+MATRICES = False
+# the time, memory and counters of the phases of cmd_download and cmd_makecldf are
+# written to REPORT, memory is only traced with TRACE_MEMORY (which slows the commands down)
+REPORT = "build-report.json"
+TRACE_MEMORY = False
+# profile each phase with "cprofile" or "pyinstrument", writing the profiles to profiles/
+PROFILE = None
+# check the consistency of the concept pairs and forms in cmd_makecldf, logging the
+# issues ("warn") or failing on errors ("fail"), see datsemshift.consistency; in
+# incremental mode, the pairs of all concepts are aggregated for the checks then
+CONSISTENCY = "warn"
+
+def counted(shifts, phase):
+    """
+    Count the realizations of the parsed shift pages and the cells matched by
+    the parser in a phase of the report.
+    """
+    for shift in shifts:
+        if shift:
+            phase.count("realizations", len(shift.realizations))
+            phase.count("matches", sum(r.matches for r in shift.realizations))
+        yield shift
+
+
+def shift_rows(shifts, concept_lookup, language_lookup, cidx, lidx):
+    """
+    Assign IDs to the parsed shift pages and yield the rows of the output
+    tables in the order in which they are created.
+
+    Rows are yielded as `(table, row)` with table one of `concepts`,
+    `languages` (for concepts and languages not found on the overview pages),
+    `shifts` and `lexemes`.
+    """
+    idx = 1
+    for shift in shifts:
+        if not shift:
+            continue
+        source, target = shift.source, shift.target
+        for concept in [source, target]:
+            if concept not in concept_lookup:
+                concept_lookup[concept] = cidx
+                yield "concepts", [
+                    cidx,
+                    refine_gloss(concept),
+                    concept,
+                    "",
+                    "",
+                    ""]
+                cidx += 1
+        sidx, tidx = concept_lookup[source], concept_lookup[target]
+        yield "shifts", [shift.id, source, sidx, shift.direction, target, tidx,
+                         shift.realizations_count, len(shift.realizations)]
+        for realization in shift.realizations:
+            languages, lexemes, meanings = (
+                    realization.languages, realization.lexemes, realization.meanings)
+            lids = []
+            for _, language in languages:
+                if language not in language_lookup:
+                    yield "languages", [
+                        lidx,
+                        refine_gloss(language),
+                        "", "", "", 0]
+                    language_lookup[language] = lidx
+                    lids += [lidx]
+                    lidx += 1
+                lids += [language_lookup[language]]
+
+            # one or two languages, one or two lexemes, two meanings
+            if len(languages) in [1, 2] and len(lexemes) in [1, 2] and len(meanings) == 2:
+                yield "lexemes", [
+                    idx,
+                    shift.id,
+                    realization.type,
+                    realization.title,
+                    realization.status,
+                    realization.direction,
+                    source,
+                    sidx,
+                    target,
+                    tidx,
+                    refine_gloss(languages[0][1].strip()),
+                    lids[0],
+                    refine_gloss(languages[-1][1].strip()),
+                    lids[len(languages) - 1],
+                    meanings[0][1].strip(),
+                    meanings[1][1].strip(),
+                    lexemes[0][1].strip(),
+                    lexemes[-1][1].strip()
+                    ]
+            idx += 1
 
 
 @attr.s
@@ -80,29 +184,37 @@ class Dataset(BaseDataset):
     form_spec = FormSpec(separators="~;,/", missing_data=["∅"], first_form_only=True)
     
     def cmd_download(self, args):
+        report = Report(
+                "download", memory=TRACE_MEMORY, profile=PROFILE, directory=self.dir / "profiles")
+        # pages are kept in raw/raw-data/pages.sqlite if it exists, in loose files otherwise
+        store = open_store(self.raw_dir / "raw-data")
         if DOWNLOAD:
-            for letter in pb("abcdefghijklmnopqrstuvwxyz", desc="downloading meanings"):
-                self.raw_dir.download(
-                        "https://datsemshift.ru/meanings/{0}".format(letter),
-                        "raw/raw-data/datsemshift-concepts/{0}.html".format(letter)
-                        )
-            args.log.info("downloaded concepts")
-            self.raw_dir.download(
-                    'https://datsemshift.ru/languages',
-                    "raw/raw-data/languages.html")
-            args.log.info("downloaded languages")
-            self.raw_dir.download(
-                    'https://datsemshift.ru/browse',
-                    "raw/raw-data/shifts.html")
-            args.log.info("downloaded shift overview")
-            for i in pb(range(1, 8648), desc="downloading shifts"):
-                self.raw_dir.download(
-                        "https://datsemshift.ru/shift{0}".format(
-                            str(i).rjust(4, "0")),
-                        "raw/raw-data/datsemshift-data/shift{0}.html".format(
-                            str(i).rjust(4, "0")))
-            args.log.info("downloaded all shifts")
-        
+            fetcher = Fetcher(
+                    workers=DOWNLOAD_WORKERS,
+                    per_host=DOWNLOAD_PER_HOST,
+                    rate=DOWNLOAD_RATE,
+                    retries=DOWNLOAD_RETRIES,
+                    log=args.log)
+            pages = [("https://datsemshift.ru/meanings/{0}".format(letter),
+                      "datsemshift-concepts/{0}.html".format(letter))
+                     for letter in "abcdefghijklmnopqrstuvwxyz"]
+            pages += [("https://datsemshift.ru/languages", "languages.html"),
+                      ("https://datsemshift.ru/browse", "shifts.html")]
+            pages += [("https://datsemshift.ru/shift{0}".format(str(i).rjust(4, "0")),
+                       "datsemshift-data/shift{0}.html".format(str(i).rjust(4, "0")))
+                      for i in range(1, 8648)]
+            manifest = Manifest(self.raw_dir / "raw-data", store=store)
+            with report.phase("fetch") as phase:
+                changes = manifest.refresh(fetcher, pages, desc="downloading pages")
+                phase.count("pages", len(pages))
+            if changes is None:
+                # the store mixes old and new pages, which must not be assembled
+                raise ValueError(
+                    "refresh incomplete, languages, concepts and shifts are not assembled")
+            for key in ["new", "changed", "gone"]:
+                phase.count(key, len(changes[key]))
+            args.log.info("downloaded all pages: {0} new, {1} changed, {2} gone".format(
+                len(changes["new"]), len(changes["changed"]), len(changes["gone"])))
 
         args.log.info("assembling languages...")
         correct_glottolog = {
@@ -125,270 +237,98 @@ class Dataset(BaseDataset):
                 "middl1321": "",
                 
                 }
-        with open(self.raw_dir / "raw-data" / "languages.html") as f:
-            languages = f.read()
-        language_table = [['ID', "Name", "Glottocode", "Family", "SubGroup", "Words"]]
-        all_languages = re.findall("<tr[^>]*>(.*?)</tr>", languages, re.DOTALL)
-        for lng in all_languages:
-            tabs = re.findall("<td[^>]*>(.*?)</td>", lng)
-            if tabs:
-                idf, name, glottolog, family, sgr, words = (
-                        tabs[1].strip(), tabs[2].strip(), tabs[3].strip(),
-                        tabs[4].strip(), tabs[5].strip(), tabs[6].strip())
-                language_table += [[idf, name, correct_glottolog.get(
-                    glottolog, glottolog), family, sgr, words]]
-        lidx = max([int(row[0]) for row in language_table[1:]]) + 1
-        language_lookup = {row[1]: row[0] for row in language_table[1:]}
-        args.log.info('... assembled languages')
-
-        args.log.info('assembling concepts...')
-        concept_table = [["NUMBER", "ENGLISH", "GLOSS_IN_SOURCE", "DEFINITION", "ALIAS", "DOMAIN"]]
-        cidx = 1
-        concept_lookup = {}
-        for pth in pb(self.raw_dir.glob("raw-data/datsemshift-concepts/*.html"), desc="loading concepts"):
-            with open(pth) as f:
-                data = f.read()
-            for row in re.findall("<tr[^>]*?>(.*?)</tr>", data,re.DOTALL):
-                if "<td" in row:
-                    tabs = re.findall("<td[^>]*>(.*?)</td>", row, re.DOTALL)
-                    if tabs:
-                        gloss, definition, alias, taxon = tabs[0], tabs[1], tabs[2], tabs[3]
-                        concept_table += [[
-                            cidx, 
+        # rows are written as soon as they are assembled
+        with (
+                UnicodeWriter(self.etc_dir / "languages.tsv", delimiter="\t") as language_writer,
+                UnicodeWriter(self.etc_dir / "concepts.tsv", delimiter="\t") as concept_writer,
+                UnicodeWriter(self.raw_dir / "shifts.tsv", delimiter="\t") as shift_writer,
+                UnicodeWriter(self.raw_dir / "lexemes.tsv", delimiter="\t") as lexeme_writer,
+                ):
+            # the time of writing rows is summed up over all phases
+            writers = {table: report.timed("write-tsv", writer) for table, writer in {
+                    "languages": lambda row: language_writer.writerow(
+                        unescape_row([row[0], refine_gloss(row[1])] + row[2:])),
+                    "concepts": lambda row: concept_writer.writerow(unescape_row(row)),
+                    "shifts": lambda row: shift_writer.writerow(unescape_row(row)),
+                    "lexemes": lexeme_writer.writerow,
+                    }.items()}
+
+            # parsed pages are cached, only new or modified pages are parsed again
+            cache = ParseCache(self.raw_dir / "raw-data" / "parsed.sqlite")
+            writers["languages"](["ID", "Name", "Glottocode", "Family", "SubGroup", "Words"])
+            lidx, language_lookup = 1, {}
+            with report.phase("languages") as phase:
+                for languages in cache.parse(parse_language_file, store, ["languages.html"]):
+                    for idf, name, glottolog, family, sgr, words in languages:
+                        writers["languages"]([idf, name, correct_glottolog.get(
+                            glottolog, glottolog), family, sgr, words])
+                        lidx = max(lidx, int(idf) + 1)
+                        language_lookup[name] = idf
+                    phase.count("rows", len(languages))
+                phase.count("pages")
+            args.log.info('... assembled languages')
+
+            args.log.info('assembling concepts...')
+            writers["concepts"](
+                    ["NUMBER", "ENGLISH", "GLOSS_IN_SOURCE", "DEFINITION", "ALIAS", "DOMAIN"])
+            cidx = 1
+            concept_lookup = {}
+            names = store.names("datsemshift-concepts/*.html")
+            with report.phase("concepts") as phase:
+                for rows in pb(cache.parse(parse_concept_file, store, names), total=len(names),
+                               desc="loading concepts"):
+                    for gloss, definition, alias, taxon in rows:
+                        writers["concepts"]([
+                            cidx,
                             refine_gloss(gloss),
-                            gloss.strip(), 
+                            gloss.strip(),
                             definition.replace("\n", " ").strip(),
                             alias.strip(),
                             taxon.strip()
-                            ]]
+                            ])
                         concept_lookup[gloss.strip()] = cidx
                         cidx += 1
-        args.log.info("... assembled concepts")
-        args.log.info("assembling shifts...")
-        table = [["ID", "Shift_ID", "Type", "Realization", "Status",
-                  "Direction", "Source_Concept", "Source_Concept_ID",
-                  "Target_Concept", "Target_Concept_ID", "Source_Language",
-                  "Source_Language_ID", "Target_Language",
-                  "Target_Language_ID", "Source_Meaning", "Target_Meaning",
-                  "Source_Word", "Target_Word",
-                 ]]
-        base_shifts = [["ID", "Source", "Source_Number", "Direction", "Target",
-                        "Target_Number", "Realizations", "Examples"]]
-        idx = 1
-        count = 0
-        for pth in pb(self.raw_dir.glob("raw-data/datsemshift-data/shift*.html"), desc="loading data"):
-            with open(pth) as f:
-                data = f.read()
-            shift_id = str(pth).split("/")[-1][:-5]
-            shifts = re.findall(
-                    '<table class="realization__table"[^>]*>(.*?)</table>',
-                    data,
-                    re.DOTALL
-                    )
-            shift_header = re.findall('<div class="shift__header">(.*?)</div>', 
-                                      data,
-                                      re.DOTALL)
-
-            if shift_header:
-                shift_header = shift_header[0]
-                source, direction, target = re.findall('<span class="shift__header_item"[^>]*>(.*?)</span>',
-                                     shift_header,
-                                     re.DOTALL)
-                source, direction, target = source.strip(), direction.strip(), target.strip()
-                try:
-                    sidx, tidx = concept_lookup[source], concept_lookup[target]
-                except KeyError:
-                    if source not in concept_lookup:
-                        concept_lookup[source] = cidx
-                        concept_table += [[
-                            cidx,
-                            refine_gloss(source),
-                            source,
-                            "", 
-                            "",
-                            ""]]
-                        cidx += 1
-                    if target not in concept_lookup:
-                        concept_lookup[target] = cidx
-                        concept_table += [[
-                            cidx,
-                            refine_gloss(target),
-                            target,
-                            "", 
-                            "",
-                            ""]]
-                        cidx += 1
-                    sidx, tidx = concept_lookup[source], concept_lookup[target]
-                realizations = re.findall(
-                        '<span class="realization_number">(.*?)</span>',
-                        shift_header,
-                        re.DOTALL
-                        )[0].replace(" realizations", "").replace(" realization", "").strip()
-                base_shifts += [[shift_id, source.strip(), sidx,
-                                 direction.strip(), target.strip(), tidx, realizations,
-                                 len(shifts)]]
-                for shift in shifts:
-                    count += 1
-                    title_ = re.findall(
-                            '<th[^>]*>(.*?)</th>',
-                            shift,
-                            re.DOTALL)[0].strip()
-                    if "<span" in title_:
-                        status, title = re.findall(
-                                    '<span[^>]*>(.*?)</span>.*?Realization (.*?)$',
-                                    title_,
-                                    re.DOTALL)[0]
-                    else:
-                        status, title = "", title_.strip()
-                    status, title = status.strip(), title.strip()
-        
-        
-                    # get the type of the shift
-                    shift_type = re.findall(
-                            '<tr>.*?<td colspan="2">Type</td>.*?<td[^>]*>(.*?)</td>.*?</tr>',
-                            shift,
-                            re.DOTALL)[0].strip()
-        
-                    languages = re.findall(
-                            '<tr>.*?<td colspan="2">(Language *[12]*)</td>.*?<td[^>]*>(.*?)</td>.*?</tr>',
-                            shift,
-                            re.DOTALL)
-                    lexemes = re.findall(
-                             '<tr>.*?<td colspan="2">(Lexeme *[12]*)</td>.*?<td[^>]*>(.*?)</td>.*?</tr>',
-                             shift,
-                             re.DOTALL)
-                    meanings = re.findall(
-                             '<tr>.*?<td[^>]*>(Meaning *[12]*)</td>.*?<td[^>]*>(.*?)</td>.*?<td[^>]*>.*?</td>.*?</tr>',
-                             shift,
-                             re.DOTALL)
-                    direction = re.findall(
-                             '<tr>.*?<td[^>]*>Direction</td>.*?<td[^>]*>(.*?)</td>.*?<td[^>]*>.*?</td>.*?</tr>',
-                             shift,
-                             re.DOTALL)
-                    if not direction:
-                        direction = "?"
-                    else:
-                        direction = direction[0]
-                    
-                    lids = []
-                    for _, language in languages:
-                        if language not in language_lookup:
-                            language_table += [[
-                                lidx,
-                                refine_gloss(language),
-                                "", "", "", 0]]
-                            language_lookup[language] = lidx
-                            lids += [lidx]
-                            lidx += 1
-                        lids += [language_lookup[language]]
-        
-                    # first simple case, one language, one lexeme, two meanings
-                    if len(languages) == 1 and len(lexemes) == 1 and len(meanings) == 2:
-                        table += [[
-                            idx,
-                            shift_id,
-                            shift_type,
-                            title,
-                            status,
-                            direction,
-                            source,
-                            sidx,
-                            target,
-                            tidx,
-                            refine_gloss(languages[0][1].strip()),
-                            lids[0],
-                            refine_gloss(languages[0][1].strip()),
-                            lids[0],
-                            meanings[0][1].strip(), 
-                            meanings[1][1].strip(),
-                            lexemes[0][1].strip(),
-                            lexemes[0][1].strip()
-                            ]]
-                    elif len(languages) == 1 and len(lexemes) == 2 and len(meanings) == 2:
-                        table += [[
-                            idx,
-                            shift_id,
-                            shift_type,
-                            title,
-                            status,
-                            direction,
-                            source,
-                            sidx,
-                            target,
-                            tidx,
-                            refine_gloss(languages[0][1].strip()),
-                            lids[0],
-                            refine_gloss(languages[0][1].strip()),
-                            lids[0],
-                            meanings[0][1].strip(), 
-                            meanings[1][1].strip(),
-                            lexemes[0][1].strip(),
-                            lexemes[1][1].strip()
-                            ]]
-                    elif len(languages) == 2 and len(lexemes) == 2 and len(meanings) == 2:
-                        table += [[
-                            idx,
-                            shift_id,
-                            shift_type,
-                            title,
-                            status,
-                            direction,
-                            source,
-                            sidx,
-                            target,
-                            tidx,
-                            refine_gloss(languages[0][1].strip()),
-                            lids[0],
-                            refine_gloss(languages[1][1].strip()),
-                            lids[1],
-                            meanings[0][1].strip(), 
-                            meanings[1][1].strip(),
-                            lexemes[0][1].strip(),
-                            lexemes[1][1].strip()
-                            ]]
-                    elif len(languages) == 2 and len(lexemes) == 1 and len(meanings) == 2:
-                        table += [[
-                            idx,
-                            shift_id,
-                            shift_type,
-                            title,
-                            status,
-                            direction,
-                            source,
-                            sidx,
-                            target,
-                            tidx,
-                            refine_gloss(languages[0][1].strip()),
-                            lids[0],
-                            refine_gloss(languages[1][1].strip()),
-                            lids[1],
-                            meanings[0][1].strip(), 
-                            meanings[1][1].strip(),
-                            lexemes[0][1].strip(),
-                            lexemes[0][1].strip()
-                            ]]
-                    idx += 1
-
-        args.log.info("... assembled shifts")
-    
-        with UnicodeWriter(self.raw_dir / "shifts.tsv", delimiter="\t") as writer:
-            for row in base_shifts:
-                writer.writerow([unescape(e) if isinstance(e, str) else e for e in row])
-        
-        with UnicodeWriter(self.raw_dir / "lexemes.tsv", delimiter="\t") as writer:
-            for row in table:
-                writer.writerow(row)
-        with UnicodeWriter(self.etc_dir / "languages.tsv", delimiter="\t") as writer:
-            for row in language_table:
-                row[1] = refine_gloss(row[1])
-                writer.writerow([unescape(e) if isinstance(e, str) else e for e in row])
-        with UnicodeWriter(self.etc_dir / "concepts.tsv", delimiter="\t") as writer:
-            for row in concept_table:
-                writer.writerow([unescape(e) if isinstance(e, str) else e for e in row])
+                    phase.count("rows", len(rows))
+                phase.count("pages", len(names))
+            args.log.info("... assembled concepts")
+
+            args.log.info("assembling shifts...")
+            writers["lexemes"](
+                    ["ID", "Shift_ID", "Type", "Realization", "Status",
+                     "Direction", "Source_Concept", "Source_Concept_ID",
+                     "Target_Concept", "Target_Concept_ID", "Source_Language",
+                     "Source_Language_ID", "Target_Language",
+                     "Target_Language_ID", "Source_Meaning", "Target_Meaning",
+                     "Source_Word", "Target_Word"])
+            writers["shifts"](
+                    ["ID", "Source", "Source_Number", "Direction", "Target",
+                     "Target_Number", "Realizations", "Examples"])
+            # pages are parsed in parallel, IDs are assigned in the order of the shifts
+            names = store.names("datsemshift-data/shift*.html")
+            hits, misses = cache.hits, cache.misses
+            with report.phase("shifts") as phase:
+                shifts = report.iterate("parse-shifts", pb(
+                    cache.parse(parse_shift_file, store, names, workers=PARSE_WORKERS),
+                    total=len(names), desc="loading data"))
+                shifts = counted(shifts, phase)
+                for table, row in shift_rows(shifts, concept_lookup, language_lookup, cidx, lidx):
+                    writers[table](row)
+                    phase.count(table)
+                phase.count("pages", len(names))
+                phase.count("pages parsed", cache.misses - misses)
+                phase.count("pages from cache", cache.hits - hits)
+            cache.close()
+            args.log.info("... assembled shifts ({0} pages parsed, {1} from cache)".format(
+                cache.misses, cache.hits))
+        report.save(self.dir / REPORT)
+        args.log.info("wrote report of the phases to {0}".format(REPORT))
 
     def cmd_makecldf(self, args):
+        self.report = report = Report(
+                "makecldf", memory=TRACE_MEMORY, profile=PROFILE, directory=self.dir / "profiles")
         # add bib
-        args.writer.add_sources()
+        with report.phase("sources"):
+            args.writer.add_sources()
         args.log.info("added sources")
 
         # concepts to concepticon id
@@ -404,286 +344,227 @@ class Dataset(BaseDataset):
         concepts_to_add = {}
         unify_concepts = {}
         new_number = 4584
-        for row in self.etc_dir.read_csv("unify_concepts.tsv", delimiter="\t", dicts=True):
-            for lexeme in row["LEXEME"].split(" // "):
-                if lexeme.startswith("&lt;"):
-                    unify_concepts[lexeme] = str(new_number)
-                    idx = str(new_number) + "_" + slug(lexeme)
+        with report.phase("unify-concepts") as phase:
+            for row in self.etc_dir.read_csv("unify_concepts.tsv", delimiter="\t", dicts=True):
+                for lexeme in row["LEXEME"].split(" // "):
+                    if lexeme.startswith("&lt;"):
+                        unify_concepts[lexeme] = str(new_number)
+                        idx = str(new_number) + "_" + slug(lexeme)
+                        concepts_to_add[idx] = {
+                                "ID": idx,
+                                "Name": unescape(lexeme),
+                                "Gloss_in_Source": lexeme,
+                                "Number": str(new_number)
+                                }
+                        concepts[str(new_number)] = idx
+                        concept_names[idx] = concepts_to_add[idx]["Name"]
+                        new_number += 1
+                    else:
+                        unify_concepts[lexeme] = row["NUMBER"]
+
+            for concept in self.conceptlists[0].concepts.values():
+                if not concept.english.startswith("*"):
+                    idx = concept.number + "_" + slug(concept.english)
+                    cid, cgl = c2i.get(concept.english, ("", ""))
+
                     concepts_to_add[idx] = {
                             "ID": idx,
-                            "Name": lexeme.replace("&lt;", "<").replace(
-                                "&gt;", ">"),
-                            "Gloss_in_Source": lexeme,
-                            "Number": str(new_number)
+                            "Name": concept.english,
+                            "Gloss_in_Source": concept.attributes["gloss_in_source"],
+                            "Concepticon_ID": concept.concepticon_id,
+                            "Concepticon_Gloss": concept.concepticon_gloss,
+                            "Number": concept.number,
+                            "Alias": concept.attributes["alias"],
+                            "Domain": concept.attributes["domain"],
+                            "Definition": concept.attributes["definition"]
                             }
-                    concepts[str(new_number)] = idx
-                    concept_names[idx] = concepts_to_add[idx]["Name"]
-                    new_number += 1
-                else:
-                    unify_concepts[lexeme] = row["NUMBER"]
-
-        for concept in self.conceptlists[0].concepts.values():
-            if not concept.english.startswith("*"):
-                idx = concept.number + "_" + slug(concept.english)
-                cid, cgl = c2i.get(concept.english, ("", ""))
-
-                concepts_to_add[idx] = {
-                        "ID": idx,
-                        "Name": concept.english,
-                        "Gloss_in_Source": concept.attributes["gloss_in_source"],
-                        "Concepticon_ID": concept.concepticon_id,
-                        "Concepticon_Gloss": concept.concepticon_gloss,
-                        "Number": concept.number,
-                        "Alias": concept.attributes["alias"],
-                        "Domain": concept.attributes["domain"],
-                        "Definition": concept.attributes["definition"]
-                        }
-                concepts[concept.number] = idx
-                concept_names[idx] = concept.english
-                unify_concepts[concept.english] = concept.number
+                    concepts[concept.number] = idx
+                    concept_names[idx] = concept.english
+                    unify_concepts[concept.english] = concept.number
+            phase.count("concepts", len(concepts_to_add))
+            phase.count("names", len(unify_concepts))
+
+        # statistics of directed (targets) and undirected (links) concept pairs
+        targets = PairTable()
+        links = PairTable(
+                concepts=targets.concepts, families=targets.families,
+                shifts=targets.shifts, lexemes=targets.lexemes)
 
         # load languages
-        languages = args.writer.add_languages(lookup_factory="Name")
-        lang2fam = {}
-        for language in self.languages:
-            lang2fam[language["Name"]] = language["Family"]
-
-        language_data = defaultdict(list)
-
-        # load individual semantic shifts
-        shifts = self.raw_dir.read_csv("lexemes.tsv", delimiter="\t",
-                                       dicts=True)
-        targets = {
-                concept["ID"]: defaultdict(
-                    lambda : {
-                        "Polysemy_Lexemes": [],
-                        "Derivation_Lexemes": [],
-                        "Polysemy_Shifts": [],
-                        "Derivation_Shifts": [],
-                        "Polysemy_Families": [],
-                        "Derivation_Families": [],
-                        "Polysemy": 0,
-                        "Derivation": 0,
-                        }) for concept in concepts_to_add.values()}
-        links = {
-                concept["ID"]: defaultdict(
-                    lambda : {
-                        "Polysemy_Lexemes": [],
-                        "Derivation_Lexemes": [],
-                        "Polysemy_Shifts": [],
-                        "Derivation_Shifts": [],
-                        "Polysemy_Families": [],
-                        "Derivation_Families": [],
-                        "Polysemy": 0,
-                        "Derivation": 0}) for concept in concepts_to_add.values()}
-
-        
+        with report.phase("languages") as phase:
+            languages = args.writer.add_languages(lookup_factory="Name")
+            lang2fam, families = {}, {}
+            for language in self.languages:
+                lang2fam[language["Name"]] = targets.families(language["Family"])
+                families[language["Name"]] = language["Family"]
+            phase.count("languages", len(languages))
+
         args.log.info("unified concepts from {0} to {1}".format(len(concepts_to_add), len(set(unify_concepts.values()))))
-        lexeme_data, lexeme_graph = {}, {}
-
-        for row in shifts:
-            source_concept, target_concept = (
-                concepts[unify_concepts[row["Source_Concept"]]],
-                concepts[unify_concepts[row["Target_Concept"]]])
-            
-            source_id = (
-                    source_concept, 
-                    row["Source_Language_ID"],
-                    row["Source_Word"])
-            target_id = (
-                    target_concept,
-                    row["Target_Language_ID"],
-                    row["Target_Word"])
-            source_lexeme = (
-                    1, row["ID"], source_concept, row["Source_Language_ID"],
-                    row["Source_Word"], row["Source_Meaning"], row["Shift_ID"],
-                    row["Type"])
-            target_lexeme = (
-                    2, row["ID"], target_concept, row["Target_Language_ID"],
-                    row["Target_Word"], row["Target_Meaning"], row["Shift_ID"],
-                    row["Type"], )
-            
-
-            if row["Type"] in ["Polysemy", "Derivation"]:
-                if row["Direction"] == "→":
-                    pass
-                elif row["Direction"] == "←":
-                    source_id, target_id = target_id, source_id
-                    source_lexeme, target_lexeme = target_lexeme, source_lexeme
-
-                if source_id not in lexeme_graph:
-                    lexeme_graph[source_id] = []
-                
-                lexeme_graph[source_id] += [(target_id, row["Type"])]
-                if source_id not in lexeme_data:
-                    lexeme_data[source_id] = []
-                if target_id not in lexeme_data:
-                    lexeme_data[target_id] = []
-                
-                lexeme_data[source_id] += [source_lexeme]
-                lexeme_data[target_id] += [target_lexeme]
-            
-            if row["Direction"] == "→":
-                if row["Type"] in ["Polysemy", "Derivation"]:
-                    targets[source_concept][
-                            target_concept][row["Type"]+"_Lexemes"] += [row["ID"]]
-                    targets[source_concept][
-                            target_concept][row["Type"]] += 1
-                    targets[source_concept][
-                            target_concept][row["Type"]+"_Shifts"] += [row["Shift_ID"]]
-                    targets[source_concept][
-                            target_concept][row["Type"]+"_Families"] += [lang2fam[row["Source_Language"]]]
-
-
-            if row["Direction"] == "←":
-                if row["Type"] in ["Polysemy", "Derivation"]:
-                    targets[target_concept][
-                            source_concept][row["Type"]+"_Lexemes"] += [row["ID"]]
-                    targets[target_concept][
-                            source_concept][row["Type"]] += 1
-                    targets[target_concept][
-                            source_concept][row["Type"]+"_Shifts"] += [row["Shift_ID"]]
-                    targets[target_concept][
-                            source_concept][row["Type"]+"_Families"] += [lang2fam[row["Source_Language"]]]
-            if row["Direction"] in ["?", "-", "—"]:
-                if row["Type"] in ["Polysemy", "Derivation"]:
-                    links[target_concept][
-                            source_concept][row["Type"]+"_Lexemes"] += [row["ID"]]
-                    links[target_concept][
-                            source_concept][row["Type"]] += 1
-                    links[source_concept][
-                            target_concept][row["Type"]+"_Lexemes"] += [row["ID"]]
-                    links[source_concept][
-                            target_concept][row["Type"]] += 1
-                    links[target_concept][
-                            source_concept][row["Type"]+"_Shifts"] += [row["Shift_ID"]]
-                    links[source_concept][
-                            target_concept][row["Type"]+"_Shifts"] += [row["Shift_ID"]]
-                    links[source_concept][
-                            target_concept][row["Type"]+"_Families"] += [lang2fam[row["Source_Language"]]]
-                    links[target_concept][
-                            source_concept][row["Type"]+"_Families"] += [lang2fam[row["Source_Language"]]]
 
-        args.log.info("assembled concepts")
-        for k, concept in pb(
-                sorted(concepts_to_add.items(),
-                       key=lambda x: x[0]), 
-                desc="adding concepts"
-                ):
-            target_list = []
-            link_list = []
-            for target_id, values in targets[concept["ID"]].items():
-                target_list += [
-                        {"ID": target_id, "NAME": concept_names[target_id], 
-                         "Polysemy": values.get("Polysemy", 0),
-                         "Derivation": values.get("Derivation", 0),
-                         "PolysemyByFamily": len(set(values.get("Polysemy_Families"))),
-                         "DerivationByFamily": len(set(
-                             values.get("Derivation_Families"))),
-                         "Polysemy_Lexemes": values.get("Polysemy_Lexemes", []),
-                         "Derivation_Lexemes": values.get("Derivation_Lexemes", []),
-                         "Polysemy_Shifts": values.get("Polysemy_Shifts", []),
-                         "Derivation_Shifts": values.get("Derivation_Shifts", []),
-                         "Polysemy_Families": values.get("Polysemy_Families", []),
-                         "Derivation_Families": values.get("Derivation_Families")
-                         }
-                        ]
-            for target_id, values in links[concept["ID"]].items():
-                link_list += [
-                        {"ID": target_id, "NAME": concept_names[target_id],
-                         "Polysemy": values.get("Polysemy", 0),
-                         "Derivation": values.get("Derivation", 0),
-                         "PolysemyByFamily": len(set(values.get("Polysemy_Families"))),
-                         "DerivationByFamily": len(set(
-                             values.get("Derivation_Families"))),
-                         "Polysemy_Lexemes": values.get("Polysemy_Lexemes", 0),
-                         "Derivation_Lexemes": values.get("Derivation_Lexemes", 0),
-                         "Polysemy_Shifts": values.get("Polysemy_Shifts", []),
-                         "Derivation_Shifts": values.get("Derivation_Shifts", []),
-                         "Polysemy_Families": values.get("Polysemy_Families", []),
-                         "Derivation_Families": values.get("Derivation_Families")
-                         }]
-
-                
-            concept["Target_Concepts"] = target_list
-            concept["Linked_Concepts"] = link_list
-            args.writer.add_concept(**concept)
-        
-        visited = set()
-        node2id = {}
-        idx = 1
-        source_nodes = set()
-        lexemes_to_add = {}
-        for source_node, target_nodes in pb(lexeme_graph.items()):
-            if source_node not in node2id:
-                node2id[source_node] = idx
-                idx += 1
-            sidx = node2id[source_node]
-            source_nodes.add(source_node)
-            for target_node, relation in target_nodes:
-                if target_node not in node2id:
-                    node2id[target_node] = idx
-                    idx += 1
-                tidx = node2id[target_node]
-                # write target nodes first
-
-                d = lexeme_data[target_node]
-                if target_node not in visited:
-                    concepts = [x[5] for x in d]
-                    shifts = [x[6] for x in d]
-                    types = [x[7] for x in d]
-                    ids = [x[1] for x in d]
-                    visited.add(target_node)
-                    lexemes_to_add[tidx] = dict(
-                                Language_ID=d[0][3],
-                                Parameter_ID=d[0][2],
-                                Local_ID=tidx,
-                                Value=unescape(d[0][4]),
-                                Form=unescape(d[0][4]),
-                                Concepts_in_Source=concepts,
-                                IDS_in_Source=ids,
-                                Shifts=shifts,
-                                Shift_Types=types,
-                                Source_Lexemes=[sidx],
-                                Source_Relations=[relation],
-                                Source="DatSemShift"
-                                )
+        # load individual semantic shifts of type Polysemy and Derivation
+        with report.phase("read-lexemes") as phase:
+            records = [
+                (row,
+                 concepts[unify_concepts[row.source_concept]],
+                 concepts[unify_concepts[row.target_concept]],
+                 families.get(row.source_language))
+                for row in read_lexemes(self.raw_dir / "lexemes.tsv")]
+            phase.count("rows", len(records))
+
+        # in incremental mode, only concepts and forms affected by changes are rebuilt
+        snapshot, affected = None, None
+        if INCREMENTAL:
+            with report.phase("load-snapshot") as phase:
+                key = snapshot_key(__file__, etc_dir=self.etc_dir)
+                snapshot = Snapshot.load(self.raw_dir / SNAPSHOT, key)
+                if snapshot:
+                    affected = snapshot.affected_concepts(records, concepts_to_add)
+                changed = self.raw_dir / CHANGED_CONCEPTS
+                if affected is not None and changed.exists():
+                    # concepts of the differences between two builds, by number or ID
+                    for concept in changed.read_text(encoding="utf-8").split():
+                        affected.add(concepts.get(concept, concept))
+                if affected is not None:
+                    phase.count("affected concepts", len(affected))
+            if affected is None:
+                args.log.info("no snapshot of the last run, rebuilding everything")
+            else:
+                args.log.info("rebuilding {0} concepts affected by changes".format(len(affected)))
+            update = Snapshot(
+                    key, records={record[0].id: Snapshot.record(record) for record in records})
+
+        with report.phase("graph-build") as phase:
+            lexemes = LexemeGraph()
+            for row, source_concept, target_concept, _ in records:
+                lexemes.add_row(row, source_concept, target_concept)
+            lexemes.freeze()
+            phase.count("lexemes", len(lexemes))
+
+        with report.phase("aggregate-pairs") as phase:
+            for row, source_concept, target_concept, _ in records:
+                # the consistency checks need the pairs of all concepts, as in a full rebuild
+                if affected is not None and not CONSISTENCY and not (
+                        source_concept in affected or target_concept in affected):
+                    continue
+                family = lang2fam[row.source_language]
+                if row.direction == FORWARD:
+                    targets.add(source_concept, target_concept, row.type, row.id,
+                                row.shift_id, family)
+                elif row.direction == BACKWARD:
+                    targets.add(target_concept, source_concept, row.type, row.id,
+                                row.shift_id, family)
+                elif row.direction == UNDIRECTED:
+                    links.add(target_concept, source_concept, row.type, row.id,
+                              row.shift_id, family)
+                    links.add(source_concept, target_concept, row.type, row.id,
+                              row.shift_id, family)
+                phase.count("rows")
 
+        args.log.info("assembled concepts")
+        args.writer.cldf.add_table(PAIR_TABLE, *PAIR_COLUMNS, primaryKey=["ID"])
+        for column in ["Source_ID", "Target_ID"]:
+            args.writer.cldf.add_foreign_key(PAIR_TABLE, column, "ParameterTable", "ID")
+        if not PAIR_JSON:
+            args.writer.cldf.remove_columns("ParameterTable", "Target_Concepts", "Linked_Concepts")
+        pairs = {}
+        with report.phase("concepts") as phase:
+            for k, concept in pb(
+                    sorted(concepts_to_add.items(),
+                           key=lambda x: x[0]), 
+                    desc="adding concepts"
+                    ):
+                cached = snapshot.concepts.get(k) if affected is not None else None
+                if cached and k not in affected:
+                    args.writer.objects["ParameterTable"].append(cached[2])
+                    pairs[k] = cached[3]
+                    phase.count("from snapshot")
                 else:
-                    #args.log.info("Lexeme {0} / {1} already in data.".format(
-                    #    target_node, source_node))
-                    lexemes_to_add[tidx]["Source_Lexemes"] += [sidx]
-                    lexemes_to_add[tidx]["Source_Relations"] += [relation]
-                    # update source lexemes and source relation
-        for source_node in source_nodes:
-            if source_node not in visited:
-                d = lexeme_data[source_node]
-                concepts = [x[5] for x in d]
-                shifts = [x[6] for x in d]
-                types = [x[7] for x in d]
-                ids = [x[1] for x in d]
-                lexemes_to_add[node2id[source_node]] = dict(
-                        Language_ID=d[0][3],
-                        Parameter_ID=d[0][2],
-                        Local_ID=node2id[source_node],
-                        Value=unescape(d[0][4]),
-                        Form=unescape(d[0][4]),
-                        Concepts_in_Source=concepts,
-                        IDS_in_Source=ids,
-                        Shifts=shifts,
-                        Shift_Types=types,
-                        Source_Lexemes=[],
-                        Source_Relations=[],
-                        Source="DatSemShift"
-                        )
-        for lidx, lexeme in sorted(
-                lexemes_to_add.items(),
-                key=lambda x: x[0]):
-            args.writer.add_form(**lexeme)
-
-
-
-                    
-
-
-
+                    cached = (concept["Name"], digest(concept))
+                    if PAIR_JSON:
+                        concept["Target_Concepts"] = targets.dump(concept["ID"], concept_names)
+                        concept["Linked_Concepts"] = links.dump(concept["ID"], concept_names)
+                    cached += (args.writer.add_concept(**concept), )
+                    # the rows of the pairs are created when written, unless kept in the snapshot
+                    pairs[k] = None
+                    if INCREMENTAL:
+                        pairs[k] = list(targets.rows(k)) + list(links.rows(k, directed=False))
+                    cached += (pairs[k], )
+                    phase.count("added")
+                if INCREMENTAL:
+                    update.concepts[k] = cached
+
+        # write the forms straight from the lexeme graph
+        with report.phase("forms") as phase:
+            for lexeme in pb(lexemes.forms(), desc="adding forms"):
+                lexeme["Value"] = lexeme["Form"] = unescape(lexeme["Form"])
+                lexeme["Source"] = "DatSemShift"
+                cached = snapshot.forms.get(lexeme["Local_ID"]) if snapshot else None
+                data = digest(lexeme) if INCREMENTAL else None
+                if cached and cached[0] == data:
+                    # the ID of a form depends on the forms of the same language and concept before
+                    form = cached[1]
+                    if form is not None:
+                        form_id = args.writer.lexeme_id(lexeme)
+                        if form_id != form["ID"]:
+                            form = dict(form, ID=form_id)
+                        args.writer.objects["FormTable"].append(form)
+                    phase.count("from snapshot")
+                else:
+                    form = args.writer.add_form(**lexeme)
+                    phase.count("added")
+                if INCREMENTAL:
+                    update.forms[lexeme["Local_ID"]] = (data, form)
+
+        if CONSISTENCY:
+            with report.phase("consistency") as phase:
+                issues = check_consistency(
+                        targets, links, lexemes, args.writer.objects["FormTable"])
+                for issue in issues:
+                    phase.count(issue.check)
+            for issue in issues:
+                args.log.warning("{0}: {1}: {2}".format(issue.check, issue.subject, issue.message))
+            errors = sum(1 for issue in issues if issue.level == ERROR)
+            if errors and CONSISTENCY == "fail":
+                raise ValueError("{0} inconsistencies in the concept pairs and forms".format(
+                    errors))
+
+        def pair_rows(events=True):
+            # like concepts, pairs are only written for concepts with forms
+            for k, rows in pairs.items():
+                if k in refs:
+                    if rows is None:
+                        rows = itertools.chain(
+                                targets.rows(k, events=events),
+                                links.rows(k, directed=False, events=events))
+                    for row in rows:
+                        if row["Target_ID"] in refs:
+                            yield row
+
+        # the pairs are streamed to the file when the writer writes the dataset
+        refs = {form["Parameter_ID"] for form in args.writer.objects["FormTable"]}
+        args.writer.objects[PAIR_TABLE] = report.iterate("pair-rows", pair_rows())
+
+        if MATRICES:
+            from datsemshift.graph import ShiftGraph
+
+            with report.phase("matrices"):
+                graph = ShiftGraph.from_pairs(
+                        [concepts_to_add[k] for k in sorted(concepts_to_add) if k in refs],
+                        pair_rows(events=False))
+                graph.save(self.dir / "matrices")
+            args.log.info("wrote matrices of {0} concepts to matrices/".format(len(graph)))
+
+        if INCREMENTAL:
+            with report.phase("save-snapshot"):
+                update.save(self.raw_dir / SNAPSHOT)
+                self.raw_dir.joinpath(CHANGED_CONCEPTS).unlink(missing_ok=True)
+        # the dataset is written when cmd_makecldf returns, see _cmd_makecldf
+        self.built = time.perf_counter(), time.process_time()
+
+    def _cmd_makecldf(self, args):
+        super()._cmd_makecldf(args)
+        # writing includes streaming the pairs and reading the dataset back
+        self.report.add("write", *self.built)
+        # the report is complete once the dataset is written and validated
+        self.report.save(self.dir / REPORT)
+        args.log.info("wrote report of the phases to {0}".format(REPORT))
@@ -1,7 +1,13 @@
 from pyconcepticon import Concepticon
-from pysem import to_concepticon
 from csvw.dsv import UnicodeDictReader, UnicodeWriter
 
+from datsemshift.mapping import MappingCache, map_glosses
+
+# glosses are mapped in one batch, or in chunks by WORKERS processes, and the
+# mappings are kept in CACHE, so that only new glosses are mapped again
+WORKERS = 1
+CACHE = "concepts-mapped.sqlite"
+
 with UnicodeDictReader("../etc/concepts.tsv", delimiter="\t") as reader:
     data = [row for row in reader]
 concepticon = Concepticon()
@@ -10,6 +16,11 @@ dss2 = {c.english: (c.concepticon_id, c.concepticon_gloss) for c in
         concepticon.conceptlists["Zalizniak-2020-2590"].concepts.values()}
 
 
+unmatched = [row["ENGLISH"] for row in data if row["ENGLISH"] not in dss2]
+with MappingCache(CACHE) as cache:
+    mapped = map_glosses(unmatched, cache=cache, workers=WORKERS)
+    print("mapped {0} glosses, {1} from the cache".format(cache.misses, cache.hits))
+
 table = [[
     "NUMBER",
     "ENGLISH",
@@ -27,7 +38,7 @@ for row in data:
         cid, cgl = dss2[row["ENGLISH"]]
         val = "100"
     else:
-        mappings = to_concepticon([{"gloss": row["ENGLISH"]}])[row["ENGLISH"]]
+        mappings = mapped.get(row["ENGLISH"])
         if mappings:
             cid, cgl = mappings[0][0], mappings[0][1]
             val = str(mappings[0][3])
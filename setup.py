@@ -1,4 +1,4 @@
-from setuptools import setup
+from setuptools import setup, find_packages
 import json
 
 with open("metadata.json", encoding="utf-8") as fp:
@@ -7,6 +7,7 @@ with open("metadata.json", encoding="utf-8") as fp:
 setup(
     name='lexibank_datsemshift',
     py_modules=['lexibank_datsemshift'],
+    packages=find_packages(include=['datsemshift', 'datsemshift.*']),
     include_package_data=True,
     url=metadata.get("url",""),
     zip_safe=False,
@@ -14,6 +15,9 @@ setup(
         'lexibank.dataset': [
             'datsemshift=lexibank_datsemshift:Dataset',
         ],
+        'cldfbench.commands': [
+            'datsemshift=datsemshift.commands',
+        ],
     },
     install_requires=[
         "pylexibank>=3.0.0"
@@ -22,5 +26,16 @@ setup(
         'test': [
             'pytest-cldf',
         ],
+        'graph': [
+            'numpy',
+            'scipy',
+        ],
+        'columnar': [
+            'pyarrow',
+        ],
+        'mapping': [
+            'pyconcepticon',
+            'pysem',
+        ],
     },
 )
@@ -1,3 +1,749 @@
+import json
+import sqlite3
+import hashlib
+import threading
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+from csvw.dsv import UnicodeWriter
+
+from datsemshift.fetch import Fetcher
+from datsemshift.manifest import Manifest
+from datsemshift.parse import parse_shift_page, parse_shift_files, parse_shift_file
+from datsemshift.parse import parse_language_file, parse_concept_file
+from datsemshift.cache import ParseCache
+from datsemshift.archive import ARCHIVE, ArchiveStore, DirectoryStore, convert, open_store
+from datsemshift.aggregate import PairTable
+from datsemshift.lexemes import LexemeGraph, LexemeRow, read_lexemes, FORWARD, BACKWARD, UNDIRECTED
+from datsemshift.incremental import Snapshot, digest, snapshot_key
+from datsemshift.database import export
+from datsemshift.synthetic import generate
+from datsemshift.instrument import Report
+from datsemshift.normalize import refine_gloss, unescape, unescape_row
+
+
 def test_valid(cldf_dataset, cldf_logger):
-    assert cldf_dataset.validate(log=cldf_logger)
+    import os
+    from datsemshift.validate import validate
+
+    assert validate(
+        cldf_dataset.directory / cldf_dataset.filename, log=cldf_logger, workers=os.cpu_count() or 1)
+
+
+@contextlib.contextmanager
+def serve(pages, flaky=False):
+    """
+    Serve a dictionary of pages on a local HTTP server, failing every request
+    once with a transient error if `flaky` is set.
+    """
+    failed = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in pages:
+                self.send_error(404)
+                return
+            if flaky and self.path not in failed:
+                failed.add(self.path)
+                self.send_error(503)
+                return
+            content = pages[self.path].encode("utf-8")
+            etag = '"{0}"'.format(hashlib.md5(content).hexdigest())
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield "http://127.0.0.1:{0}".format(server.server_port)
+    finally:
+        server.shutdown()
+
+
+def shift_pages(n):
+    return {"/shift{0}".format(str(i).rjust(4, "0")):
+            '<div class="shift__header">{0}</div>'.format(i) for i in range(1, n + 1)}
+
+
+def test_fetcher(tmp_path):
+    with serve(shift_pages(29), flaky=True) as url:
+        fetcher = Fetcher(workers=4, per_host=2, rate=0, backoff=0.01)
+        errors = fetcher.download(
+                [(url + "/shift{0}".format(str(i).rjust(4, "0")),
+                  tmp_path / "shift{0}.html".format(str(i).rjust(4, "0")))
+                 for i in range(1, 31)])
+    assert [job[0] for job, _ in errors] == [url + "/shift0030"]
+    assert errors[0][1].status == 404
+    assert len(list(tmp_path.glob("shift*.html"))) == 29
+    assert (tmp_path / "shift0007.html").read_text() == \
+        '<div class="shift__header">7</div>'
+
+
+def test_manifest(tmp_path):
+    pages = shift_pages(10)
+    fetcher = Fetcher(workers=4, rate=0, backoff=0.01)
+    with serve(pages) as url:
+        jobs = [(url + page, page[1:] + ".html") for page in sorted(pages)]
+        changes = Manifest(tmp_path).refresh(fetcher, jobs)
+        assert len(changes["new"]) == 10
+
+        # an interrupted refresh is resumed from the journal
+        manifest = Manifest(tmp_path)
+        for job in jobs[:4]:
+            manifest.fetch(fetcher, *job)
+        (tmp_path / "shift0002.html").write_text("modified")
+        pages["/shift0007"] = "changed upstream"
+        del pages["/shift0005"]
+        changes = Manifest(tmp_path).refresh(fetcher, jobs)
+    assert changes == {"new": [], "changed": ["shift0007"], "gone": ["shift0005"]}
+    assert not (tmp_path / "shift0005.html").exists()
+    # shift0002 was completed before the interruption and is not fetched again
+    assert (tmp_path / "shift0002.html").read_text() == "modified"
+    assert not (tmp_path / "manifest-partial.tsv").exists()
+    assert "shift0007\tshift0007.html\tchanged" in \
+        (tmp_path / "changes.tsv").read_text()
+
+
+SHIFT_PAGE = """<div class="shift__header">
+<span class="shift__header_item"> bitter </span>
+<span class="shift__header_item">→</span>
+<span class="shift__header_item">beautiful</span>
+<span class="realization_number">2 realizations</span></div>
+<table class="realization__table" id="r1">
+<tr><th colspan="3"><span class="status">accepted</span> Realization 1</th></tr>
+<tr><td colspan="2">Type</td><td> Polysemy </td></tr>
+<tr><td colspan="2">Language</td><td>Russian</td></tr>
+<tr><td colspan="2">Lexeme</td><td>gor'kij</td></tr>
+<tr><td>Meaning 1</td><td>bitter</td><td></td></tr>
+<tr><td>Meaning 2</td><td>beautiful</td><td></td></tr>
+<tr><td>Direction</td><td>→</td><td></td></tr>
+</table>
+<table class="realization__table" id="r2">
+<tr><th colspan="3">Realization 2</th></tr>
+<tr><td colspan="2">Type</td><td>Derivation</td></tr>
+<tr><td colspan="2">Language 1</td><td>German</td></tr>
+<tr><td colspan="2">Language 2</td><td>Old &amp; Norse</td></tr>
+<tr><td colspan="2">Lexeme 1</td><td>bitter</td></tr>
+<tr><td colspan="2">Lexeme 2</td><td>bitr</td></tr>
+<tr><td>Meaning 1</td><td>bitter</td><td></td></tr>
+<tr><td>Meaning 2</td><td>fine</td><td></td></tr>
+</table>"""
+
+
+def test_parse_shift_page():
+    shift = parse_shift_page(SHIFT_PAGE, "shift0001")
+    assert (shift.source, shift.direction, shift.target, shift.realizations_count) == \
+        ("bitter", "→", "beautiful", "2")
+    first, second = shift.realizations
+    assert (first.status, first.title, first.type, first.direction) == \
+        ("accepted", "1", "Polysemy", "→")
+    assert first.meanings == [("Meaning 1", "bitter"), ("Meaning 2", "beautiful")]
+    assert (second.status, second.title, second.direction) == ("", "Realization 2", "?")
+    assert second.languages == [("Language 1", "German"), ("Language 2", "Old &amp; Norse")]
+    assert (first.matches, second.matches) == (6, 7)
+    assert parse_shift_page("<html></html>", "shift0002") is None
+
+
+def test_parse_shift_files(tmp_path):
+    store = ArchiveStore(tmp_path / "pages.sqlite")
+    for i in range(1, 6):
+        store.write("shift{0}.html".format(str(i).rjust(4, "0")),
+                    SHIFT_PAGE.replace("bitter", "bitter {0}".format(i)).encode("utf-8"))
+    names = store.names("shift*.html")
+    serial = list(parse_shift_files(store, names))
+    assert [shift.source for shift in serial] == ["bitter {0}".format(i) for i in range(1, 6)]
+    assert list(parse_shift_files(store, names, workers=2, chunksize=2)) == serial
+
+
+def test_parse_cache(tmp_path):
+    store, names = DirectoryStore(tmp_path), ["shift1.html", "shift2.html", "shift3.html"]
+    for name in names:
+        store.write(name, SHIFT_PAGE.encode("utf-8"))
+    with ParseCache(tmp_path / "parsed.sqlite") as cache:
+        first = list(cache.parse(parse_shift_file, store, names))
+    store.write(names[1], SHIFT_PAGE.replace("bitter", "sour").encode("utf-8"))
+    with ParseCache(tmp_path / "parsed.sqlite") as cache:
+        second = list(cache.parse(parse_shift_file, store, names))
+        assert (cache.hits, cache.misses) == (2, 1)
+    assert second[0] == first[0] and second[1].source == "sour"
+    with ParseCache(tmp_path / "parsed.sqlite", version=-1) as cache:
+        list(cache.parse(parse_shift_file, store, names))
+        assert cache.misses == 3
+
+
+def test_archive(tmp_path):
+    directory = DirectoryStore(tmp_path)
+    for name in ["languages.html", "datsemshift-data/shift0001.html",
+                 "datsemshift-data/shift0002.html"]:
+        directory.write(name, name.encode("utf-8"))
+    archive = ArchiveStore(tmp_path / ARCHIVE)
+    assert convert(directory, archive, remove=True) == 3
+    assert not directory.names("datsemshift-data/*.html")
+    assert isinstance(open_store(tmp_path), ArchiveStore)
+    assert archive.names("*.html") == ["languages.html"]
+    assert archive.read("datsemshift-data/shift0002.html") == b"datsemshift-data/shift0002.html"
+    assert [name for name, _ in archive.items("datsemshift-data/*")] == [
+        "datsemshift-data/shift0001.html", "datsemshift-data/shift0002.html"]
+
+
+def test_synthetic(tmp_path):
+    store = DirectoryStore(tmp_path)
+    counts = generate(store, scale=0.01, seed=1)
+    assert (counts["concepts"], counts["languages"], counts["shifts"]) == (46, 17, 86)
+    names = store.names("datsemshift-data/shift*.html")
+    shifts = list(parse_shift_files(store, names))
+    assert len(shifts) == 86
+    assert sum(len(shift.realizations) for shift in shifts) == counts["realizations"]
+    assert all(int(shift.realizations_count) == len(shift.realizations) for shift in shifts)
+    concepts = {
+        row[0] for name in store.names("datsemshift-concepts/*.html")
+        for row in parse_concept_file(store, name)}
+    languages = {row[1] for row in parse_language_file(store, "languages.html")}
+    assert len(concepts) == 46 and len(languages) == 17
+    for shift in shifts:
+        assert {shift.source, shift.target} <= concepts
+        for realization in shift.realizations:
+            assert {language for _, language in realization.languages} <= languages
+            assert len(realization.meanings) == 2
+    # the corpus only depends on the seed
+    generate(DirectoryStore(tmp_path / "copy"), scale=0.01, seed=1)
+    assert store.read(names[-1]) == DirectoryStore(tmp_path / "copy").read(names[-1])
+
+
+def test_report(tmp_path):
+    report = Report("download", memory=True)
+    with report.phase("concepts") as phase:
+        rows = list(report.iterate("parse", [[1, 2], [3]]))
+        write = report.timed("write", lambda row: row)
+        for row in rows:
+            write(row)
+            phase.count("rows", len(row))
+    path = tmp_path / "report.json"
+    path.write_text(json.dumps({"makecldf": {}}), encoding="utf-8")
+    data = report.save(path)
+    assert list(data["phases"]) == ["concepts", "parse", "write"]
+    concepts = data["phases"]["concepts"]
+    assert concepts["counters"] == {"rows": 3} and concepts["peak_memory"] > 0
+    assert data["phases"]["parse"]["counters"] == {"items": 2}
+    assert data["phases"]["write"]["counters"] == {"calls": 2}
+    assert concepts["wall"] >= data["phases"]["write"]["wall"]
+    assert set(json.loads(path.read_text(encoding="utf-8"))) == {"makecldf", "download"}
+    with pytest.raises(ValueError):
+        Report("download", profile="gprof")
+
+
+def test_normalize():
+    assert refine_gloss("&lt;alcoholic drink&gt;") == "alcoholic drink"
+    assert refine_gloss("gor&#39;kijZQ") == "gor'kij"
+    assert unescape(refine_gloss("Old &amp; Norse &lt;x&gt;")) == "Old & Norse x"
+    # equal values share one object
+    assert refine_gloss("".join(["Rus", "sian"])) is refine_gloss("Russian")
+    assert unescape_row([1, "&lt;a&gt;"]) == [1, "<a>"]
+
+
+def test_pair_table():
+    table = PairTable()
+    ie, uralic = table.families("IE"), table.families("Uralic")
+    table.add("a", "b", 0, "1", "s1", ie)
+    table.add("a", "b", 0, "2", "s2", ie)
+    table.add("a", "b", 1, "3", "s2", uralic)
+    table.add("a", "c", 0, "4", "s3", uralic)
+    dump = table.dump("a", {"b": "B", "c": "C"})
+    assert [(d["ID"], d["NAME"], d["Polysemy"], d["Derivation"]) for d in dump] == [
+        ("b", "B", 2, 1), ("c", "C", 1, 0)]
+    assert dump[0]["PolysemyByFamily"] == 1 and dump[0]["Polysemy_Families"] == ["IE", "IE"]
+    assert dump[0]["Polysemy_Lexemes"] == ["1", "2"] and dump[0]["Derivation_Shifts"] == ["s2"]
+    assert table.dump("b", {}) == []
+    assert PairTable(families=table.families).families is table.families
+    rows = list(table.rows("a", directed=False))
+    assert [(r["ID"], r["Source_ID"], r["Target_ID"], r["Directed"]) for r in rows] == [
+        ("a-b-undirected", "a", "b", False), ("a-c-undirected", "a", "c", False)]
+    assert all(rows[0][k] == v for k, v in dump[0].items() if k not in ("ID", "NAME"))
+
+
+def test_lexeme_graph(tmp_path):
+    def row(id_, type_, direction, source, target):
+        return [id_, "s" + id_, type_, direction, source[0], target[0], "L", "l", "l",
+                source[1], target[1], "m" + id_, "n" + id_]
+    with UnicodeWriter(tmp_path / "lexemes.tsv", delimiter="\t") as writer:
+        writer.writerow([
+            "ID", "Shift_ID", "Type", "Direction", "Source_Concept", "Target_Concept",
+            "Source_Language", "Source_Language_ID", "Target_Language_ID", "Source_Word",
+            "Target_Word", "Source_Meaning", "Target_Meaning"])
+        writer.writerow(row("1", "Polysemy", "→", ("c", "x"), ("d", "x")))
+        writer.writerow(row("2", "Derivation", "←", ("e", "y"), ("d", "x")))
+        writer.writerow(row("3", "Cognates", "→", ("c", "x"), ("e", "z")))
+        writer.writerow(row("4", "Polysemy", "—", ("d", "x"), ("c", "x")))
+    rows = list(read_lexemes(tmp_path / "lexemes.tsv"))
+    assert [(r.id, r.type, r.direction) for r in rows] == [
+        ("1", 0, FORWARD), ("2", 1, BACKWARD), ("4", 0, UNDIRECTED)]
+    graph = LexemeGraph.from_rows(rows)
+    forms = list(graph.forms())
+    assert [(f["Local_ID"], f["Parameter_ID"], f["Form"]) for f in forms] == [
+        (1, "c", "x"), (2, "d", "x"), (3, "e", "y")]
+    assert forms[0]["Source_Lexemes"] == [2] and forms[0]["Source_Relations"] == ["Polysemy"]
+    assert forms[1]["Source_Lexemes"] == [1] and forms[1]["IDS_in_Source"] == ["1", "2", "4"]
+    assert forms[1]["Concepts_in_Source"] == ["n1", "n2", "m4"]
+    assert forms[2]["Source_Lexemes"] == [2] and forms[2]["Shift_Types"] == ["Derivation"]
+    assert list(graph.out_edges(1)) == [(2, "Derivation"), (0, "Polysemy")]
+
+
+def test_snapshot(tmp_path):
+    def record(id_, source, target, word="w"):
+        return (LexemeRow(id_, "s", source, target, "L", "l", "l", word, word, "m", "m", 0, FORWARD),
+                source, target, "IE")
+    records = [record("1", "a", "b"), record("2", "b", "c"), record("3", "d", "e")]
+    concepts = {c: {"ID": c, "Name": c.upper()} for c in "abcdef"}
+    links = {"a": ["b"], "b": ["c"], "c": [], "d": ["e"], "e": [], "f": ["a"]}
+    snapshot = Snapshot("key", records={r[0].id: Snapshot.record(r) for r in records})
+    for cid, data in concepts.items():
+        snapshot.concepts[cid] = (
+            data["Name"], digest(data), data, [{"Target_ID": t} for t in links[cid]])
+    snapshot.save(tmp_path / "snapshot.pickle")
+    assert Snapshot.load(tmp_path / "snapshot.pickle", "other") is None
+    snapshot = Snapshot.load(tmp_path / "snapshot.pickle", "key")
+
+    assert snapshot.affected_concepts(records, concepts) == set()
+    assert snapshot.affected_concepts(
+        [records[0], record("2", "b", "c", word="v"), records[2]], concepts) == {"b", "c"}
+    assert snapshot.affected_concepts(records[:2], concepts) == {"d", "e"}
+    assert snapshot.affected_concepts(records[::-1], concepts) is None
+    renamed = dict(concepts, a={"ID": "a", "Name": "Z"})
+    assert snapshot.affected_concepts(records, renamed) == {"a", "f"}
+
+    # the key changes with the files in etc/ from which the forms are created
+    etc = tmp_path / "etc"
+    etc.mkdir()
+    (etc / "languages.tsv").write_text("ID\n")
+    keys = [snapshot_key(etc_dir=etc)]
+    (etc / "orthography").mkdir()
+    (etc / "orthography" / "l.tsv").write_text("Grapheme\tIPA\n")
+    keys.append(snapshot_key(etc_dir=etc))
+    (etc / "segments.csv").write_text("SEGMENT,REPLACEMENT\n")
+    keys.append(snapshot_key(etc_dir=etc))
+    (etc / "languages.tsv").write_text("ID\nl\n")
+    assert len(set(keys)) == 3 and snapshot_key(etc_dir=etc) == keys[-1]
+
+
+def test_shift_graph(tmp_path):
+    pytest.importorskip("numpy")
+    pytest.importorskip("scipy")
+    from datsemshift.graph import ShiftGraph
+
+    def link(target, polysemy, derivation=0):
+        return {"ID": target, "Polysemy": polysemy, "Derivation": derivation,
+                "PolysemyByFamily": polysemy, "DerivationByFamily": derivation}
+    links = {
+        "a": ([link("b", 2), link("c", 0, 1)], [link("b", 3), link("c", 0, 1)]),
+        "b": ([link("a", 1), link("d", 4)], [link("a", 3), link("d", 4)]),
+        "c": ([], [link("a", 0, 1)]),
+        "d": ([], [link("b", 4)])}
+    with UnicodeWriter(tmp_path / "parameters.csv") as writer:
+        writer.writerow(
+            ["ID", "Name", "Concepticon_ID", "Concepticon_Gloss", "Target_Concepts",
+             "Linked_Concepts"])
+        for cid, (targets, linked) in links.items():
+            writer.writerow(
+                [cid, cid.upper(), "", "", json.dumps(targets), json.dumps(linked)])
+    graph = ShiftGraph.from_cldf(tmp_path / "parameters.csv")
+
+    assert len(graph) == 4
+    assert list(graph.out_degree()) == [2, 2, 0, 0]
+    assert list(graph.in_degree()) == [1, 1, 1, 1]
+    assert list(graph.out_degree("undirected", "Polysemy")) == [3, 7, 0, 4]
+    targets, weights = graph.neighbours("a", weight="Polysemy")
+    assert list(graph.ids[targets]) == ["b"] and list(weights) == [2]
+    targets, _ = graph.neighbours("a", incoming=True)
+    assert list(graph.ids[targets]) == ["b"]
+    assert list(graph.weights(graph.indices(["a", "b", "d"]), graph.indices(["b", "d", "b"]))) == [2, 4, 0]
+    assert list(graph.khop("a", k=1)) == [0, 1, 1, -1]
+    assert list(graph.khop("a", k=2)) == [0, 1, 1, 2]
+    assert list(graph.khop("d", k=3, incoming=True)) == [2, 1, -1, 0]
+    sources, targets, weights = graph.top_k(2)
+    assert [(graph.ids[s], graph.ids[t]) for s, t in zip(sources, targets)] == [
+        ("b", "d"), ("a", "b")]
+    assert list(weights) == [4, 2]
+    _, targets, _ = graph.top_k(5, weight="Derivation", concept="a")
+    assert list(graph.ids[targets]) == ["c"]
+    assert graph.matrix().toarray().sum() == 4
+    assert graph.related("b", kind="directed", weight="Polysemy") == [("d", 4), ("a", 3)]
+    assert graph.related("a", k=1) == [("b", 3)]
+
+    graph.save(tmp_path / "matrices")
+    loaded = ShiftGraph.load(tmp_path / "matrices")
+    assert list(loaded.ids) == list(graph.ids)
+    for kind in ["directed", "undirected"]:
+        for weight in [None, "Polysemy", "DerivationByFamily"]:
+            assert (loaded.matrix(kind, weight) != graph.matrix(kind, weight)).nnz == 0
+    pairs = [{"Source_ID": "a", "Target_ID": "b", "Directed": True, "Polysemy": 1,
+              "Derivation": 0, "PolysemyByFamily": 1, "DerivationByFamily": 0}]
+    graph = ShiftGraph.from_pairs([{"ID": "a"}, {"ID": "b"}], pairs)
+    assert list(graph.out_degree()) == [1, 0] and list(graph.names) == ["", ""]
+
+
+def test_database(tmp_path):
+    def table(component, url, *columns):
+        return {
+            "dc:conformsTo": "http://cldf.clld.org/v1.0/terms.rdf#" + component,
+            "url": url,
+            "tableSchema": {"columns": [
+                dict(name=name, propertyUrl="http://cldf.clld.org/v1.0/terms.rdf#" + term)
+                if term else dict(name=name, datatype=datatype or "string")
+                for name, term, datatype in columns]}}
+    metadata = {"tables": [
+        table("FormTable", "forms.csv",
+              ("ID", "id", None), ("Local_ID", None, None),
+              ("Language_ID", "languageReference", None),
+              ("Parameter_ID", "parameterReference", None), ("Form", "form", None),
+              ("Source_Lexemes", None, None), ("Source_Relations", None, None),
+              ("Shifts", None, None), ("Concepts_in_Source", None, None),
+              ("Shift_Types", None, None), ("IDS_in_Source", None, None)),
+        table("LanguageTable", "languages.csv",
+              ("ID", "id", None), ("Glottocode", "glottocode", None),
+              ("Words", None, "integer"))]}
+    (tmp_path / "cldf-metadata.json").write_text(json.dumps(metadata), encoding="utf-8")
+    with UnicodeWriter(tmp_path / "forms.csv") as writer:
+        writer.writerows([
+            ["ID", "Local_ID", "Language_ID", "Parameter_ID", "Form", "Source_Lexemes",
+             "Source_Relations", "Shifts", "Concepts_in_Source", "Shift_Types",
+             "IDS_in_Source"],
+            ["l-a-1", "1", "l", "a", "x", "", "", "s1 s2", "m a // n a", "Polysemy Derivation",
+             "1 2"],
+            ["l-b-1", "2", "l", "b", "x", "1", "Polysemy", "s1", "m b", "Polysemy", "1"],
+            ["l-c-1", "3", "l", "c", "y", "1 2", "Derivation Polysemy", "s2", "n c",
+             "Derivation", "2"]])
+    with UnicodeWriter(tmp_path / "languages.csv") as writer:
+        writer.writerows([["ID", "Glottocode", "Words"], ["l", "abcd1234", "3"]])
+
+    counts = export(tmp_path / "cldf-metadata.json", tmp_path / "dss.sqlite")
+    assert counts == {
+        "FormTable": 3, "LanguageTable": 1, "FormTable_Source_Lexemes": 3,
+        "FormTable_Shifts": 4}
+    db = sqlite3.connect(str(tmp_path / "dss.sqlite"))
+    assert db.execute("SELECT Words FROM LanguageTable WHERE cldf_glottocode = 'abcd1234'"
+                      ).fetchall() == [(3,)]
+    assert db.execute(
+        "SELECT f.cldf_parameterReference, l.Relation FROM FormTable_Source_Lexemes AS l "
+        "JOIN FormTable AS f ON f.cldf_id = l.Form_ID WHERE l.Source_Form_ID = 'l-a-1' "
+        "ORDER BY f.Local_ID").fetchall() == [("b", "Polysemy"), ("c", "Derivation")]
+    assert db.execute(
+        "SELECT Shift_ID, Shift_Type, Concept_in_Source, IDS_in_Source FROM FormTable_Shifts "
+        "WHERE Form_ID = 'l-a-1' ORDER BY Position").fetchall() == [
+        ("s1", "Polysemy", "m a", "1"), ("s2", "Derivation", "n a", "2")]
+    db.close()
+
+
+def test_columnar(tmp_path):
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+    from datsemshift.columnar import export as export_columnar
+
+    columns = {
+        "FormTable": [
+            {"name": "ID"}, {"name": "Local_ID"}, {"name": "Language_ID"},
+            {"name": "Parameter_ID"}, {"name": "Source_Lexemes", "separator": " "},
+            {"name": "Shift_Types", "separator": " "}],
+        "LanguageTable": [{"name": "ID"}, {"name": "Family"}, {
+            "name": "Words", "datatype": "integer"}],
+        "ParameterTable": [
+            {"name": "ID"}, {"name": "Target_Concepts", "datatype": "json"},
+            {"name": "Linked_Concepts", "datatype": "json"}]}
+    urls = {"FormTable": "forms.csv", "LanguageTable": "languages.csv",
+            "ParameterTable": "parameters.csv"}
+    (tmp_path / "cldf-metadata.json").write_text(json.dumps({"tables": [
+        {"dc:conformsTo": "http://cldf.clld.org/v1.0/terms.rdf#" + name, "url": urls[name],
+         "tableSchema": {"columns": cols}} for name, cols in columns.items()]}))
+    pair = {"ID": "b", "NAME": "B", "Polysemy": 1, "Derivation": 0, "PolysemyByFamily": 1,
+            "DerivationByFamily": 0, "Polysemy_Lexemes": ["1"], "Derivation_Lexemes": [],
+            "Polysemy_Shifts": ["shift1"], "Derivation_Shifts": [],
+            "Polysemy_Families": ["Uralic"], "Derivation_Families": []}
+    rows = {
+        "FormTable": [["ID", "Local_ID", "Language_ID", "Parameter_ID", "Source_Lexemes",
+                       "Shift_Types"],
+                      ["l-a", "1", "l", "a", "", "Polysemy"],
+                      ["l-b", "2", "l", "b", "1", "Polysemy"]],
+        "LanguageTable": [["ID", "Family", "Words"], ["l", "Uralic", "2"]],
+        "ParameterTable": [["ID", "Target_Concepts", "Linked_Concepts"],
+                           ["a", json.dumps([pair]), json.dumps([pair])],
+                           ["b", "[]", json.dumps([dict(pair, ID="a", NAME="A")])]]}
+    for name, table in rows.items():
+        with UnicodeWriter(tmp_path / urls[name]) as writer:
+            writer.writerows(table)
+
+    counts = export_columnar(tmp_path / "cldf-metadata.json", tmp_path / "out")
+    assert counts == {"languages": 1, "parameters": 2, "concept_pairs": 3, "forms": 2}
+    forms = pq.read_table(tmp_path / "out" / "forms.parquet").to_pydict()
+    assert forms["Local_ID"] == [1, 2]
+    assert forms["Source_Lexemes"] == [[], [1]]
+    assert forms["Family"] == ["Uralic", "Uralic"]
+    assert "Target_Concepts" not in pq.read_schema(tmp_path / "out" / "parameters.parquet").names
+    pairs = pq.read_table(
+        tmp_path / "out" / "concept_pairs.parquet", filters=[("Directed", "=", False)])
+    assert pairs.column("Source_ID").to_pylist() == ["a", "b"]
+    assert pairs.column("Polysemy_Families").to_pylist() == [["Uralic"], ["Uralic"]]
+
+
+def test_mapping(tmp_path):
+    pytest.importorskip("pysem")
+    from datsemshift.mapping import MappingCache, map_glosses
+
+    with MappingCache(tmp_path / "mapped.sqlite") as cache:
+        first = map_glosses(["hand", "mouth", "hand", ""], cache=cache)
+        assert (cache.hits, cache.misses) == (0, 2)
+    assert set(first) == {"hand", "mouth"} and first["hand"][0][1] == "HAND"
+    with MappingCache(tmp_path / "mapped.sqlite") as cache:
+        second = map_glosses(["mouth", "hand", "tooth"], cache=cache, workers=2, chunksize=1)
+        assert (cache.hits, cache.misses) == (2, 1)
+    assert second["hand"] == first["hand"] and second["tooth"][0][1] == "TOOTH"
+    with MappingCache(tmp_path / "mapped.sqlite", version="other") as cache:
+        map_glosses(["hand"], cache=cache)
+        assert cache.misses == 1
+
+
+def test_service(tmp_path):
+    import asyncio
+    from datsemshift.service import Index, Service
+
+    def table(url, component=None):
+        out = {"url": url, "tableSchema": {"columns": []}}
+        if component:
+            out["dc:conformsTo"] = "http://cldf.clld.org/v1.0/terms.rdf#" + component
+        return out
+    metadata = {"tables": [
+        table("parameters.csv", "ParameterTable"), table("languages.csv", "LanguageTable"),
+        table("forms.csv", "FormTable"), table("concept_pairs.csv")]}
+    (tmp_path / "cldf-metadata.json").write_text(json.dumps(metadata), encoding="utf-8")
+    for name, rows in [
+            ("parameters.csv", [["ID", "Name"], ["a", "A"], ["b", "B"], ["c", "C"]]),
+            ("languages.csv", [["ID", "Name", "Family"], ["l", "L", "F"], ["m", "M", "F"]]),
+            ("forms.csv", [
+                ["ID", "Local_ID", "Language_ID", "Parameter_ID", "Form", "Source_Lexemes",
+                 "Source_Relations", "Shifts", "Shift_Types"],
+                ["l-a-1", "1", "l", "a", "x", "", "", "s1 s2", "Polysemy Derivation"],
+                ["l-b-1", "2", "l", "b", "x", "1", "Polysemy", "s1", "Polysemy"],
+                ["m-c-1", "3", "m", "c", "y", "2", "Derivation", "s2", "Derivation"]]),
+            ("concept_pairs.csv", [
+                ["Source_ID", "Target_ID", "Directed", "Polysemy", "Derivation",
+                 "PolysemyByFamily", "DerivationByFamily", "Polysemy_Shifts",
+                 "Derivation_Shifts"],
+                ["a", "b", "false", "1", "0", "1", "0", "s1", ""],
+                ["a", "c", "true", "0", "2", "0", "1", "", "s2 s3"]])]:
+        with UnicodeWriter(tmp_path / name) as writer:
+            writer.writerows(rows)
+
+    service = Service(Index(tmp_path / "cldf-metadata.json"), cache_size=2)
+    status, body = service.query("/concepts/a/shifts?weight=Derivation&k=1")
+    assert status == 200 and json.loads(body)["shifts"] == [dict(
+        ID="c", Name="C", Directed=True, Polysemy=0, Derivation=2, PolysemyByFamily=0,
+        DerivationByFamily=1, Shifts=["s2", "s3"])]
+    assert service.query("/concepts/a/shifts?weight=Derivation&k=1")[1] is body
+    assert (service.cache.hits, service.cache.misses) == (1, 1)
+    shifts = json.loads(service.query("/families/F/shifts?concept=c")[1])["shifts"]
+    assert shifts == [{"Shift_ID": "s2", "Forms": [dict(
+        ID="m-c-1", Language_ID="m", Parameter_ID="c", Form="y", Shift_Type="Derivation")]}]
+    chain = json.loads(service.query("/forms/m-c-1/chain")[1])["chain"]
+    assert [(form["ID"], form["Depth"], form["Link"]) for form in chain] == [
+        ("l-b-1", 1, "m-c-1"), ("l-a-1", 2, "l-b-1")]
+    chain = json.loads(service.query("/forms/l-a-1/chain?direction=derived&depth=1")[1])
+    assert [form["ID"] for form in chain["chain"]] == ["l-b-1"]
+    assert service.query("/languages/x/shifts")[0] == 404
+    assert service.query("/concepts/a/shifts?kind=some")[0] == 400
+    assert service.query("/concepts/a/shifts?concept=b")[0] == 400
+    assert service.query("/concepts/a/shifts?k=-1")[0] == 400
+    assert service.query("/concepts/a/shifts?k=x")[0] == 400
+    assert service.query("/forms/m-c-1/chain?depth=-1")[0] == 400
+    assert len(service.cache) == 2
+
+    async def get(target):
+        server = await service.start(port=0)
+        reader, writer = await asyncio.open_connection(
+            "127.0.0.1", server.sockets[0].getsockname()[1])
+        writer.write("GET {0} HTTP/1.1\r\nConnection: close\r\n\r\n".format(target).encode())
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response
+    response = asyncio.run(get("/languages/l/shifts"))
+    assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert json.loads(response.split(b"\r\n\r\n")[1])["language"]["Name"] == "L"
+    # unexpected errors, like a form missing from the index, are answered with 500
+    del service.index.forms["l-b-1"]
+    response = asyncio.run(get("/forms/m-c-1/chain?depth=2"))
+    assert response.startswith(b"HTTP/1.1 500 Internal Server Error\r\n")
+
+
+def test_chains():
+    from datsemshift.chains import ChainIndex
+
+    # a -> b -> c -> a in language l, b -> d in language m (of another family),
+    # with a -> b listed twice as by two realizations
+    index = ChainIndex(
+        ["l-a", "l-b", "l-c", "m-d"], ["a", "b", "c", "d"], ["l", "l", "l", "m"],
+        ["x", "y", "z", "w"], {"l": "F", "m": "G"},
+        [(0, 1, 0), (1, 2, 1), (2, 0, 0), (1, 3, 0), (0, 1, 0)])
+
+    def chains(*args, **kw):
+        return [[index.ids[node] for node in nodes] for nodes, _ in index.chains(*args, **kw)]
+    assert chains(["a"], hops=2) == [["l-a", "l-b"], ["l-a", "l-b", "l-c"], ["l-a", "l-b", "m-d"]]
+    assert chains(["a"], ["c", "d"], hops=3) == [["l-a", "l-b", "l-c"], ["l-a", "l-b", "m-d"]]
+    assert chains(["a"], ["c"], hops=1) == []
+    assert chains(None, ["a"], hops=2) == [["l-c", "l-a"], ["l-b", "l-c", "l-a"]]
+    assert chains(["b"], hops=3, relations=["Polysemy"]) == [["l-b", "m-d"]]
+    assert chains(["a"], ["d"], within="family") == []
+    assert chains(["a"], hops=3, languages=["l"]) == [["l-a", "l-b"], ["l-a", "l-b", "l-c"]]
+    assert chains(["c"], ["d"], families=["F", "G"]) == [["l-c", "l-a", "l-b", "m-d"]]
+    nodes, types = next(index.chains(["a"], ["c"]))
+    assert index.row(nodes, types) == [2, "l-a l-b l-c", "a b c", "l l l", "x // y // z",
+                                       "Polysemy Derivation"]
+    with pytest.raises(ValueError):
+        list(index.chains(["a"], relations=["Borrowing"]))
+
+
+def test_diff(tmp_path):
+    import os
+    import sys
+    import subprocess
+    from datsemshift.diff import Build, diff
+
+    header = ["ID", "Shift_ID", "Realization", "Source_Concept_ID", "Target_Concept_ID",
+              "Target_Word"]
+    builds = {
+        "old": [["1", "shift1", "Realization 1", "1", "2", "a"],
+                ["2", "shift1", "Realization 2", "1", "2", "b"],
+                ["3", "shift2", "Realization 1", "3", "4", "c"]],
+        # a realization inserted before the others, one changed and one removed
+        "new": [["1", "shift1", "Realization 3", "1", "2", "d"],
+                ["2", "shift1", "Realization 1", "1", "2", "a"],
+                ["3", "shift1", "Realization 2", "1", "2", "e"]]}
+    for name, rows in builds.items():
+        (tmp_path / name / "raw").mkdir(parents=True)
+        with UnicodeWriter(tmp_path / name / "raw" / "lexemes.tsv", delimiter="\t") as writer:
+            writer.writerows([header] + rows)
+    changelog = diff(Build(tmp_path / "old"), Build(tmp_path / "new"))
+    assert list(changelog["tables"]) == ["raw/lexemes.tsv"]
+    assert changelog["tables"]["raw/lexemes.tsv"] == {
+        "rows": [3, 3], "added": ["shift1:3"], "removed": ["shift2:1"],
+        "changed": {"shift1:2": {"Target_Word": ["b", "e"]}}}
+    assert changelog["concepts"] == ["1", "2", "3", "4"]
+
+    # the old build as a git revision
+    def git(*args):
+        subprocess.run(["git"] + list(args), cwd=str(tmp_path / "old"), check=True,
+                       capture_output=True)
+    git("init")
+    git("add", "raw/lexemes.tsv")
+    git("-c", "user.name=test", "-c", "user.email=test@example.org", "commit", "-m", "old")
+    assert diff(Build("HEAD", repository=tmp_path / "old"), Build(tmp_path / "new")) == dict(
+        changelog, old="HEAD")
+
+    # the fingerprints of a build do not depend on the run of Python
+    script = (
+        "import sys; from datsemshift.diff import fingerprint; "
+        "print(sorted(fingerprint(open(sys.argv[1], encoding='utf-8'), '\\t', ['ID']).items()))")
+    assert len({subprocess.run(
+        [sys.executable, "-c", script, str(tmp_path / "new" / "raw" / "lexemes.tsv")],
+        env=dict(os.environ, PYTHONHASHSEED=seed), check=True, capture_output=True).stdout
+        for seed in ["1", "2"]}) == 1
+
+
+def test_validate(tmp_path, caplog):
+    import re
+    import logging
+    from pycldf import Wordlist
+    from datsemshift.validate import validate
+
+    ds = Wordlist.in_dir(tmp_path)
+    ds.add_component("LanguageTable")
+    ds.add_component("ParameterTable")
+    ds.add_columns("FormTable", {"name": "Loan", "datatype": "boolean"})
+    ds.write(
+        LanguageTable=[dict(ID="l"), dict(ID="m"), dict(ID="n", Latitude=10)],
+        ParameterTable=[dict(ID="a"), dict(ID="b")],
+        FormTable=[dict(
+            ID="f{0}".format(i), Language_ID="lm"[i % 2], Parameter_ID="ab"[i % 2],
+            Form="x", Comment="x\ny" if i % 3 else "x") for i in range(20)])
+    # a dangling foreign key, a duplicate ID, an invalid boolean and an invalid
+    # latitude, with line breaks in quoted values before them
+    for name, old, new in [
+            ("forms.csv", "f4,l,a", "f4,k,a"),
+            ("forms.csv", "f6,l,a", "f4,l,a"),
+            ("forms.csv", "f7,m,b,x,,\"x\ny\",,", "f7,m,b,x,,\"x\ny\",,maybe"),
+            ("languages.csv", "10", "100")]:
+        path = tmp_path / name
+        text = path.read_text(encoding="utf-8")
+        assert old in text
+        path.write_text(text.replace(old, new), encoding="utf-8")
+
+    def messages(func):
+        caplog.clear()
+        with caplog.at_level(logging.INFO):
+            valid = func(logging.getLogger("validate"))
+        # dangling foreign keys are reported by a row validator, with the column
+        return valid, {
+            re.sub(r"^(.*/)?([^/]+:\d+)(:\w+)? (Key .*)$", r"\2 \4", r.getMessage())
+            for r in caplog.records if r.levelno >= logging.WARNING}
+
+    valid, expected = messages(lambda log: Wordlist.from_metadata(
+        tmp_path / "Wordlist-metadata.json").validate(log=log))
+    # pycldf>=2 adds a summary of the failed check of the foreign keys
+    expected -= {"Referential integrity check failed"}
+    assert not valid and "forms.csv:9 Key `k` not found in table languages.csv" in expected
+    for workers in [1, 2]:
+        assert messages(lambda log: validate(
+            tmp_path / "Wordlist-metadata.json", log=log, workers=workers)) == (False, expected)
+
+    # a missing required column is logged and the other tables are checked
+    path = tmp_path / "forms.csv"
+    path.write_text(path.read_text(encoding="utf-8").replace(",Form,", ",Spelling,", 1))
+    valid, found = messages(lambda log: validate(tmp_path / "Wordlist-metadata.json", log=log))
+    assert not valid and any("Latitude" in message for message in found)
+    assert any("Form" in message and "forms.csv:" not in message for message in found)
+
+
+def test_consistency():
+    from datsemshift.consistency import ERROR, WARNING, check
+
+    targets = PairTable()
+    links = PairTable(
+        concepts=targets.concepts, families=targets.families, shifts=targets.shifts,
+        lexemes=targets.lexemes)
+    family = targets.families("Uralic")
+    targets.add("a", "b", 0, "1", "s1", family)
+    targets.add("c", "c", 1, "2", "s2", family)
+    for source, target in [("a", "c"), ("c", "a")]:
+        links.add(source, target, 0, "3", "s3", family)
+    lexemes = LexemeGraph()
+    lexemes.add(("a", "l", "x"), ("b", "l", "y"), 0, "1", "s1", "a", "b")
+    lexemes.freeze()
+    forms = [
+        dict(ID="f1", Local_ID=1, Parameter_ID="a", Source_Lexemes=[],
+             IDS_in_Source=["1", "3"], Shift_Types=["Polysemy", "Polysemy"]),
+        dict(ID="f2", Local_ID=2, Parameter_ID="b", Source_Lexemes=[1],
+             IDS_in_Source=["1"], Shift_Types=["Polysemy"]),
+        dict(ID="f3", Local_ID=3, Parameter_ID="c", Source_Lexemes=[],
+             IDS_in_Source=["2", "2", "3"], Shift_Types=["Derivation", "Derivation", "Polysemy"])]
+    assert check(targets, links, lexemes, forms) == [(
+        "self-loops", WARNING, "c / c", "Derivation 1")]
 
+    # a count out of step with the reverse pair, a missing reverse pair with a
+    # lexeme not in the forms, a lexeme realized twice and a dangling form
+    links.counts[0] += 1
+    links.add("b", "c", 1, "4", "s4", family)
+    targets.add("b", "a", 0, "1", "s1", family)
+    forms[1]["Source_Lexemes"] = [1, 4]
+    issues = check(targets, links, lexemes, forms)
+    assert [(issue.check, issue.subject) for issue in issues if issue.level == ERROR] == [
+        ("symmetry", "a / c"), ("symmetry", "b / c"), ("realizations", "b / c"),
+        ("realizations", "lexeme 1"), ("dangling-references", "form f2")]